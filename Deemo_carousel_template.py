@@ -7,7 +7,6 @@ from linebot.v3.messaging import (
 )
 
 import get_https_url
-from validators import conversation_validator
 
 def reply_with_deemo_carousel(line_bot_api, reply_token, user_id):
     """
@@ -67,5 +66,3 @@ def reply_with_deemo_carousel(line_bot_api, reply_token, user_id):
             messages =[carousel_message]
         )
     )
-    # 改成帶入 user_id
-    conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
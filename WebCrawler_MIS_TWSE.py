@@ -1,123 +1,378 @@
-def webcrawler(stock_symbol):
-    """傳入股票代號回傳資料表"""
-    # 設定目標股票的代號
-    stock_symbol
-
-    # 引入requests庫
-    import requests
-    # 定義API的URL
-    url = 'https://mis.twse.com.tw/stock/api/getStockInfo.jsp?ex_ch=tse_' + str(stock_symbol) + '.tw'
-    # 發送GET請求
-    res = requests.get(url)
-    res
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# 行程共用的 HTTP 用戶端（連線池、逾時、重試與斷路器）
+import http_client
+
+# 證交所交易日曆（決定報價快取秒數）
+import twse_calendar
+
+# 解析成數字的報價資料結構
+import quote_model
+
+# 載入 .env 檔案中的環境變數（報價快取與批次查詢設定）
+load_dotenv()
+
+
+# 證交所即時報價 API
+MIS_URL = 'https://mis.twse.com.tw/stock/api/getStockInfo.jsp'
+
+# 英文代號對應的中文欄位名稱（依序即為資料表的欄位順序）
+FIELD_NAMES = {
+    'a': '五檔賣價(從低到高，以_分隔資料)',
+    'b': '五檔買價(從高到低，以_分隔資料)',
+    'c': '股票代號',
+    'd': '最近交易日(YYYYMMDD)',
+    'f': '五檔賣量(從低到高，以_分隔資料)',
+    'g': '五檔買量(從高到低，以_分隔資料)',
+    'ot': '最近成交時刻(HH:MM:SS)',
+    'o': '開盤',
+    'h': '最高',
+    'l': '最低',
+    'n': '公司簡稱',
+    'ex': '上市或上櫃 (tse / otc)',
+    't': '撮合時間',
+    'u': '漲停價',
+    'v': '累積成交量',
+    'w': '跌停價',
+    'nf': '公司全名',
+    'y': '昨收價',
+    'tv': '當盤成交量',
+    'z': '當盤成交價'
+}
+
+
+class QuoteCache:
+    """以股票代號為鍵的報價快取，負責以下功能：
+    - 快取秒數依證交所交易時段決定：盤中只快取幾秒，收盤後快取到下一次開盤（休市日也不重新抓取）
+    - 盤中報價剛過期時先回傳舊報價，同時在背景重新抓取 (stale-while-revalidate)，
+      熱門股票不論多少人查詢，每個快取週期只向證交所請求一次
+    - 查無此股票的結果也短暫快取（固定 not_found_ttl 秒），避免重複查詢無效代號
+    - 同一檔股票同時有多個請求時只送出一次，其他請求等待結果
+    """
+
+    def __init__(self, ttl_func, stale_window=30, max_entries=1000, not_found_ttl=30):
+        """
+        Args:
+            ttl_func (callable): 回傳目前報價快取秒數的函式
+            stale_window (float): 過期後仍可先回傳舊報價的秒數
+            max_entries (int): 最多快取幾檔股票，超過時移除最舊的
+            not_found_ttl (float): 查無此股票的快取秒數（證交所偶爾回傳空結果，不跟著收盤後的快取秒數等到下一次開盤）
+        """
+        self.ttl_func = ttl_func
+        self.stale_window = stale_window
+        self.max_entries = max_entries
+        self.not_found_ttl = not_found_ttl
+        self._quotes = {}        # key: 股票代號, value: (取得時間, 過期時間, 報價 dict 或 None)
+        self._lock = threading.Lock()
+        self._symbol_locks = {}  # 每檔股票各自的鎖，避免同時重複請求同一檔
+        self._refreshing = set() # 背景重新抓取中的股票代號
+        self._counters = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'upstream_requests': 0,
+            'background_refreshes': 0,
+            'not_found': 0,
+        }
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._symbol_locks.setdefault(symbol, threading.Lock())
+
+    def _lookup(self, symbol, now):
+        """查詢快取（呼叫端需持有鎖），回傳 ('fresh' | 'stale' | None, 報價)"""
+        entry = self._quotes.get(symbol)
+        if entry is None:
+            return None, None
+        _, expires_at, quote = entry
+        if now < expires_at:
+            return 'fresh', quote
+        if quote is not None and now < expires_at + self.stale_window:
+            return 'stale', quote
+        return None, None
+
+    def _refresh(self, symbol, loader):
+        """背景重新抓取報價"""
+        try:
+            self.put(symbol, loader(symbol))
+        except Exception as e:
+            # 抓取失敗時保留舊報價，過了可容忍的秒數後由下一個請求同步重新抓取
+            print("背景更新報價失敗：", e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(symbol)
+
+    def get(self, symbol, loader):
+        """取得報價，快取不存在或已過期時呼叫 loader(symbol) 重新抓取
+
+        Returns:
+            dict: 報價資料，查無此股票時為 None
+        """
+        with self._lock:
+            state, quote = self._lookup(symbol, time.time())
+            if state == 'fresh':
+                self._counters['hits'] += 1
+                return quote
+            if state == 'stale':
+                # 先回傳舊報價，同一檔股票同時只有一個背景更新
+                self._counters['stale_hits'] += 1
+                if symbol not in self._refreshing:
+                    self._refreshing.add(symbol)
+                    self._counters['background_refreshes'] += 1
+                    self._counters['upstream_requests'] += 1
+                    threading.Thread(target=self._refresh, args=(symbol, loader), daemon=True).start()
+                return quote
+
+        with self._symbol_lock(symbol):
+            # 等待鎖的期間可能已經由其他請求抓取完成
+            with self._lock:
+                state, quote = self._lookup(symbol, time.time())
+                if state == 'fresh':
+                    self._counters['hits'] += 1
+                    return quote
+                self._counters['misses'] += 1
+                self._counters['upstream_requests'] += 1
+
+            quote = loader(symbol)
+
+            self.put(symbol, quote)
+            return quote
+
+    def peek(self, symbol):
+        """只讀取快取中仍有效的報價，不請求證交所
+
+        Returns:
+            tuple: (是否命中, 報價 dict 或 None)
+        """
+        with self._lock:
+            state, quote = self._lookup(symbol, time.time())
+            if state == 'fresh':
+                self._counters['hits'] += 1
+                return True, quote
+            return False, None
+
+    def put(self, symbol, quote):
+        """寫入報價，過期時間依目前的交易時段決定（查無此股票時只快取 not_found_ttl 秒）"""
+        now = time.time()
+        expires_at = now + (self.ttl_func() if quote is not None else self.not_found_ttl)
+        with self._lock:
+            if quote is None:
+                self._counters['not_found'] += 1
+            self._quotes[symbol] = (now, expires_at, quote)
+            if len(self._quotes) > self.max_entries:
+                oldest = min(self._quotes, key=lambda key: self._quotes[key][0])
+                self._quotes.pop(oldest)
+                self._symbol_locks.pop(oldest, None)
+
+    def count_batch(self, misses, requests):
+        """記錄批次查詢的未命中股票數與實際送出的請求數（一次請求涵蓋多檔股票）"""
+        with self._lock:
+            self._counters['misses'] += misses
+            self._counters['upstream_requests'] += requests
+
+    def invalidate(self, symbol=None):
+        """移除指定股票的快取，不指定則清空全部"""
+        with self._lock:
+            if symbol is None:
+                self._quotes.clear()
+            else:
+                self._quotes.pop(symbol, None)
+
+    def stats(self):
+        """回傳快取統計數據"""
+        with self._lock:
+            return {**self._counters, 'entries': len(self._quotes), 'refreshing': len(self._refreshing)}
+
+
+# 實例化行程共用的報價快取（快取秒數依證交所交易時段決定）
+quote_cache = QuoteCache(
+    ttl_func=twse_calendar.twse_calendar.quote_ttl,
+    stale_window=float(os.getenv('QUOTE_STALE_WINDOW', '30')),
+    not_found_ttl=float(os.getenv('QUOTE_NOT_FOUND_TTL', '30')),
+)
+
+# 批次查詢時每次請求最多帶幾個頻道（網址過長或頻道過多時證交所會回傳錯誤）
+MAX_CHANNELS_PER_REQUEST = int(os.getenv('MIS_MAX_CHANNELS_PER_REQUEST', '50'))
+
+
+def parse_symbol(stock_symbol):
+    """解析股票代號，回傳 (代號, 市場)
+
+    支援 '2330'、'2330.TW'、'6488.TWO'、'tse_2330'、'otc_6488' 等格式，
+    市場為 'tse'（上市）、'otc'（上櫃）或 None（未指定，上市上櫃都查）
+    """
+    symbol = str(stock_symbol).strip()
+    lower = symbol.lower()
+    if lower.startswith(('tse_', 'otc_')):
+        return symbol[4:].split('.')[0], lower[:3]
+    if lower.endswith('.two'):
+        return symbol[:-4], 'otc'
+    if lower.endswith('.tw'):
+        return symbol[:-3], 'tse'
+    return symbol, None
+
+
+def _channels(code, market):
+    """股票代號對應的 MIS 頻道，沒有指定市場時上市、上櫃都查（只有存在的那個會有回應）"""
+    markets = [market] if market else ['tse', 'otc']
+    return [f'{ex}_{code}.tw' for ex in markets]
+
+
+def _request_channels(channels):
+    """一次請求多個頻道，回傳 {(代號, 市場): 報價}"""
+    # 定義API的URL，多個頻道以 | 分隔
+    url = MIS_URL + '?ex_ch=' + '|'.join(channels)
+    # 發送GET請求（共用保持連線的 session，含逾時與重試）
+    res = http_client.http_client.get(url)
+    res.raise_for_status()
 
     # 用json解析出資料
     import json
-
     jsondata = json.loads(res.text)
-    jsondata
-
-    # 提取股票相關資訊
-    jsondata['msgArray']
 
+    quotes = {}
+    for quote in jsondata.get('msgArray') or []:
+        if quote.get('c'):
+            quotes[(quote['c'], quote.get('ex'))] = quote
+    return quotes
+
+
+def _find_quote(quotes, code, market):
+    """從批次結果中找出指定股票的報價"""
+    for ex in ([market] if market else ['tse', 'otc']):
+        if (code, ex) in quotes:
+            return quotes[(code, ex)]
+    return None
+
+
+def _request_quote(stock_symbol):
+    """向證交所請求單一股票的即時報價，查無此股票時回傳 None"""
+    code, market = parse_symbol(stock_symbol)
+
+    # 股票代號為4~6碼英數字（個股4碼、ETF 可能為5~6碼），其他格式不送出請求
+    if not (code.isalnum() and 4 <= len(code) <= 6):
+        return None
+    return _find_quote(_request_channels(_channels(code, market)), code, market)
+
+
+def fetch_quotes(stock_symbols):
+    """批次取得多檔股票的即時報價（上市、上櫃皆可）
+
+    快取中仍有效的報價直接使用，其餘股票的頻道依 MAX_CHANNELS_PER_REQUEST 分段，
+    每段只送出一次請求，取得的報價也寫回快取供單檔查詢共用。
+
+    Args:
+        stock_symbols (list): 股票代號，例如 ['2330', '6488.TWO', 'otc_8069']
+
+    Returns:
+        dict: {股票代號: 報價 dict}，查無報價的股票不會出現在結果中
+    """
+    results = {}
+    pending = {}  # key: 股票代號, value: (代號, 市場)
+    for stock_symbol in dict.fromkeys(str(symbol) for symbol in stock_symbols):
+        hit, quote = quote_cache.peek(stock_symbol)
+        if hit:
+            if quote is not None:
+                results[stock_symbol] = quote
+        else:
+            pending[stock_symbol] = parse_symbol(stock_symbol)
+
+    # 依序攤平成頻道清單，再切成每段不超過上限的請求
+    channels = list(dict.fromkeys(
+        channel for code, market in pending.values() for channel in _channels(code, market)
+    ))
+    chunks = [channels[start:start + MAX_CHANNELS_PER_REQUEST] for start in range(0, len(channels), MAX_CHANNELS_PER_REQUEST)]
+    quote_cache.count_batch(len(pending), len(chunks))
+
+    quotes = {}
+    failed_channels = set()
+    for chunk in chunks:
+        try:
+            quotes.update(_request_channels(chunk))
+        except Exception as e:
+            # 單一段請求失敗不影響其他段，失敗的股票不寫入快取，下次再重新查詢
+            print("批次查詢報價失敗：", e)
+            failed_channels.update(chunk)
+
+    for stock_symbol, (code, market) in pending.items():
+        quote = _find_quote(quotes, code, market)
+        # 上市、上櫃頻道可能分在不同段：其他段有回應時照常使用，
+        # 都沒有回應且有頻道請求失敗時無法確定查無此股票，不寫入快取
+        if quote is None and failed_channels.intersection(_channels(code, market)):
+            continue
+        quote_cache.put(stock_symbol, quote)
+        if quote is not None:
+            results[stock_symbol] = quote
+    return results
+
+
+def fetch_quote(stock_symbol):
+    """傳入股票代號回傳即時報價（共用短效快取，同一檔股票短時間內只請求一次）
+
+    Args:
+        stock_symbol (str): 股票代號，例如 '2330'
+
+    Returns:
+        dict: 證交所回傳的原始報價欄位（a, b, c, z...），查無此股票或證交所沒有回應時為 None
+    """
+    try:
+        return quote_cache.get(str(stock_symbol), _request_quote)
+    except Exception as e:
+        # 連線失敗不寫入快取，下次再重新查詢
+        print("查詢報價失敗：", e)
+        return None
+
+
+def fetch_quote_record(stock_symbol):
+    """傳入股票代號回傳解析成數字的 Quote 物件（單檔查詢與回覆文字用），查無此股票時回傳 None"""
+    quote = fetch_quote(stock_symbol)
+    if quote is None:
+        return None
+    return quote_model.Quote.from_mis(quote)
+
+
+def quote_to_dataframe(quote):
+    """把報價轉換成中文欄位、以股票代號為索引的資料表（大量資料分析用，單檔回覆請用 fetch_quote_record）"""
     # 引入pandas庫
     import pandas as pd
-    # 將JSON數據轉換為DataFrame
-    df = pd.DataFrame(jsondata['msgArray'])
+    # 將JSON數據轉換為DataFrame（複製一份，不修改快取中的報價）
+    df = pd.DataFrame([dict(quote)])
     # 將空字符串替換為'0'
     df.replace('', '0', inplace=True) # inplace=True 不建立新的對象，直接對原始對象進行修改
 
-    # 顯示DataFrame
-    df
-
-    # 用直的觀察DataFrame
-    # print(df.T)
-
     # 選取有價值的代號
-    df = pd.DataFrame(df, columns=['a','b','c','d','f','g','ot','o','h','l','n','ex','t','u','v','w','nf','y','tv','z'])
-    df
+    df = pd.DataFrame(df, columns=list(FIELD_NAMES))
 
     # 將英文代號轉換成中文
-    df = df.rename(columns={
-                'a': '五檔賣價(從低到高，以_分隔資料)',
-                'b': '五檔買價(從高到低，以_分隔資料)',
-                'c': '股票代號',
-                'd': '最近交易日(YYYYMMDD)',
-                'f': '五檔賣量(從低到高，以_分隔資料)',
-                'g': '五檔買量(從高到低，以_分隔資料)',
-                'ot': '最近成交時刻(HH:MM:SS)',
-                'o': '開盤',
-                'h': '最高',
-                'l': '最低',
-                'n': '公司簡稱',
-                'ex': '上市或上櫃 (tse / otc)',
-                't': '撮合時間',
-                'u': '漲停價',
-                'v': '累積成交量',
-                'w': '跌停價',
-                'nf': '公司全名',
-                'y': '昨收價',
-                'tv': '當盤成交量',
-                'z': '當盤成交價'
-                        })
-    # print(df.T)
+    df = df.rename(columns=FIELD_NAMES)
 
     # 將股票代號設為索引
     df.set_index("股票代號" , inplace=True)
 
-    # print(df.T)
-
     # 轉換類型為string
     df = df.astype("string")
 
-    # 查看類型
-    df.dtypes
-
-
     # 如果沒有當盤成交價，就使用五檔買價的最高價
     if df['當盤成交價'].iloc[0] == '-' :
         # 抓取df['五檔買價(從高到低，以_分隔資料)']的第一個值，分割後取第一個
-        df['當盤成交價'] = df['五檔買價(從高到低，以_分隔資料)'][0].split('_')[0]
-
-    # 用直的觀察DataFrame
-    # print(df.T)
+        df['當盤成交價'] = df['五檔買價(從高到低，以_分隔資料)'].iloc[0].split('_')[0]
 
     # 回傳資料表
     return df
 
 
+def webcrawler(stock_symbol):
+    """傳入股票代號回傳中文欄位的字串資料表，查無此股票時回傳 None"""
+    quote = fetch_quote(stock_symbol)
+    if quote is None:
+        return None
+    return quote_to_dataframe(quote)
 
 
 def webcrawler_true(stock_symbol):
     """傳入股票代號，回傳是否有抓到資料"""
-
-    # 設定目標股票的代號
-    stock_symbol
-
-    # 引入requests庫
-    import requests
-    # 定義API的URL
-    url = 'https://mis.twse.com.tw/stock/api/getStockInfo.jsp?ex_ch=tse_' + str(stock_symbol) + '.tw'
-    # 發送GET請求
-    res = requests.get(url)
-    res
-
-    # 用json解析出資料
-    import json
-
-    jsondata = json.loads(res.text)
-    jsondata
-
-    # 提取股票相關資訊
-    jsondata['msgArray']
-
-    # 如果股票代號(c)的位置有數字，就判定為有抓到
-    if jsondata['msgArray'][0]['c'].isdigit() and len(jsondata['msgArray'][0]['c']) == 4:
-      return True
-    else:
-      return False
-
-
-
-
-
+    return fetch_quote(stock_symbol) is not None
@@ -5,7 +5,7 @@ import os
 from dotenv import load_dotenv
 
 # 引入 Flask 建立 Web 應用程式
-from flask import Flask, request, abort
+from flask import Flask, request, abort, jsonify
 
 # 引入 LINE Bot SDK v3 的相關元件
 from linebot.v3 import (
@@ -56,6 +56,9 @@ from linebot.v3.webhooks import (
 
 
 
+# 服務前預熱（最先載入，從這裡開始計算啟動到就緒的秒數）
+import warmup
+
 # 建立 Flask 應用程式實例
 app = Flask(__name__)
 
@@ -66,6 +69,17 @@ load_dotenv()
 configuration = Configuration(access_token=os.getenv('YOUR_CHANNEL_ACCESS_TOKEN'))  # 設定存取權杖
 handler = WebhookHandler(os.getenv('YOUR_CHANNEL_SECRET'))  # 設定 webhook handler 的密鑰
 
+# 引入 webhook 事件處理佇列、用戶事件通道、事件去重、用戶狀態儲存、延遲任務排程器與圖片網址模組
+import webhook_queue
+import event_lanes
+import event_dedup
+import user_state_store
+import scheduler
+import get_https_url
+
+# WEBHOOK_ASYNC=1 時 /callback 驗證簽名後立即回傳 200，事件交給背景 worker 處理
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', '0') == '1'
+
 
 @app.route("/callback", methods=['POST'])  # 定義接收 LINE Webhook 的 POST 請求路由
 def callback():
@@ -77,6 +91,22 @@ def callback():
     # 在 Flask 日誌中記錄請求內容(用於除錯)
     app.logger.info("Request body: " + body)
 
+    # 記下服務器根 URL，事件通道與背景 worker 產生圖片網址時使用
+    get_https_url.remember_url_root()
+
+    # 快速回應模式：只驗證簽名並排入佇列，不等事件處理完成
+    if WEBHOOK_ASYNC:
+        if not handler.parser.signature_validator.validate(body, signature):
+            app.logger.info("Invalid signature. Please check your channel access token/channel secret.")
+            abort(400)
+
+        def process():
+            handler.handle(body, signature)
+
+        if webhook_queue.webhook_queue.submit(process):
+            return 'OK'
+        # 佇列已滿時退回同步處理，不丟棄事件
+
     # 處理 Webhook 請求主體
     try:
         # 用 handler 驗證簽名並處理事件
@@ -90,209 +120,156 @@ def callback():
     return 'OK'
 
 
-# 載入個性和腳色
-import ai_character_settings
-adjective=ai_character_settings.AiCharacterSettings.adjective # AI的個性形容詞
-role=ai_character_settings.AiCharacterSettings.role           # AI的角色設定
-
-
-
-from validators  import allow_validator
-from validators  import training_validator
-from validators  import conversation_validator
-
-
-def set_states(user_id, fetch=False, chat=False, predict=False, train=False):
-    """集中管理指定用戶的所有狀態設置"""
-    allow_validator.allow_validator.enable_fetch_stock_data(user_id, fetch)
-    allow_validator.allow_validator.enable_ai_chat(user_id, chat)
-    allow_validator.allow_validator.enable_intelligent_prediction(user_id, predict)
-    training_validator.training_validator.mark_as_ready(user_id, train)
-
-def is_any_state_active(user_id):
-    """檢查指定用戶是否有任一主要狀態激活"""
-    return any([
-        allow_validator.allow_validator.is_allow_fetch_stock_data(user_id),
-        allow_validator.allow_validator.is_allow_ai_chat(user_id),
-        allow_validator.allow_validator.is_allow_intelligent_prediction(user_id)
-    ])
-
-
-
-# 防鎖死機制
-import threading
-
-# 用於管理每個用戶的計時器
-timers = {}
-
-def reset_conversation_after_delay(user_id, delay=60):
-    """
-    在 delay 秒後，將指定用戶的對話狀態重置為允許(True)。
-    若在倒數期間再次呼叫，會重置倒數時間。
-
-    參數：
-        user_id (str): 需要重置狀態的用戶ID
-        delay (int): 延遲秒數，預設60秒
-    """
-
-    def reset():
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
-        print(f"[Reset] 用戶 {user_id} 的對話狀態已經過 {delay} 秒，已被重置為允許。")
-        
-        # 計時器執行完畢，從字典移除
-        timers.pop(user_id, None)
-
-    # 如果已有計時器，先取消它
-    if user_id in timers:
-        timers[user_id].cancel()
-
-    # 建立新的計時器並啟動
-    timer = threading.Timer(delay, reset)
-    timers[user_id] = timer
-    timer.start()
+# 引入背景訓練任務佇列、資料庫連線池、本地歷史股價快取、模型登錄庫、即時報價爬蟲、對外 HTTP 用戶端、股票代號索引、盯盤輪詢器與訓練預測服務
+import training_job_queue
+import db_pool
+import stock_history_cache
+import model_registry
+import WebCrawler_MIS_TWSE
+import http_client
+import ticker_index
+import watchlist
+import quote_poller
+import prediction_service
+
+# 啟動時載入本地股票代號索引（之後驗證代號不需連線）
+ticker_index.ticker_index.load()
+
+# gunicorn --preload 時由 gunicorn.conf.py 設定，master 行程只載入模組與預熱，fork 前不啟動任何執行緒
+GUNICORN_PRELOAD = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+
+def schedule_maintenance():
+    """排入定期維護任務"""
+    # 定期移除閒置用戶的狀態（訓練數據、聊天歷史等），避免記憶體隨著用戶數無限成長
+    scheduler.scheduler.every('user_state_sweep', user_state_store.user_state_store.sweep_interval,
+                              user_state_store.user_state_store.sweep)
+
+
+def start_background_services():
+    """啟動排程器與盤中自選股輪詢器（gunicorn --preload 時由 post_fork 在每個 worker 中呼叫）"""
+    schedule_maintenance()
+
+    # 盤中自選股輪詢（多個 worker 或容器時以檔案鎖選出一個行程輪詢，不會重複推播；設為 0 可停用）
+    if os.getenv('WATCHLIST_POLLER_ENABLED', '1') == '1':
+        quote_poller.quote_poller.start()
+
+
+# 文字訊息路由表（指令與模式在啟動時登記）
+from handlers import message_router
+
+
+@app.route("/training_jobs/<job_id>", methods=['GET'])  # 查詢指定訓練任務的狀態
+def training_job_status(job_id):
+    job = training_job_queue.training_job_queue.get_job(job_id)
+    if job is None:
+        abort(404)
+    job.pop('user_id', None)  # 不對外公開用戶ID
+    return jsonify(job)
+
+
+@app.route("/ready", methods=['GET'])  # 就緒檢查：預熱完成前回傳 503，負載平衡器與部署流程據此判斷是否導入流量
+def ready():
+    stats = warmup.warmup.stats()
+    return jsonify(stats), (200 if stats['ready'] else 503)
+
+
+@app.route("/metrics", methods=['GET'])  # 回傳各子系統的統計數據
+def metrics():
+    return jsonify({
+        'training_jobs': training_job_queue.training_job_queue.stats(),
+        'db_pool': db_pool.db_pool.stats(),
+        'stock_history_cache': stock_history_cache.stock_history_cache.stats(),
+        'model_registry': model_registry.model_registry.stats(),
+        'quote_cache': WebCrawler_MIS_TWSE.quote_cache.stats(),
+        'http_client': http_client.http_client.stats(),
+        'ticker_index': ticker_index.ticker_index.stats(),
+        'watchlist': watchlist.watchlist_store.stats(),
+        'quote_poller': quote_poller.quote_poller.stats(),
+        'webhook_queue': webhook_queue.webhook_queue.stats(),
+        'event_lanes': event_lanes.event_lanes.stats(),
+        'event_dedup': event_dedup.event_dedup.stats(),
+        'user_state_store': user_state_store.user_state_store.stats(),
+        'scheduler': scheduler.scheduler.stats(),
+        'message_router': message_router.message_router.stats(),
+        'warmup': warmup.warmup.stats(),
+        'prediction_service': prediction_service.prediction_service.stats(),
+    })
+
+
+def reply_busy(event):
+    """用戶排隊中的訊息已滿時，請用戶稍等（同一波只回覆一次）"""
+    with ApiClient(configuration) as api_client:
+        line_bot_api = webhook_queue.ReplyFallbackMessagingApi(api_client, event)
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=event.reply_token,
+                messages=[TextMessage(text='上一則訊息還在處理中，請稍後再試喔！')]
+            )
+        )
 
 
 
 # 監聽所有文字訊息事件
 @handler.add(MessageEvent, message=TextMessageContent)
+@event_dedup.event_dedup  # LINE 重送的事件不重複處理
 def handle_message(event):
+    # 同一用戶的訊息依序處理，不同用戶的訊息平行處理
+    event_lanes.event_lanes.submit(
+        event.source.user_id,
+        lambda: process_message(event),
+        on_busy=lambda: reply_busy(event)
+    )
+
+
+@user_state_store.user_state_store.event_session  # 一個事件只讀寫一次用戶狀態
+def process_message(event):
     # 初始化 LINE Messaging API 客戶端
     with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
+        # 背景處理事件時 reply token 可能已過期，過期時自動改用 push
+        line_bot_api = webhook_queue.ReplyFallbackMessagingApi(api_client, event)
 
         text = event.message.text # 取得使用者輸入的文字內容
         user_id = event.source.user_id  # 取得用戶ID
 
+        # 查表交給對應的指令或模式處理
+        message_router.message_router.dispatch(
+            text=text,
+            line_bot_api=line_bot_api,
+            event=event,
+            user_id=user_id
+        )
+
+
 
-        # 如果有訊息未處理完，那就讓客戶稍等
-        if not conversation_validator.conversation_validator.is_allow_conversation(user_id):
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text='上一則訊息還在處理中，請稍後再試喔！')]
-                )
-            )
-            reset_conversation_after_delay(user_id=user_id, delay=60) # 在60秒後，將指定用戶的對話狀態重置為允許(True)
-            return
-
-    
-        # 如果目前沒有訊息未處理完，那就可以接受新訊息
-        if conversation_validator.conversation_validator.is_allow_conversation(user_id):
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, False)  # 如果接受了新訊息，就拒絕其他訊息
-
-
-            if text == 'Deemo':  # 當用戶輸入的訊息是「Deemo」時觸發
-                import Deemo_carousel_template  # 導入自定義的 Deemo_carousel_template 模組
-                Deemo_carousel_template.reply_with_deemo_carousel(
-                    line_bot_api,       # 傳入 LINE Bot API 實例，用於發送訊息
-                    event.reply_token,   # 傳入當前事件的回覆令牌，確保訊息回覆給正確用戶
-                    user_id=user_id
-                )
-                text = ""
-
-
-            if is_any_state_active(user_id) == False:  # 帶入 user_id
-                # 處理「股票查詢」指令
-                if text in ['1', '叔叔我要報', '叔叔我要抱']:
-                    # 回覆操作指引
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[TextMessage(text=f'{role}要給你報，請輸入股票代號，或按0退出')]
-                        )
-                    )
-                    text = ""
-                    conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)  # 允許接受新傳入對話
-                    
-                    # 狀態機設定，帶入 user_id
-                    set_states(user_id, fetch=True)
-
-                # 處理「聊天模式」指令    
-                elif text in ['2', '我要撩叔叔', '我要聊叔叔']:
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[TextMessage(text=f'{role}跟你聊，請輸入你要的聊的，或按0退出')]
-                        )
-                    )
-                    text = ""
-                    conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)  # 允許接受新傳入對話
-
-                    # 狀態機設定，帶入 user_id
-                    set_states(user_id, chat=True)
-
-                # 處理「股票分析」指令
-                elif text in ['3', '叔叔我要分析']:
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[TextMessage(text=f'{role}給你分析，請輸入你要詢問的股票代號，或按0退出')]
-                        )
-                    )
-                    text = ""
-                    conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)  # 允許接受新傳入對話
-
-                    # 狀態機設定，帶入 user_id
-                    set_states(user_id, predict=True)
-                
-                # 如果是無效字段，就繼續接受傳入對話
-                else :
-                    conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)  # 允許接受新傳入對話
-
-
-#===============================================================================================
-
-            # 檢查是否處於爬蟲模式（允許查詢股票資料的狀態），帶入 user_id
-            if allow_validator.allow_validator.is_allow_fetch_stock_data(user_id):
-
-                from handlers import fetch_stock_data_handler
-                fetch_stock_data_handler.fetch_stock_data_handler(
-                    text=text,
-                    line_bot_api=line_bot_api,
-                    event=event,
-                    user_id=user_id
-                )
-                
-            # 如果訪問叔叔AI（聊天模式）已經開啟則進入循環，帶入 user_id
-            if allow_validator.allow_validator.is_allow_ai_chat(user_id):
-                from handlers import ai_chat_handler
-                # google_ai_chat_function >> 用google的AI
-                # local_ai_chat_function >> 用本地的AI
-                # rag_ai_chat_function >> 智能聊天與網路檢索（RAG）整合主流程，但是api消耗較大，可以換成本地AI
-                ai_chat_handler.rag_ai_chat_function(  # 可替換為其他的方法(function)
-                    text=text,
-                    line_bot_api=line_bot_api,
-                    event=event,
-                    user_id=user_id
-                )
-
-
-            # 如果「智能預測模式」已開啟，帶入 user_id
-            if allow_validator.allow_validator.is_allow_intelligent_prediction(user_id):
-                from handlers import intelligent_prediction_handler
-                # ANN_OHLCV_output5_intelligent_prediction_function >> 輸入開高低收，5輸出
-                # ANN_OHLCV_output2_intelligent_prediction_function >> 輸入開高低收，2輸出
-                # ANN_3DayKbar_output5_intelligent_prediction_function >> 輸入3天k棒，5輸出
-                # ANN_3DayKbar_output2_intelligent_prediction_function >> 輸入3天k棒，2輸出  
-                #   
-                # 可替換為其他的方法(function)        
-                intelligent_prediction_handler.ANN_3DayKbar_output2_intelligent_prediction_function( 
-                    text=text,
-                    line_bot_api=line_bot_api,
-                    event=event,
-                    user_id=user_id
-                )
-            
-
-            
 from handlers import postback_handler
 
 # 處理 LINE 的 PostbackEvent (快速選單回傳事件)
 @handler.add(PostbackEvent) # 註冊 Postback 事件處理器
+@event_dedup.event_dedup    # LINE 重送的事件不重複處理
 def postback_event_handler(event):
+    # 與文字訊息共用同一條用戶通道，依收到的順序處理
+    event_lanes.event_lanes.submit(
+        event.source.user_id,
+        lambda: process_postback(event),
+        on_busy=lambda: reply_busy(event)
+    )
+
+
+@user_state_store.user_state_store.event_session  # 一個事件只讀寫一次用戶狀態
+def process_postback(event):
     postback_handler.handle_postback(event, configuration)
 
 
-            
+
+# 所有模組與路由都載入後才預熱（gunicorn --preload 時在 master 行程 fork 前完成，
+# WARMUP_MODE=background 時服務立即開始，/ready 在預熱完成前回傳 503）
+if GUNICORN_PRELOAD:
+    warmup.warmup.start(preload=True)
+else:
+    start_background_services()
+    warmup.warmup.start(background=os.getenv('WARMUP_MODE', 'sync') == 'background')
+
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""每晚批次預先訓練所有股票的智慧預測模型
+
+用法:
+    python batch_pretrain.py                          # 訓練 stock_data 中所有股票
+    python batch_pretrain.py --tickers 2330.TW 2317.TW
+    python batch_pretrain.py --workers 4 --threads 1 --epochs 50 100
+
+每檔股票的四種策略都會用與白天相同的資料處理流程訓練，並寫入模型登錄庫，
+用戶白天輸入相同的訓練次數時就能直接取用預先訓練好的模型，不必排隊等待訓練。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（資料庫連線與預訓練設定）
+load_dotenv()
+
+
+# 要預先訓練的策略模組
+STRATEGY_MODULES = [
+    'ANN_OHLCV_output2_intelligent_prediction',
+    'ANN_OHLCV_output5_intelligent_prediction',
+    'ANN_3DayKbar_output2_intelligent_prediction',
+    'ANN_3DayKbar_output5_intelligent_prediction',
+]
+
+TICKERS_QUERY = "SELECT DISTINCT ticker FROM stock_data ORDER BY ticker;"
+
+# 與白天訓練相同的參數（訓練次數之外的參數不同不影響登錄庫鍵值，但保持一致讓模型品質相同）
+BATCH_SIZE = 5
+VALIDATION_SPLIT = 0.25
+
+
+def list_tickers():
+    """列出 stock_data 中所有不重複的股票代碼"""
+    import db_pool
+    _, rows = db_pool.db_pool.fetch_all(TICKERS_QUERY)
+    return [row[0] for row in rows]
+
+
+def _init_worker(threads):
+    """worker 行程初始化：在載入 TensorFlow 前固定執行緒數，避免多個行程互相搶 CPU"""
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def pretrain_ticker(ticker, epochs_list):
+    """在 worker 行程中訓練一檔股票的所有策略，一次只訓練一個模型
+
+    Returns:
+        dict: {'ticker', 'trained', 'skipped', 'models': [(策略, 訓練次數, 指紋), ...],
+               'failures': [(策略, 錯誤訊息), ...], 'seconds'}
+    """
+    import importlib
+    import model_registry
+
+    start = time.perf_counter()
+    result = {'ticker': ticker, 'trained': 0, 'skipped': 0, 'models': [], 'failures': []}
+
+    for module_name in STRATEGY_MODULES:
+        strategy_module = importlib.import_module('intelligent_prediction_strategies.' + module_name)
+        name = strategy_module.SPEC.name
+        try:
+            # 與白天相同的資料流程（同一檔股票的特徵只抓取、計算一次，四個策略共用）
+            df = strategy_module.fetch_stock_data(ticker)
+            if df.empty:
+                result['failures'].append((name, '沒有歷史資料'))
+                continue
+            X_train, y_train, scaler = strategy_module.prepare_data(df, shuffle=False)
+            fingerprint = model_registry.ModelRegistry.fingerprint(X_train, y_train)
+
+            for epochs in epochs_list:
+                # 資料沒有變動時（例如重跑批次）不重複訓練
+                cached = model_registry.model_registry.get(name, ticker, epochs, fingerprint)
+                if cached is not None:
+                    # 白天用戶訓練的相同模型改標記為預訓練，不再被數量上限淘汰
+                    if not model_registry.model_registry.contains(name, ticker, epochs, fingerprint, pretrained=True):
+                        model_registry.model_registry.put(name, ticker, epochs, fingerprint, *cached, pretrained=True)
+                    result['skipped'] += 1
+                    result['models'].append((name, epochs, fingerprint))
+                    continue
+                model = strategy_module.train_model(
+                    X_train,
+                    y_train,
+                    epochs=epochs,
+                    batch_size=BATCH_SIZE,
+                    validation_split=VALIDATION_SPLIT,
+                    verbose=0,
+                    save_plot=False
+                )
+                model_registry.model_registry.put(name, ticker, epochs, fingerprint, model, scaler, pretrained=True)
+                result['trained'] += 1
+                result['models'].append((name, epochs, fingerprint))
+
+                # 釋放這個模型佔用的計算圖，長時間執行時記憶體不會持續成長
+                import keras
+                keras.backend.clear_session()
+
+        except Exception as e:
+            traceback.print_exc()
+            result['failures'].append((name, f'{type(e).__name__}: {e}'))
+
+    # 這檔股票已訓練完，釋放共用特徵快取的記憶體
+    from intelligent_prediction_strategies import feature_pipeline
+    feature_pipeline.history_cache.invalidate(ticker)
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run(tickers, epochs_list, workers, threads):
+    """以行程池批次訓練，回傳統計報告"""
+    start = time.perf_counter()
+    report = {'tickers': len(tickers), 'models_trained': 0, 'models_skipped': 0, 'models_retained': 0, 'failures': []}
+    models = []  # 這次批次應該留在登錄庫中的模型: (股票代碼, 策略, 訓練次數, 指紋)
+
+    # TensorFlow 不適合在 fork 後使用，worker 一律用 spawn 啟動新的直譯器
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(threads,)) as executor:
+        futures = {executor.submit(pretrain_ticker, ticker, epochs_list): ticker for ticker in tickers}
+        for done, future in enumerate(as_completed(futures), start=1):
+            ticker = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # worker 行程異常結束（例如記憶體不足）
+                report['failures'].append({'ticker': ticker, 'strategy': None, 'error': f'{type(e).__name__}: {e}'})
+                print(f"[{done}/{len(tickers)}] {ticker} 失敗：{e}")
+                continue
+
+            report['models_trained'] += result['trained']
+            report['models_skipped'] += result['skipped']
+            models.extend((ticker, *model) for model in result['models'])
+            for strategy, error in result['failures']:
+                report['failures'].append({'ticker': ticker, 'strategy': strategy, 'error': error})
+            print(f"[{done}/{len(tickers)}] {ticker} 訓練 {result['trained']} 個、略過 {result['skipped']} 個、"
+                  f"失敗 {len(result['failures'])} 個，耗時 {result['seconds']:.1f}s")
+
+    # 確認訓練好的模型都還在登錄庫中（容量上限不足時會被淘汰，白天的請求就取用不到）
+    import model_registry
+    for ticker, strategy, epochs, fingerprint in models:
+        if model_registry.model_registry.contains(strategy, ticker, epochs, fingerprint):
+            report['models_retained'] += 1
+        else:
+            report['failures'].append({'ticker': ticker, 'strategy': strategy,
+                                       'error': f'訓練次數 {epochs} 的模型已被淘汰，請調高 MODEL_REGISTRY_MAX_MB'})
+
+    elapsed = time.perf_counter() - start
+    report['seconds'] = round(elapsed, 1)
+    report['tickers_per_minute'] = round(len(tickers) / elapsed * 60, 2) if elapsed > 0 else 0.0
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批次預先訓練所有股票的智慧預測模型')
+    parser.add_argument('--tickers', nargs='*', help='只訓練指定的股票代碼（預設為 stock_data 中所有股票）')
+    parser.add_argument('--epochs', nargs='*', type=int,
+                        default=[int(value) for value in os.getenv('PRETRAIN_EPOCHS', '50').split(',')],
+                        help='要預先訓練的訓練次數，可指定多個（預設讀取 PRETRAIN_EPOCHS）')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('PRETRAIN_TF_THREADS', '1')),
+                        help='每個 worker 的 TensorFlow 執行緒數')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('PRETRAIN_WORKERS', '0')),
+                        help='worker 行程數（預設為 CPU 核心數 / 執行緒數）')
+    parser.add_argument('--report', help='把統計報告另存成 JSON 檔')
+    args = parser.parse_args(argv)
+
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads)
+    tickers = args.tickers or list_tickers()
+    print(f"共 {len(tickers)} 檔股票，訓練次數 {args.epochs}，{workers} 個 worker，每個 {args.threads} 個執行緒")
+
+    report = run(tickers, args.epochs, workers, args.threads)
+
+    print(f"完成：{report['tickers']} 檔股票，訓練 {report['models_trained']} 個模型、"
+          f"略過 {report['models_skipped']} 個，登錄庫保留 {report['models_retained']} 個，耗時 {report['seconds']}s，"
+          f"每分鐘 {report['tickers_per_minute']} 檔，失敗 {len(report['failures'])} 個")
+    for failure in report['failures']:
+        print(f"  {failure['ticker']} {failure['strategy']}: {failure['error']}")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    # 有失敗時以非 0 結束，讓排程工具可以發現
+    return 1 if report['failures'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.pool
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（資料庫連線資訊與連線池設定）
+load_dotenv()
+
+
+class PoolTimeoutError(Exception):
+    """在等待時間內借不到資料庫連線"""
+
+
+class ConnectionPool:
+    """行程共用的 PostgreSQL 連線池，負責以下功能：
+    - 重複使用已建立的連線，省去每次查詢的 TCP、認證與後端行程建立成本
+    - 限制連線數上限，借用連線時最多等待 checkout_timeout 秒
+    - 借出閒置過久的連線前先做健康檢查，壞掉的連線自動丟棄並重新連線
+    - 記錄借用等待時間等統計數據，方便依負載調整連線池大小
+    """
+
+    def __init__(self, min_size=1, max_size=5, checkout_timeout=10, health_check_interval=30):
+        """初始化連線池設定（實際連線延遲到第一次借用時才建立）
+
+        Args:
+            min_size (int): 連線池保留的最少連線數
+            max_size (int): 連線池的最大連線數
+            checkout_timeout (float): 借用連線的最長等待秒數
+            health_check_interval (float): 連線閒置超過此秒數，借出前先執行 SELECT 1 檢查
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._pool = None
+        self._pool_pid = None
+        self._slots = threading.BoundedSemaphore(max_size)  # 控制同時借出的連線數
+        self._lock = threading.Lock()
+        self._last_used = {}  # key: id(conn), value: 最後歸還時間
+
+        self._recent_waits = deque(maxlen=1000)  # 最近的借用等待秒數，用於計算百分位數
+        self._counters = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'reconnects': 0,
+            'health_check_failures': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def _get_pool(self):
+        """取得底層連線池，第一次使用或 fork 後在新行程重新建立"""
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # fork 後不可沿用父行程的連線，直接建立新的連線池
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    self.min_size,
+                    self.max_size,
+                    dbname=os.getenv('DB_NAME'),
+                    user=os.getenv('DB_USER'),
+                    password=os.getenv('DB_PASSWORD'),
+                    host=os.getenv('DB_HOST'),
+                    port=os.getenv('DB_PORT')
+                )
+                self._pool_pid = os.getpid()
+                self._last_used = {}
+            return self._pool
+
+    def _is_healthy(self, conn):
+        """檢查連線是否可用，閒置不久的連線只檢查是否已關閉"""
+        if conn.closed:
+            return False
+        idle = time.time() - self._last_used.get(id(conn), 0)
+        if idle < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self, pool):
+        """從連線池取出一條健康的連線，壞掉的連線丟棄後重新取得"""
+        conn = pool.getconn()
+        if not self._is_healthy(conn):
+            with self._lock:
+                self._counters['health_check_failures'] += 1
+                self._counters['reconnects'] += 1
+            self._last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """借用一條資料庫連線，離開 with 區塊時自動歸還
+
+        用法:
+            with db_pool.connection() as conn:
+                ...
+
+        Raises:
+            PoolTimeoutError: 等待超過 checkout_timeout 仍借不到連線
+        """
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._counters['timeouts'] += 1
+            raise PoolTimeoutError(f"等待資料庫連線超過 {self.checkout_timeout} 秒")
+
+        pool = None
+        conn = None
+        broken = False
+        try:
+            pool = self._get_pool()
+            conn = self._checkout(pool)
+
+            wait = time.perf_counter() - start
+            with self._lock:
+                self._counters['checkouts'] += 1
+                self._counters['wait_seconds_total'] += wait
+                self._counters['wait_seconds_max'] = max(self._counters['wait_seconds_max'], wait)
+                self._recent_waits.append(wait)
+
+            yield conn
+
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # 連線層級的錯誤代表連線已經壞掉，歸還時直接關閉
+            broken = True
+            raise
+
+        finally:
+            if conn is not None:
+                if not broken and not conn.closed:
+                    # 結束查詢留下的交易，讓連線以閒置狀態歸還
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        broken = True
+                if broken or conn.closed:
+                    with self._lock:
+                        self._counters['reconnects'] += 1
+                    self._last_used.pop(id(conn), None)
+                    pool.putconn(conn, close=True)
+                else:
+                    self._last_used[id(conn)] = time.time()
+                    pool.putconn(conn)
+            self._slots.release()
+
+    def fetch_all(self, query, params=None):
+        """執行查詢並回傳欄位名稱與所有資料列，連線中斷時自動換一條連線重試一次
+
+        Args:
+            query (str): SQL 查詢語句
+            params (tuple): 查詢參數
+
+        Returns:
+            tuple: (colnames, rows)
+        """
+        schema, rows = self.fetch_with_schema(query, params)
+        return [name for name, _ in schema], rows
+
+    def fetch_with_schema(self, query, params=None):
+        """執行查詢並回傳欄位結構與所有資料列，連線中斷時自動換一條連線重試一次
+
+        Args:
+            query (str): SQL 查詢語句
+            params (tuple): 查詢參數
+
+        Returns:
+            tuple: (schema, rows)，schema 為 [(欄位名稱, 型別代碼), ...]
+        """
+        for attempt in range(2):
+            try:
+                with self.connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(query, params)
+                        rows = cur.fetchall()
+                        schema = [(desc[0], desc[1]) for desc in cur.description]
+                        return schema, rows
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if attempt == 1:
+                    raise
+                print("[DBPool] 資料庫連線中斷，重新連線後再試一次")
+
+    def stats(self):
+        """回傳連線池統計數據（等待時間單位為秒）"""
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            checkouts = self._counters['checkouts']
+            return {
+                **self._counters,
+                'wait_seconds_avg': self._counters['wait_seconds_total'] / checkouts if checkouts else 0.0,
+                'wait_seconds_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            }
+
+
+# 實例化行程共用的資料庫連線池
+db_pool = ConnectionPool(
+    min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+    max_size=int(os.getenv('DB_POOL_MAX_SIZE', '5')),
+    checkout_timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30')),
+)
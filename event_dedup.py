@@ -0,0 +1,140 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（事件 ID 保留時間、筆數與共用資料庫設定）
+load_dotenv()
+
+
+class EventDeduplicator:
+    """webhook 事件去重，負責以下功能：
+    - 以 webhookEventId 記錄處理過的事件，LINE 重送同一事件時直接略過（不重複訓練、搜尋或回覆）
+    - 事件 ID 保留 ttl 秒，記憶體中最多保留 max_entries 筆，超過時移除最舊的
+    - 設定 db_path 時另外記錄在本地 SQLite，多個 worker 行程共用同一份紀錄
+    - 記錄略過的重複事件數等統計數據
+    """
+
+    def __init__(self, ttl=600, max_entries=10000, db_path=None):
+        """
+        Args:
+            ttl (float): 事件 ID 保留秒數
+            max_entries (int): 記憶體中最多保留的事件 ID 數
+            db_path (str): 多行程共用的 SQLite 檔案路徑，None 表示只用記憶體
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._seen = OrderedDict()  # key: 事件 ID, value: 過期時間（依加入順序排列，也就是依過期時間排列）
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {'checked': 0, 'duplicates': 0, 'redeliveries': 0, 'missing_id': 0, 'db_errors': 0}
+        self._db_inserts = 0
+
+    def _connection(self):
+        """每個執行緒各自的 SQLite 連線（fork 後重新建立）"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS seen_events (event_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _mark_in_db(self, event_id, now):
+        """在共用資料庫中記錄事件 ID，回傳是否為第一次看到（其他行程已記錄且未過期時回傳 False）"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT expires_at FROM seen_events WHERE event_id = ?', (event_id,)).fetchone()
+            first_seen = row is None or row[0] < now
+            if first_seen:
+                connection.execute('INSERT OR REPLACE INTO seen_events (event_id, expires_at) VALUES (?, ?)', (event_id, now + self.ttl))
+            self._db_inserts += 1
+            # 每寫入一定次數清除一次過期紀錄，避免檔案無限成長
+            if self._db_inserts % 500 == 0:
+                connection.execute('DELETE FROM seen_events WHERE expires_at < ?', (now,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return first_seen
+
+    def is_duplicate(self, event_id):
+        """檢查並記錄事件 ID，已在 ttl 內處理過時回傳 True"""
+        now = time.time()
+        with self._lock:
+            self._counters['checked'] += 1
+            # 移除過期的事件 ID
+            while self._seen and next(iter(self._seen.values())) < now:
+                self._seen.popitem(last=False)
+
+            expires_at = self._seen.get(event_id)
+            if expires_at is not None:
+                self._counters['duplicates'] += 1
+                return True
+
+            self._seen[event_id] = now + self.ttl
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+
+        if self.db_path is None:
+            return False
+        try:
+            first_seen = self._mark_in_db(event_id, now)
+        except sqlite3.Error as e:
+            # 共用紀錄無法使用時只依記憶體判斷，不因此擋下事件
+            print("[EventDeduplicator] 讀寫事件紀錄失敗：", e)
+            with self._lock:
+                self._counters['db_errors'] += 1
+            return False
+        if not first_seen:
+            with self._lock:
+                self._counters['duplicates'] += 1
+        return not first_seen
+
+    def __call__(self, func):
+        """裝飾 webhook 事件處理函式，重複的事件不呼叫 func"""
+        @functools.wraps(func)
+        def wrapper(event):
+            delivery_context = getattr(event, 'delivery_context', None)
+            if delivery_context is not None and delivery_context.is_redelivery:
+                with self._lock:
+                    self._counters['redeliveries'] += 1
+
+            event_id = getattr(event, 'webhook_event_id', None)
+            if not event_id:
+                with self._lock:
+                    self._counters['missing_id'] += 1
+            elif self.is_duplicate(event_id):
+                print(f"[EventDeduplicator] 略過重複的事件 {event_id}")
+                return None
+            return func(event)
+        return wrapper
+
+    def stats(self):
+        """回傳去重統計數據"""
+        with self._lock:
+            return {
+                'entries': len(self._seen),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'shared': self.db_path is not None,
+                **self._counters,
+            }
+
+
+# 實例化 webhook 事件去重（設定 EVENT_DEDUP_DB 時多個 worker 行程共用紀錄）
+event_dedup = EventDeduplicator(
+    ttl=float(os.getenv('EVENT_DEDUP_TTL', '600')),
+    max_entries=int(os.getenv('EVENT_DEDUP_MAX_ENTRIES', '10000')),
+    db_path=os.getenv('EVENT_DEDUP_DB') or None,
+)
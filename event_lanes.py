@@ -0,0 +1,201 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+# 延遲任務排程器（定期檢查處理過久的事件）
+import scheduler
+
+# 載入 .env 檔案中的環境變數（worker 數量、每個用戶的排隊上限與處理時間上限設定）
+load_dotenv()
+
+
+class _Lane:
+    """單一用戶的事件通道"""
+    __slots__ = ('pending', 'scheduled', 'runner', 'running_since', 'busy_notified')
+
+    def __init__(self):
+        self.pending = deque()       # 等待處理的事件: (排入時間, 處理函式)
+        self.scheduled = False       # 是否已排入待處理清單或正在處理
+        self.runner = None           # 正在處理此通道的 worker 執行緒 ID
+        self.running_since = None    # 目前事件開始處理的時間
+        self.busy_notified = False   # 這一波排隊已滿時是否已回覆過「處理中」
+
+
+class EventLanes:
+    """每個用戶一條依序處理的事件通道，負責以下功能：
+    - 同一個用戶的事件依照收到的順序逐一處理，不同用戶的事件由 worker 平行處理
+    - 每個用戶最多排隊 max_lane_size 個事件，超過時略過新事件，同一波只回覆一次「處理中」
+    - 事件處理超過 max_in_flight 秒時不再佔住通道，後續事件改由新的 worker 繼續處理
+    - 記錄排隊等待時間、處理時間、略過與逾時的事件數等統計數據
+
+    通道只在單一行程內：多個 worker 行程時同一用戶的事件可能落在不同行程，
+    由 user_state_store 的跨行程處理中標記（SQLite 後端）確保同一時間只有一個行程處理該用戶，
+    狀態不會互相覆蓋，但跨行程的事件不保證依收到的順序處理
+    """
+
+    def __init__(self, max_workers=8, max_lane_size=5, max_in_flight=120):
+        """
+        Args:
+            max_workers (int): 處理事件的 worker 數量
+            max_lane_size (int): 每個用戶最多排隊等待的事件數（不含處理中的事件）
+            max_in_flight (float): 單一事件最長處理秒數，超過時後續事件不再等待它
+        """
+        self.max_workers = max_workers
+        self.max_lane_size = max_lane_size
+        self.max_in_flight = max_in_flight
+        self._lanes = {}               # key: 用戶ID, value: _Lane
+        self._ready = queue.Queue()    # 有事件待處理的用戶ID
+        self._detached = set()         # 處理逾時、完成後要結束的 worker 執行緒 ID
+        self._lock = threading.Lock()
+        self._counters = {
+            'submitted': 0, 'processed': 0, 'failed': 0, 'overflow': 0, 'busy_replies': 0, 'timeouts': 0,
+            'queue_wait_seconds': 0.0, 'processing_seconds': 0.0, 'max_queue_wait_seconds': 0.0,
+        }
+        self._workers = []
+        self._workers_pid = None
+
+    def _start_worker(self):
+        """啟動一個 worker（呼叫端需持有 _lock）"""
+        worker = threading.Thread(target=self._worker_loop, name=f'event-lane-{len(self._workers)}', daemon=True)
+        worker.start()
+        self._workers.append(worker)
+
+    def _ensure_workers(self):
+        """確保 worker 已啟動（呼叫端需持有 _lock；延遲到第一次排入事件才啟動，並處理 fork 後執行緒遺失的情況）"""
+        if self._workers_pid != os.getpid():
+            # fork 前的通道與 worker 不屬於這個行程
+            self._lanes = {}
+            self._ready = queue.Queue()
+            self._detached = set()
+            self._workers = []
+            self._workers_pid = os.getpid()
+            scheduler.scheduler.every('event_lanes_watchdog', max(1.0, self.max_in_flight / 4), self.check_in_flight)
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self.max_workers:
+            self._start_worker()
+
+    def submit(self, key, func, on_busy=None):
+        """排入一個事件處理函式（不帶參數）到 key 對應的通道
+
+        Args:
+            key (str): 通道 key（通常是用戶ID）
+            func (callable): 事件處理函式
+            on_busy (callable): 通道排隊已滿時呼叫（同一波只呼叫一次），用來回覆「處理中」
+
+        Returns:
+            bool: 是否已排入通道，排隊已滿時回傳 False
+        """
+        with self._lock:
+            self._ensure_workers()
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _Lane()
+
+            if len(lane.pending) >= self.max_lane_size:
+                self._counters['overflow'] += 1
+                notify = on_busy is not None and not lane.busy_notified
+                lane.busy_notified = True
+            else:
+                lane.pending.append((time.monotonic(), func))
+                self._counters['submitted'] += 1
+                if not lane.scheduled:
+                    lane.scheduled = True
+                    self._ready.put(key)
+                return True
+
+        if notify:
+            try:
+                on_busy()
+            except Exception as e:
+                print("[EventLanes] 回覆處理中訊息失敗：", e)
+            else:
+                with self._lock:
+                    self._counters['busy_replies'] += 1
+        return False
+
+    def _release(self, key, lane):
+        """目前事件已處理完成（或逾時），有下一個事件時排回待處理清單，否則移除通道（呼叫端需持有 _lock）"""
+        lane.runner = None
+        lane.running_since = None
+        if lane.pending:
+            # 排到其他用戶之後，避免單一用戶連續佔用 worker
+            self._ready.put(key)
+            return
+        lane.scheduled = False
+        if self._lanes.get(key) is lane:
+            del self._lanes[key]
+
+    def _worker_loop(self):
+        """worker：取出有事件待處理的用戶，處理該用戶的下一個事件"""
+        me = threading.get_ident()
+        while True:
+            key = self._ready.get()
+            with self._lock:
+                lane = self._lanes.get(key)
+                if lane is None or not lane.pending:
+                    continue
+                queued_at, func = lane.pending.popleft()
+                started = time.monotonic()
+                lane.runner = me
+                lane.running_since = started
+                wait = started - queued_at
+                self._counters['queue_wait_seconds'] += wait
+                self._counters['max_queue_wait_seconds'] = max(self._counters['max_queue_wait_seconds'], wait)
+
+            try:
+                func()
+            except Exception as e:
+                print(f"[EventLanes] 用戶 {key} 的事件處理失敗：", e)
+                status = 'failed'
+            else:
+                status = 'processed'
+
+            with self._lock:
+                self._counters[status] += 1
+                self._counters['processing_seconds'] += time.monotonic() - started
+                # 逾時時通道已交給其他 worker，這裡不再處理
+                if lane.runner == me:
+                    self._release(key, lane)
+                if me in self._detached:
+                    self._detached.discard(me)
+                    self._workers = [worker for worker in self._workers if worker.ident != me]
+                    return
+
+    def check_in_flight(self):
+        """處理超過 max_in_flight 秒的事件不再佔住通道，並補上一個 worker 取代被佔住的 worker"""
+        now = time.monotonic()
+        with self._lock:
+            for key, lane in list(self._lanes.items()):
+                if lane.runner is None or now - lane.running_since <= self.max_in_flight:
+                    continue
+                print(f"[EventLanes] 用戶 {key} 的事件處理超過 {self.max_in_flight} 秒，後續事件不再等待")
+                self._counters['timeouts'] += 1
+                self._detached.add(lane.runner)
+                self._release(key, lane)
+                self._start_worker()
+
+    def stats(self):
+        """回傳事件通道統計數據"""
+        with self._lock:
+            return {
+                'lanes': len(self._lanes),
+                'queued': sum(len(lane.pending) for lane in self._lanes.values()),
+                'in_flight': sum(1 for lane in self._lanes.values() if lane.runner is not None),
+                'workers': len(self._workers),
+                'max_workers': self.max_workers,
+                'max_lane_size': self.max_lane_size,
+                'max_in_flight': self.max_in_flight,
+                **self._counters,
+            }
+
+
+# 實例化行程共用的事件通道
+event_lanes = EventLanes(
+    max_workers=int(os.getenv('EVENT_LANE_WORKERS', '8')),
+    max_lane_size=int(os.getenv('EVENT_LANE_MAX_QUEUE', '5')),
+    max_in_flight=float(os.getenv('EVENT_LANE_MAX_IN_FLIGHT', '120')),
+)
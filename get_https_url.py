@@ -1,10 +1,29 @@
+# 引入 os 處理環境變數
+import os
+
 # 引入 request
-from flask import request
+from flask import request, has_request_context
+
+
+# 最近一次 webhook 請求的根 URL（背景 worker 處理事件時沒有 request 可用，改用這個值）
+_url_root = os.getenv('PUBLIC_BASE_URL')
+
+
+def remember_url_root():
+    """在 request 中記下服務器根 URL，供背景處理事件時產生圖片網址"""
+    global _url_root
+    if has_request_context():
+        _url_root = request.url_root
 
 
 def get_https_image_url(filename):
     """生成 HTTPS 圖片 URL"""
-    # 獲取當前服務器根 URL 並拼接圖片路徑
+    # 獲取當前服務器根 URL 並拼接圖片路徑（不在 request 中時使用記下的根 URL）
+    base_url = request.url_root if has_request_context() else _url_root
+    if base_url is None:
+        raise RuntimeError('沒有 request 可取得服務器網址，請設定 PUBLIC_BASE_URL')
+    if not base_url.endswith('/'):
+        base_url += '/'
     # 強制轉換為 HTTPS（LINE 要求圖片必須使用 HTTPS）
-    base_url = request.url_root.replace("http://", "https://")
-    return f"{base_url}static/{filename}"
\ No newline at end of file
+    base_url = base_url.replace("http://", "https://")
+    return f"{base_url}static/{filename}"
@@ -7,17 +7,17 @@ from dotenv import load_dotenv
 load_dotenv() 
 genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))  # 設定 Gemini API 金鑰
 
-# 多用戶聊天狀態管理器：每個 user_id 都有自己獨立的 session 與重置狀態
-class ChatLimiter:
-    def __init__(self):
-        self.user_states = {}  # key: user_id, value: {'history_restore': bool, 'chat_session': session}
+# 用戶狀態儲存（多個 worker 行程共用）
+import user_state_store
 
-    def _init_user_state(self, user_id):
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {
-                'history_restore': True,  # 預設需要重置
-                'chat_session': None,
-            }
+# 多用戶聊天狀態管理器：每個 user_id 都有自己獨立的對話歷史與重置狀態
+class ChatLimiter:
+    def __init__(self, store=None):
+        # 用戶狀態儲存（多個 worker 行程共用），每位用戶存放
+        #   'google_ai.history_restore' (bool): 是否需要重置對話歷史
+        #   'google_ai.chat_history' (list): 對話歷史 [{'role': 'user' 或 'model', 'parts': [文字]}, ...]
+        # 不保存 chat session 物件（無法跨行程共用），每次依對話歷史重新建立 session
+        self._store = store or user_state_store.user_state_store
 
     def is_history_restore(self, user_id) -> bool:
         """
@@ -27,8 +27,7 @@ class ChatLimiter:
         Returns:
             bool: True=需要重置, False=不需要重置
         """
-        self._init_user_state(user_id)
-        return self.user_states[user_id]['history_restore']
+        return self._store.get(user_id, 'google_ai.history_restore', True)  # 預設需要重置
 
     def set_history_restore(self, user_id, value: bool):
         """
@@ -37,29 +36,26 @@ class ChatLimiter:
             user_id (str): 用戶唯一識別ID
             value (bool): True=重置, False=不重置
         """
-        self._init_user_state(user_id)
-        self.user_states[user_id]['history_restore'] = value
+        self._store.set(user_id, 'google_ai.history_restore', value)
 
-    def get_chat_session(self, user_id):
+    def get_chat_history(self, user_id):
         """
-        取得指定用戶的聊天 session
+        取得指定用戶的對話歷史
         Args:
             user_id (str): 用戶唯一識別ID
         Returns:
-            chat_session: Gemini chat session 物件
+            list: [{'role': 'user' 或 'model', 'parts': [文字]}, ...]
         """
-        self._init_user_state(user_id)
-        return self.user_states[user_id]['chat_session']
+        return self._store.get(user_id, 'google_ai.chat_history', [])
 
-    def set_chat_session(self, user_id, session):
+    def set_chat_history(self, user_id, history):
         """
-        設定指定用戶的聊天 session
+        設定指定用戶的對話歷史
         Args:
             user_id (str): 用戶唯一識別ID
-            session: Gemini chat session 物件
+            history (list): [{'role': 'user' 或 'model', 'parts': [文字]}, ...]
         """
-        self._init_user_state(user_id)
-        self.user_states[user_id]['chat_session'] = session
+        self._store.set(user_id, 'google_ai.chat_history', history)
 
 # 建立 ChatLimiter 實例，管理多用戶聊天狀態
 chat_limiter = ChatLimiter()
@@ -103,14 +99,19 @@ def ai_chat(user_input, sys_instruct, reset_input, user_id):
 
     # 檢查是否需要初始化新對話
     if chat_limiter.is_history_restore(user_id):
-        # 建立全新對話 session 並清空歷史紀錄
-        chat_session = model.start_chat(history=[])  # 建立一個空的聊天陣列
-        chat_limiter.set_chat_session(user_id, chat_session) # 用空的聊天陣列取代特定用戶的聊天陣列
+        # 清空歷史紀錄
+        chat_limiter.set_chat_history(user_id, [])  # 用空的聊天陣列取代特定用戶的聊天陣列
         chat_limiter.set_history_restore(user_id, False) # 關必須要重置的狀態
 
-    # 發送使用者輸入至 AI 模型並獲取回應（每個用戶 session 獨立）
-    chat_session = chat_limiter.get_chat_session(user_id)
+    # 依保存的對話歷史建立 session，發送使用者輸入至 AI 模型並獲取回應（每個用戶歷史獨立）
+    chat_session = model.start_chat(history=chat_limiter.get_chat_history(user_id))
     response = chat_session.send_message(str(user_input))
 
+    # 保存包含這一輪的對話歷史（只存文字，不存 session 物件）
+    chat_limiter.set_chat_history(user_id, [
+        {'role': content.role, 'parts': [part.text for part in content.parts]}
+        for content in chat_session.history
+    ])
+
     # 將 AI 回應轉換為字串格式並返回
     return str(response.text)
\ No newline at end of file
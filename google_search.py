@@ -2,6 +2,7 @@
 import requests  # 用於發送HTTP請求，獲取網頁原始碼
 from bs4 import BeautifulSoup  # 用於解析HTML結構，提取所需資料
 from fake_useragent import UserAgent  # 產生隨機User-Agent，降低被反爬蟲封鎖的機率
+import http_client  # 行程共用的 HTTP 用戶端（連線池、逾時、重試與斷路器）
 
 def web_search(query, num_results=5, start_page=1, end_page=1):
     """
@@ -32,8 +33,8 @@ def web_search(query, num_results=5, start_page=1, end_page=1):
             first = 1 + (page - 1) * num_results
             url = f"https://www.bing.com/search?q={query}&first={first}"
             
-            # 發送GET請求，取得搜尋結果頁面
-            response = requests.get(url, headers=headers, timeout=15)
+            # 發送GET請求，取得搜尋結果頁面（共用保持連線的 session）
+            response = http_client.http_client.get(url, headers=headers, timeout=15)
             response.raise_for_status()  # 若狀態碼非200則拋出例外
             
             # 解析HTML內容
@@ -92,8 +93,8 @@ def extract_all_text(url):
     }
 
     try:
-        # 發送GET請求取得網頁內容
-        response = requests.get(url, headers=headers, timeout=15)
+        # 發送GET請求取得網頁內容（共用保持連線的 session）
+        response = http_client.http_client.get(url, headers=headers, timeout=15)
         response.raise_for_status()  # 若HTTP錯誤則拋出例外
         
         # 若網頁內容包含驗證字樣，判斷為反爬蟲
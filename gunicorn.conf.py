@@ -0,0 +1,28 @@
+# gunicorn 設定檔，啟動方式：gunicorn -c gunicorn.conf.py app:app
+import os
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（worker 數量與埠號設定）
+load_dotenv()
+
+bind = '0.0.0.0:' + os.getenv('PORT', '5000')
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+# 在 master 行程載入 app 並完成預熱後才 fork 出 worker，worker 直接沿用已載入的模組
+preload_app = True
+
+# 通知 app.py 在 master 行程中不啟動執行緒（排程器、盯盤輪詢器與預熱執行緒都在 post_fork 中啟動）
+os.environ['GUNICORN_PRELOAD'] = '1' if preload_app else '0'
+
+
+def post_fork(server, worker):
+    """fork 後在 worker 中啟動排程器、盯盤輪詢器，並在背景完成每個行程各自的預熱步驟"""
+    if not server.cfg.preload_app:
+        return  # 沒有 preload 時 worker 載入 app 就會自行啟動
+    import app
+    import warmup
+    app.start_background_services()
+    warmup.warmup.after_fork()
@@ -4,7 +4,6 @@ from linebot.v3.messaging import (
 )
 
 from validators import allow_validator
-from validators import conversation_validator
 
 
 
@@ -33,7 +32,6 @@ def google_ai_chat_function(text, line_bot_api, event, user_id):
                     )]
                 )
             )
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
 
         # 處理一般聊天輸入
         if text != 'r':
@@ -49,12 +47,10 @@ def google_ai_chat_function(text, line_bot_api, event, user_id):
                     )]
                 )
             )
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
 
     # 如果使用者輸入0，關閉訪問叔叔AI（退出聊天模式）
     if text == '0':
         allow_validator.enable_ai_chat(user_id, False)
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
 
 
 
@@ -78,7 +74,6 @@ def local_ai_chat_function(text, line_bot_api, event, user_id):
                     )]
                 )
             )
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
 
         # 處理一般聊天輸入
         if text != 'r':
@@ -94,12 +89,10 @@ def local_ai_chat_function(text, line_bot_api, event, user_id):
                     )]
                 )
             )
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
 
     # 如果使用者輸入0，關閉訪問叔叔AI（退出聊天模式）
     if text == '0':
         allow_validator.allow_validator.enable_ai_chat(user_id, False)
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
 
 
 
@@ -124,7 +117,6 @@ def rag_ai_chat_function(text, line_bot_api, event, user_id):
                     )]
                 )
             )
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
 
         # 處理一般聊天輸入
         if text != 'r':
@@ -140,9 +132,7 @@ def rag_ai_chat_function(text, line_bot_api, event, user_id):
                     )]
                 )
             )
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
 
     # 如果使用者輸入0，關閉訪問叔叔AI（退出聊天模式）
     if text == '0':
-        allow_validator.allow_validator.enable_ai_chat(user_id, False)
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) # 允許接受新傳入對話
\ No newline at end of file
+        allow_validator.allow_validator.enable_ai_chat(user_id, False)
\ No newline at end of file
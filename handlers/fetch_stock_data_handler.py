@@ -13,8 +13,10 @@ import get_https_url
 # 引入自訂的台灣證交所資料爬蟲模組
 import WebCrawler_MIS_TWSE
 
+# 本地股票代號索引（驗證代號、名稱查詢）
+import ticker_index
+
 from validators import allow_validator
-from validators import conversation_validator
 
 
 # 載入個性和腳色
@@ -22,10 +24,23 @@ import ai_character_settings
 adjective=ai_character_settings.AiCharacterSettings.adjective # AI的個性形容詞
 role=ai_character_settings.AiCharacterSettings.role           # AI的角色設定
 
+def resolve_stock_code(text):
+    """把輸入的股票代號或公司名稱轉成有效的股票代號，無效時回傳 None
+
+    優先查詢本地股票代號索引（不需連線），索引沒有資料時才向證交所確認
+    """
+    if text in ['', '0']:
+        return None
+    if ticker_index.ticker_index.available:
+        return ticker_index.ticker_index.resolve(text)
+    return text if WebCrawler_MIS_TWSE.fetch_quote(text) is not None else None
+
+
 def fetch_stock_data_handler(text, line_bot_api, event, user_id):
 
-    # 驗證股票代號是否有效（檢查是否能取得資料）
-    if WebCrawler_MIS_TWSE.webcrawler_true(text):
+    # 驗證股票代號是否有效（也可以輸入公司名稱）
+    code = resolve_stock_code(text)
+    if code is not None:
         
         # ---------------------------
         # 設定快速選單圖示路徑
@@ -38,9 +53,9 @@ def fetch_stock_data_handler(text, line_bot_api, event, user_id):
         time_icon = get_https_url.get_https_image_url('time.png')
 
         # ---------------------------
-        # 處理有效股票代號（4位數字）
+        # 處理有效股票代號（4~6碼，含 ETF）
         # ---------------------------
-        if text.isdigit() and len(text) == 4:
+        if code.isalnum() and 4 <= len(code) <= 6:
             # 建立快速回覆選單
             quickReply = QuickReply(
                 items=[
@@ -48,7 +63,7 @@ def fetch_stock_data_handler(text, line_bot_api, event, user_id):
                     QuickReplyItem(
                         action=PostbackAction(
                             label="詳細資料",          # 選項顯示文字
-                            data=f"{text},詳細資料",   # 格式：股票代號,指令類型
+                            data=f"{code},詳細資料",   # 格式：股票代號,指令類型
                             display_text="這是詳細資料" # 用戶點擊後顯示的文字
                         ),
                         image_url=details_icon  # 自定義圖示
@@ -58,7 +73,7 @@ def fetch_stock_data_handler(text, line_bot_api, event, user_id):
                     QuickReplyItem(
                         action=PostbackAction(
                             label="當盤成交價",
-                            data=f"{text},當盤成交價",
+                            data=f"{code},當盤成交價",
                             display_text="這是當盤成交價"
                         ),
                         image_url=current_transaction_price_icon
@@ -68,7 +83,7 @@ def fetch_stock_data_handler(text, line_bot_api, event, user_id):
                     QuickReplyItem(
                         action=PostbackAction(
                             label="最佳五檔",
-                            data=f"{text},最佳五檔",
+                            data=f"{code},最佳五檔",
                             display_text="這是最佳五檔"
                         ),
                         image_url=best_five_tick_icon
@@ -88,7 +103,6 @@ def fetch_stock_data_handler(text, line_bot_api, event, user_id):
                     ]
                 )
             )
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True) 
 
             # 關閉爬蟲模式（避免重複觸發）
             allow_validator.allow_validator.enable_fetch_stock_data(user_id, False)
@@ -97,14 +111,20 @@ def fetch_stock_data_handler(text, line_bot_api, event, user_id):
     # 處理無效輸入
     # ---------------------------
     # 若股票代號無效且不是指令關鍵字
-    elif not WebCrawler_MIS_TWSE.webcrawler_true(text) and text not in ['', '0']:
+    elif text not in ['', '0']:
+        reply_text = f'沒有這股票不要騙{role}，給我輸入股票代號，或按0退出'
+
+        # 輸入名稱或代號的一部分時，列出相近的股票讓用戶重新輸入
+        suggestions = ticker_index.ticker_index.search(text)
+        if suggestions:
+            reply_text += '\n你是不是要找：' + '、'.join(f"{entry['code']} {entry['name']}" for entry in suggestions)
+
         line_bot_api.reply_message(
             ReplyMessageRequest(
                 reply_token=event.reply_token,
-                messages=[TextMessage(text=f'沒有這股票不要騙{role}，給我輸入股票代號，或按0退出')]
+                messages=[TextMessage(text=reply_text)]
             )
         )
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
     # ---------------------------
     # 處理退出指令
@@ -112,5 +132,3 @@ def fetch_stock_data_handler(text, line_bot_api, event, user_id):
     if text == '0':
         # 關閉爬蟲模式
         allow_validator.allow_validator.enable_fetch_stock_data(user_id, False)
-        
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)  
\ No newline at end of file
@@ -1,5 +1,12 @@
 
+import os
+from dotenv import load_dotenv
+
 from linebot.v3.messaging import (
+    Configuration,        # 設定 LINE Bot API 的存取權杖
+    ApiClient,            # 建立 API 客戶端
+    MessagingApi,         # 傳送訊息的 API
+    PushMessageRequest,   # 推播訊息請求
     ReplyMessageRequest,  # 回覆訊息請求
     ImageMessage,         # 圖片訊息物件
     TextMessage           # 文字訊息物件
@@ -8,12 +15,151 @@ from linebot.v3.messaging import (
 
 from validators import allow_validator
 from validators import training_validator
-from validators import conversation_validator
 
 
 # 引入生成圖片路徑模組
 import get_https_url
 
+# 引入背景訓練任務佇列、模型登錄庫與訓練預測服務
+import training_job_queue
+import model_registry
+import prediction_service
+
+# 本地股票代號索引（驗證股票代號、以公司名稱查詢）
+import ticker_index
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 背景訓練完成時已經沒有 reply token 可用，改用 push_message 主動通知用戶
+configuration = Configuration(access_token=os.getenv('YOUR_CHANNEL_ACCESS_TOKEN'))
+
+
+def push_messages(user_id, messages):
+    """用 push_message 主動推播訊息給指定用戶"""
+    with ApiClient(configuration) as api_client:
+        line_bot_api = MessagingApi(api_client)
+        line_bot_api.push_message(PushMessageRequest(to=user_id, messages=messages))
+
+
+def resolve_stock_code(text):
+    """把輸入的股票代號或公司名稱轉成股票代號，無效時回傳 None
+
+    本地股票代號索引有資料時直接查詢（不是上市櫃股票的代號不會查詢資料庫），
+    索引沒有資料時維持原本的4位數字檢查
+    """
+    if text in ['', '0']:
+        return None
+    if ticker_index.ticker_index.available:
+        return ticker_index.ticker_index.resolve(text)
+    return text if text.isdigit() and len(text) == 4 else None
+
+
+def invalid_code_reply(text):
+    """無效股票代號的回覆文字，輸入名稱或代號的一部分時附上相近的股票"""
+    reply_text = '現在是要查詢資料庫裡是否有資料可以幫你分析，請輸入妳想要分析的股票代號或公司名稱'
+    suggestions = ticker_index.ticker_index.search(text)
+    if suggestions:
+        reply_text += '\n你是不是要找：' + '、'.join(f"{entry['code']} {entry['name']}" for entry in suggestions)
+    return reply_text
+
+
+def submit_training_job(strategy_module, epochs, line_bot_api, event, user_id):
+    """把模型訓練排入背景佇列，立即回覆排隊狀態，訓練完成後用 push_message 回傳預測結果
+
+    參數:
+        strategy_module: 智慧預測策略模組，需提供 SPEC、train_model、fetch_stock_data_today、prediction、convert_status
+        epochs (int): 訓練次數
+        line_bot_api: LINE Messaging API 實例
+        event: LINE 事件物件
+        user_id (str): 用戶ID
+    """
+    # 先取出該用戶的訓練資料快照，背景任務不再讀取會被後續訊息改動的狀態
+    ticker = training_validator.training_validator.get_ticker(user_id)
+    X_train, y_train, scaler = training_validator.training_validator.get_training_data(user_id)
+
+    # 背景執行緒沒有 Flask request context，先在這裡產生模型準確率圖表連結
+    details_icon = get_https_url.get_https_image_url('model_accuracy.png')
+
+    # 訓練資料指紋：相同策略、股票、訓練次數與資料的模型可以直接重複使用
+    fingerprint = model_registry.ModelRegistry.fingerprint(X_train, y_train)
+
+    def predict(model, scaler):
+        # 獲取最新股價數據並提取特徵數據
+        stock_data_today_df = strategy_module.fetch_stock_data_today(ticker)
+        X_test = stock_data_today_df[strategy_module.SPEC.feature_columns]
+
+        # 執行預測並轉換預測結果為文字描述
+        predictions = strategy_module.prediction(model, scaler, X_test)
+        return strategy_module.convert_status(predictions)
+
+    # 登錄庫已有相同條件訓練好的模型，直接預測並回覆，不必排隊訓練
+    cached = model_registry.model_registry.get(strategy_module.SPEC.name, ticker, epochs, fingerprint)
+    if cached is not None:
+        model, cached_scaler = cached
+        status_descriptions = predict(model, cached_scaler or scaler)
+
+        # 重置訓練狀態
+        training_validator.training_validator.mark_as_ready(user_id, False)
+
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=event.reply_token,
+                messages=[TextMessage(
+                    text=ticker + ' 已經有相同條件訓練好的模型，明日預測結果為:' + "\n" + status_descriptions
+                )]
+            )
+        )
+        return
+
+    def run():
+        # 訓練、保存模型並預測（PREDICTION_MODE=remote 時交給預測 worker 行程，本行程不載入 TensorFlow）
+        status_descriptions = prediction_service.prediction_service.train_and_predict(
+            strategy=strategy_module.SPEC.name,
+            ticker=ticker,
+            epochs=epochs,
+            fingerprint=fingerprint,
+            X_train=X_train,
+            y_train=y_train,
+            scaler=scaler
+        )
+
+        # 推播預測結果與圖表
+        push_messages(user_id, [
+            TextMessage(text=ticker + ' 訓練完成，明日預測結果為:' + "\n" + status_descriptions + "\n" '以下是模型的訓練圖:'),
+            ImageMessage(original_content_url=details_icon, preview_image_url=details_icon)
+        ])
+
+    def on_failure(error):
+        push_messages(user_id, [TextMessage(text=ticker + ' 的模型訓練失敗了，請稍後再試一次')])
+
+    job_id, status = training_job_queue.training_job_queue.submit(
+        user_id=user_id,
+        ticker=ticker,
+        strategy=strategy_module.SPEC.name,
+        epochs=epochs,
+        func=run,
+        on_failure=on_failure
+    )
+
+    if status == 'queued':
+        position = training_job_queue.training_job_queue.queue_position(job_id)
+        reply_text = f'已排入訓練，目前排在第{position}位，訓練完成後會主動傳預測結果給你，可以先去做別的事'
+        # 重置訓練狀態，資料已交給背景任務
+        training_validator.training_validator.mark_as_ready(user_id, False)
+    elif status == 'user_limit':
+        reply_text = '你已經有一個訓練正在進行中，等它完成後再輸入訓練次數1-999'
+    else:
+        reply_text = '現在排隊訓練的人太多了，請稍後再輸入一次訓練次數1-999'
+
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=event.reply_token,
+            messages=[TextMessage(text=reply_text)]
+        )
+    )
+
+
 # 引入智慧預測模組（假設為自訂模組）
 from intelligent_prediction_strategies import ANN_OHLCV_output5_intelligent_prediction
 
@@ -22,14 +168,15 @@ def ANN_OHLCV_output5_intelligent_prediction_function(text, line_bot_api, event,
     # 檢查是否已完成數據準備階段
     if training_validator.training_validator.check_training_ready(user_id) == False:
         
-        # 驗證輸入是否為4位數股票代號
-        if text.isdigit() and len(text) == 4:
+        # 驗證股票代號（也可以輸入公司名稱），本地索引確認不是上市櫃股票時不查詢資料庫
+        code = resolve_stock_code(text)
+        if code is not None:
             
             # 格式化成台灣股票代號格式 (如 2330.TW)
-            training_validator.training_validator.ticker = text + '.TW'
+            training_validator.training_validator.set_ticker(user_id, code + '.TW')
             
             # 抓取歷史股價數據
-            df = ANN_OHLCV_output5_intelligent_prediction.fetch_stock_data(training_validator.training_validator.ticker)
+            df = ANN_OHLCV_output5_intelligent_prediction.fetch_stock_data(training_validator.training_validator.get_ticker(user_id))
             
             if df.empty:
                 # 數據抓取失敗回應
@@ -37,23 +184,20 @@ def ANN_OHLCV_output5_intelligent_prediction_function(text, line_bot_api, event,
                     ReplyMessageRequest(
                         reply_token=event.reply_token,
                         messages=[TextMessage(
-                            text='沒抓到資料：換檔股票或是輸入的股票代號不正確，請輸入4個數字'
+                            text='沒抓到資料：換檔股票或是輸入的股票代號不正確，請輸入股票代號或公司名稱'
                         )]
                     )
                 )
-                # 允許接受新的對話傳入
-                conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
             else:      
                 # 準備訓練數據 (不洗牌以保留時間序列特性)
-                X_train, y_train = ANN_OHLCV_output5_intelligent_prediction.prepare_data(df, shuffle=False)
+                X_train, y_train, scaler = ANN_OHLCV_output5_intelligent_prediction.prepare_data(df, shuffle=False)
                 
                 # 標記數據準備完成
                 training_validator.training_validator.mark_as_ready(user_id, True)
                 
-                # 儲存訓練數據到多用戶狀態（你需要改 training_validator 支援多用戶）
-                training_validator.training_validator.X_train = X_train
-                training_validator.training_validator.y_train = y_train
+                # 儲存訓練數據到多用戶狀態
+                training_validator.training_validator.set_training_data(user_id, X_train, y_train, scaler)
 
                 # 清空輸入內容避免干擾後續流程
                 text = ""
@@ -67,76 +211,35 @@ def ANN_OHLCV_output5_intelligent_prediction_function(text, line_bot_api, event,
                         )]
                     )
                 )
-                # 允許接受新的對話傳入
-                conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
                 
 
 
         # 處理無效輸入
-        elif ((text.isdigit() == False) or len(text) != 4) and text not in ["0", ""]:
+        elif text not in ["0", ""]:
             print(f"無效輸入: {text}")
             line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
                     messages=[TextMessage(
-                        text='現在是要查詢資料庫裡是否有資料可以幫你分析，請輸入妳想要分析的股票代號'
+                        text=invalid_code_reply(text)
                     )]
                 )
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
     # 數據準備完成後的模型訓練階段
     if training_validator.training_validator.check_training_ready(user_id) and text not in ['', '0']:
         
         # 驗證訓練次數輸入 (1-3位數)
         if text.isdigit() and (len(text) < 4):
-            
-            # 模型訓練參數設定
-            epochs = int(text)
-            batch_size = 5
-            validation_split = 0.25
-            
-            # 啟動模型訓練
-            model = ANN_OHLCV_output5_intelligent_prediction.train_model(
-                training_validator.training_validator.X_train,
-                training_validator.training_validator.y_train,
-                epochs=epochs,
-                batch_size=batch_size,
-                validation_split=validation_split
-            )
-            
-            # 獲取最新股價數據
-            stock_data_today_df = ANN_OHLCV_output5_intelligent_prediction.fetch_stock_data_today(training_validator.training_validator.ticker)
-            
-            # 提取特徵數據
-            X_test = stock_data_today_df[['open', 'high', 'low', 'close', 'volume']]
-            
-            # 執行預測
-            predictions = ANN_OHLCV_output5_intelligent_prediction.prediction(model, training_validator.training_validator.X_train, X_test)
-            
-            # 轉換預測結果為文字描述
-            status_descriptions = ANN_OHLCV_output5_intelligent_prediction.convert_status(predictions)
-            
-            # 生成模型準確率圖表連結
-            details_icon = get_https_url.get_https_image_url('model_accuracy.png')
-            
-            # 重置訓練狀態
-            training_validator.training_validator.mark_as_ready(user_id, False)   
 
-            # 發送預測結果與圖表
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[
-                        TextMessage(text='訓練完成，明日預測結果為:' + "\n" + status_descriptions + "\n" '以下是模型的訓練圖:'),
-                        ImageMessage(original_content_url=details_icon, preview_image_url=details_icon)
-                    ]
-                )
+            # 排入背景訓練佇列，立即回覆排隊狀態，訓練完成後再主動推播結果
+            submit_training_job(
+                strategy_module=ANN_OHLCV_output5_intelligent_prediction,
+                epochs=int(text),
+                line_bot_api=line_bot_api,
+                event=event,
+                user_id=user_id
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
-            
 
 
         # 處理訓練階段的無效輸入
@@ -149,8 +252,6 @@ def ANN_OHLCV_output5_intelligent_prediction_function(text, line_bot_api, event,
                     )]
                 )
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
     # 處理退出指令
     if text == '0':
@@ -158,8 +259,6 @@ def ANN_OHLCV_output5_intelligent_prediction_function(text, line_bot_api, event,
         allow_validator.allow_validator.enable_intelligent_prediction(user_id, False)
         # 重置訓練狀態
         training_validator.training_validator.mark_as_ready(user_id, False)
-        # 允許接受新的對話傳入
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
 
 # 引入智慧預測模組（假設為自訂模組）
@@ -170,14 +269,15 @@ def ANN_OHLCV_output2_intelligent_prediction_function(text, line_bot_api, event,
     # 檢查是否已完成數據準備階段
     if training_validator.training_validator.check_training_ready(user_id) == False:
         
-        # 驗證輸入是否為4位數股票代號
-        if text.isdigit() and len(text) == 4:
+        # 驗證股票代號（也可以輸入公司名稱），本地索引確認不是上市櫃股票時不查詢資料庫
+        code = resolve_stock_code(text)
+        if code is not None:
             
             # 格式化成台灣股票代號格式 (如 2330.TW)
-            training_validator.training_validator.ticker = text + '.TW'
+            training_validator.training_validator.set_ticker(user_id, code + '.TW')
             
             # 抓取歷史股價數據
-            df = ANN_OHLCV_output2_intelligent_prediction.fetch_stock_data(training_validator.training_validator.ticker)
+            df = ANN_OHLCV_output2_intelligent_prediction.fetch_stock_data(training_validator.training_validator.get_ticker(user_id))
             
             if df.empty:
                 # 數據抓取失敗回應
@@ -185,23 +285,20 @@ def ANN_OHLCV_output2_intelligent_prediction_function(text, line_bot_api, event,
                     ReplyMessageRequest(
                         reply_token=event.reply_token,
                         messages=[TextMessage(
-                            text='沒抓到資料：換檔股票或是輸入的股票代號不正確，請輸入4個數字'
+                            text='沒抓到資料：換檔股票或是輸入的股票代號不正確，請輸入股票代號或公司名稱'
                         )]
                     )
                 )
-                # 允許接受新的對話傳入
-                conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
             else:               
                 # 準備訓練數據 (不洗牌以保留時間序列特性)
-                X_train, y_train = ANN_OHLCV_output2_intelligent_prediction.prepare_data(df, shuffle=False)
+                X_train, y_train, scaler = ANN_OHLCV_output2_intelligent_prediction.prepare_data(df, shuffle=False)
                 
                 # 標記數據準備完成
                 training_validator.training_validator.mark_as_ready(user_id, True)
                 
-                # 儲存訓練數據到多用戶狀態（你需要改 training_validator 支援多用戶）
-                training_validator.training_validator.X_train = X_train
-                training_validator.training_validator.y_train = y_train
+                # 儲存訓練數據到多用戶狀態
+                training_validator.training_validator.set_training_data(user_id, X_train, y_train, scaler)
                 
                 # 清空輸入內容避免干擾後續流程
                 text = ""
@@ -215,74 +312,34 @@ def ANN_OHLCV_output2_intelligent_prediction_function(text, line_bot_api, event,
                         )]
                     )
                 )
-                # 允許接受新的對話傳入
-                conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
         # 處理無效輸入
-        elif ((text.isdigit() == False) or len(text) != 4) and text not in ["0", ""]:
+        elif text not in ["0", ""]:
             print(f"無效輸入: {text}")
             line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
                     messages=[TextMessage(
-                        text='現在是要查詢資料庫裡是否有資料可以幫你分析，請輸入妳想要分析的股票代號'
+                        text=invalid_code_reply(text)
                     )]
                 )
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
     # 數據準備完成後的模型訓練階段
     if training_validator.training_validator.check_training_ready(user_id) and text not in ['', '0']:
         
         # 驗證訓練次數輸入 (1-3位數)
         if text.isdigit() and (len(text) < 4):
-            
-            # 模型訓練參數設定
-            epochs = int(text)
-            batch_size = 5
-            validation_split = 0.25
-            
-            # 啟動模型訓練
-            model = ANN_OHLCV_output2_intelligent_prediction.train_model(
-                training_validator.training_validator.X_train,
-                training_validator.training_validator.y_train,
-                epochs=epochs,
-                batch_size=batch_size,
-                validation_split=validation_split
-            )
-            
-            # 獲取最新股價數據
-            stock_data_today_df = ANN_OHLCV_output2_intelligent_prediction.fetch_stock_data_today(training_validator.training_validator.ticker)
-            
-            # 提取特徵數據
-            X_test = stock_data_today_df[['open', 'high', 'low', 'close', 'volume']]
-            
-            # 執行預測
-            predictions = ANN_OHLCV_output2_intelligent_prediction.prediction(model, training_validator.training_validator.X_train, X_test)
-            
-            # 轉換預測結果為文字描述
-            status_descriptions = ANN_OHLCV_output2_intelligent_prediction.convert_status(predictions)
-            
-            # 生成模型準確率圖表連結
-            details_icon = get_https_url.get_https_image_url('model_accuracy.png')
 
-            # 重置訓練狀態
-            training_validator.training_validator.mark_as_ready(user_id, False)
-            
-            # 發送預測結果與圖表
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[
-                        TextMessage(text='訓練完成，明日預測結果為:' + "\n" + status_descriptions + "\n" '以下是模型的訓練圖:'),
-                        ImageMessage(original_content_url=details_icon, preview_image_url=details_icon)
-                    ]
-                )
+            # 排入背景訓練佇列，立即回覆排隊狀態，訓練完成後再主動推播結果
+            submit_training_job(
+                strategy_module=ANN_OHLCV_output2_intelligent_prediction,
+                epochs=int(text),
+                line_bot_api=line_bot_api,
+                event=event,
+                user_id=user_id
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
-            
+
 
         # 處理訓練階段的無效輸入
         else:
@@ -294,8 +351,6 @@ def ANN_OHLCV_output2_intelligent_prediction_function(text, line_bot_api, event,
                     )]
                 )
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
     # 處理退出指令
     if text == '0':
@@ -303,8 +358,6 @@ def ANN_OHLCV_output2_intelligent_prediction_function(text, line_bot_api, event,
         allow_validator.allow_validator.enable_intelligent_prediction(user_id, False)
         # 重置訓練狀態
         training_validator.training_validator.mark_as_ready(user_id, False)
-        # 允許接受新的對話傳入
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
 
 # 引入智慧預測模組（假設為自訂模組）
@@ -315,14 +368,15 @@ def ANN_3DayKbar_output5_intelligent_prediction_function(text, line_bot_api, eve
     # 檢查是否已完成數據準備階段
     if training_validator.training_validator.check_training_ready(user_id) == False:
         
-        # 驗證輸入是否為4位數股票代號
-        if text.isdigit() and len(text) == 4:
+        # 驗證股票代號（也可以輸入公司名稱），本地索引確認不是上市櫃股票時不查詢資料庫
+        code = resolve_stock_code(text)
+        if code is not None:
             
             # 格式化成台灣股票代號格式 (如 2330.TW)
-            training_validator.training_validator.ticker = text + '.TW'
+            training_validator.training_validator.set_ticker(user_id, code + '.TW')
             
             # 抓取歷史股價數據
-            df = ANN_3DayKbar_output5_intelligent_prediction.fetch_stock_data(training_validator.training_validator.ticker)
+            df = ANN_3DayKbar_output5_intelligent_prediction.fetch_stock_data(training_validator.training_validator.get_ticker(user_id))
             
             if df.empty:
                 # 數據抓取失敗回應
@@ -330,23 +384,20 @@ def ANN_3DayKbar_output5_intelligent_prediction_function(text, line_bot_api, eve
                     ReplyMessageRequest(
                         reply_token=event.reply_token,
                         messages=[TextMessage(
-                            text='沒抓到資料：換檔股票或是輸入的股票代號不正確，請輸入4個數字'
+                            text='沒抓到資料：換檔股票或是輸入的股票代號不正確，請輸入股票代號或公司名稱'
                         )]
                     )
                 )
-                # 允許接受新的對話傳入
-                conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
                 
             else:              
                 # 準備訓練數據 (不洗牌以保留時間序列特性)
-                X_train, y_train = ANN_3DayKbar_output5_intelligent_prediction.prepare_data(df, shuffle=False)
+                X_train, y_train, scaler = ANN_3DayKbar_output5_intelligent_prediction.prepare_data(df, shuffle=False)
                 
                 # 標記數據準備完成
                 training_validator.training_validator.mark_as_ready(user_id, True)
                 
-                # 儲存訓練數據到多用戶狀態（你需要改 training_validator 支援多用戶）
-                training_validator.training_validator.X_train = X_train
-                training_validator.training_validator.y_train = y_train
+                # 儲存訓練數據到多用戶狀態
+                training_validator.training_validator.set_training_data(user_id, X_train, y_train, scaler)
                 
                 # 清空輸入內容避免干擾後續流程
                 text = ""
@@ -360,74 +411,34 @@ def ANN_3DayKbar_output5_intelligent_prediction_function(text, line_bot_api, eve
                         )]
                     )
                 )
-                # 允許接受新的對話傳入
-                conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
         # 處理無效輸入
-        elif ((text.isdigit() == False) or len(text) != 4) and text not in ["0", ""]:
+        elif text not in ["0", ""]:
             print(f"無效輸入: {text}")
             line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
                     messages=[TextMessage(
-                        text='現在是要查詢資料庫裡是否有資料可以幫你分析，請輸入妳想要分析的股票代號'
+                        text=invalid_code_reply(text)
                     )]
                 )
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
     # 數據準備完成後的模型訓練階段
     if training_validator.training_validator.check_training_ready(user_id) and text not in ['', '0']:
         
         # 驗證訓練次數輸入 (1-3位數)
         if text.isdigit() and (len(text) < 4):
-            
-            # 模型訓練參數設定
-            epochs = int(text)
-            batch_size = 5
-            validation_split = 0.25
-            
-            # 啟動模型訓練
-            model = ANN_3DayKbar_output5_intelligent_prediction.train_model(
-                training_validator.training_validator.X_train,
-                training_validator.training_validator.y_train,
-                epochs=epochs,
-                batch_size=batch_size,
-                validation_split=validation_split
-            )
-            
-            # 獲取最新股價數據
-            stock_data_today_df = ANN_3DayKbar_output5_intelligent_prediction.fetch_stock_data_today(training_validator.training_validator.ticker)
-            
-            # 提取特徵數據
-            X_test = stock_data_today_df[['volume', 'k-2_status', 'k-1_status', 'k_status']]
-    
-            # 執行預測
-            predictions = ANN_3DayKbar_output5_intelligent_prediction.prediction(model, training_validator.training_validator.X_train, X_test)
-            
-            # 轉換預測結果為文字描述
-            status_descriptions = ANN_3DayKbar_output5_intelligent_prediction.convert_status(predictions)
-            
-            # 生成模型準確率圖表連結
-            details_icon = get_https_url.get_https_image_url('model_accuracy.png')
 
-            # 重置訓練狀態
-            training_validator.training_validator.mark_as_ready(user_id, False)
-            
-            # 發送預測結果與圖表
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[
-                        TextMessage(text='訓練完成，明日預測結果為:' + "\n" + status_descriptions + "\n" '以下是模型的訓練圖:'),
-                        ImageMessage(original_content_url=details_icon, preview_image_url=details_icon)
-                    ]
-                )
+            # 排入背景訓練佇列，立即回覆排隊狀態，訓練完成後再主動推播結果
+            submit_training_job(
+                strategy_module=ANN_3DayKbar_output5_intelligent_prediction,
+                epochs=int(text),
+                line_bot_api=line_bot_api,
+                event=event,
+                user_id=user_id
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
-            
+
 
         # 處理訓練階段的無效輸入
         else:
@@ -439,8 +450,6 @@ def ANN_3DayKbar_output5_intelligent_prediction_function(text, line_bot_api, eve
                     )]
                 )
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
     # 處理退出指令
     if text == '0':
@@ -448,8 +457,6 @@ def ANN_3DayKbar_output5_intelligent_prediction_function(text, line_bot_api, eve
         allow_validator.allow_validator.enable_intelligent_prediction(user_id, False)
         # 重置訓練狀態
         training_validator.training_validator.mark_as_ready(user_id, False)
-        # 允許接受新的對話傳入
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
 
 
@@ -463,14 +470,15 @@ def ANN_3DayKbar_output2_intelligent_prediction_function(text, line_bot_api, eve
     # 檢查是否已完成數據準備階段
     if training_validator.training_validator.check_training_ready(user_id) == False:
         
-        # 驗證輸入是否為4位數股票代號
-        if text.isdigit() and len(text) == 4:
+        # 驗證股票代號（也可以輸入公司名稱），本地索引確認不是上市櫃股票時不查詢資料庫
+        code = resolve_stock_code(text)
+        if code is not None:
             
             # 格式化成台灣股票代號格式 (如 2330.TW)
-            training_validator.training_validator.ticker = text + '.TW'
+            training_validator.training_validator.set_ticker(user_id, code + '.TW')
             
             # 抓取歷史股價數據
-            df = ANN_3DayKbar_output2_intelligent_prediction.fetch_stock_data(training_validator.training_validator.ticker)
+            df = ANN_3DayKbar_output2_intelligent_prediction.fetch_stock_data(training_validator.training_validator.get_ticker(user_id))
             
             if df.empty:
                 # 數據抓取失敗回應
@@ -478,23 +486,20 @@ def ANN_3DayKbar_output2_intelligent_prediction_function(text, line_bot_api, eve
                     ReplyMessageRequest(
                         reply_token=event.reply_token,
                         messages=[TextMessage(
-                            text='沒抓到資料：換檔股票或是輸入的股票代號不正確，請輸入4個數字'
+                            text='沒抓到資料：換檔股票或是輸入的股票代號不正確，請輸入股票代號或公司名稱'
                         )]
                     )
                 )
-                # 允許接受新的對話傳入
-                conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
             else:               
                 # 準備訓練數據 (不洗牌以保留時間序列特性)
-                X_train, y_train = ANN_3DayKbar_output2_intelligent_prediction.prepare_data(df, shuffle=False)
+                X_train, y_train, scaler = ANN_3DayKbar_output2_intelligent_prediction.prepare_data(df, shuffle=False)
                 
                 # 標記數據準備完成
                 training_validator.training_validator.mark_as_ready(user_id, True)
                 
-                # 儲存訓練數據到多用戶狀態（你需要改 training_validator 支援多用戶）
-                training_validator.training_validator.X_train = X_train
-                training_validator.training_validator.y_train = y_train
+                # 儲存訓練數據到多用戶狀態
+                training_validator.training_validator.set_training_data(user_id, X_train, y_train, scaler)
                 
                 # 清空輸入內容避免干擾後續流程
                 text = ""
@@ -508,74 +513,34 @@ def ANN_3DayKbar_output2_intelligent_prediction_function(text, line_bot_api, eve
                         )]
                     )
                 )
-                # 允許接受新的對話傳入
-                conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
         # 處理無效輸入
-        elif ((text.isdigit() == False) or len(text) != 4) and text not in ["0", ""]:
+        elif text not in ["0", ""]:
             print(f"無效輸入: {text}")
             line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
                     messages=[TextMessage(
-                        text='現在是要查詢資料庫裡是否有資料可以幫你分析，請輸入妳想要分析的股票代號'
+                        text=invalid_code_reply(text)
                     )]
                 )
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
     # 數據準備完成後的模型訓練階段
     if training_validator.training_validator.check_training_ready(user_id) and text not in ['', '0']:
         
         # 驗證訓練次數輸入 (1-3位數)
         if text.isdigit() and (len(text) < 4):
-            
-            # 模型訓練參數設定
-            epochs = int(text)
-            batch_size = 5
-            validation_split = 0.25
-            
-            # 啟動模型訓練
-            model = ANN_3DayKbar_output2_intelligent_prediction.train_model(
-                training_validator.training_validator.X_train,
-                training_validator.training_validator.y_train,
-                epochs=epochs,
-                batch_size=batch_size,
-                validation_split=validation_split
-            )
-            
-            # 獲取最新股價數據
-            stock_data_today_df = ANN_3DayKbar_output2_intelligent_prediction.fetch_stock_data_today(training_validator.training_validator.ticker)
-            
-            # 提取特徵數據
-            X_test = stock_data_today_df[['volume', 'k-2_status', 'k-1_status', 'k_status']]
-    
-            # 執行預測
-            predictions = ANN_3DayKbar_output2_intelligent_prediction.prediction(model, training_validator.training_validator.X_train, X_test)
-            
-            # 轉換預測結果為文字描述
-            status_descriptions = ANN_3DayKbar_output2_intelligent_prediction.convert_status(predictions)
-            
-            # 生成模型準確率圖表連結
-            details_icon = get_https_url.get_https_image_url('model_accuracy.png')
 
-            # 重置訓練狀態
-            training_validator.training_validator.mark_as_ready(user_id, False)
-            
-            # 發送預測結果與圖表
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[
-                        TextMessage(text='訓練完成，明日預測結果為:' + "\n" + status_descriptions + "\n" '以下是模型的訓練圖:'),
-                        ImageMessage(original_content_url=details_icon, preview_image_url=details_icon)
-                    ]
-                )
+            # 排入背景訓練佇列，立即回覆排隊狀態，訓練完成後再主動推播結果
+            submit_training_job(
+                strategy_module=ANN_3DayKbar_output2_intelligent_prediction,
+                epochs=int(text),
+                line_bot_api=line_bot_api,
+                event=event,
+                user_id=user_id
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
-            
+
 
         # 處理訓練階段的無效輸入
         else:
@@ -587,8 +552,6 @@ def ANN_3DayKbar_output2_intelligent_prediction_function(text, line_bot_api, eve
                     )]
                 )
             )
-            # 允許接受新的對話傳入
-            conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
     # 處理退出指令
     if text == '0':
@@ -596,8 +559,6 @@ def ANN_3DayKbar_output2_intelligent_prediction_function(text, line_bot_api, eve
         allow_validator.allow_validator.enable_intelligent_prediction(user_id, False)
         # 重置訓練狀態
         training_validator.training_validator.mark_as_ready(user_id, False)
-        # 允許接受新的對話傳入
-        conversation_validator.conversation_validator.enable_allow_conversation(user_id, True)
 
 
 
@@ -0,0 +1,247 @@
+import importlib
+import threading
+import time
+
+from linebot.v3.messaging import (
+    ReplyMessageRequest,  # 回覆訊息請求
+    TextMessage           # 文字訊息物件
+)
+
+from validators import allow_validator
+from validators import training_validator
+
+# 自選股提醒說明（盯盤選單回覆用）
+from handlers import watchlist_handler
+
+import Deemo_carousel_template
+
+
+# 載入個性和腳色
+import ai_character_settings
+role=ai_character_settings.AiCharacterSettings.role # AI的角色設定
+
+
+class Route:
+    """一條路由：處理函式與它的執行時間統計"""
+    __slots__ = ('name', '_target', '_func', 'calls', 'failures', 'total_seconds', 'max_seconds')
+
+    def __init__(self, name, target):
+        """
+        Args:
+            name (str): 路由名稱（統計數據的 key）
+            target (callable | str): 處理函式 (text, line_bot_api, event, user_id)，
+                或 'module:function' 字串，第一次用到時才載入模組（AI 等較重的模組不拖慢啟動）
+        """
+        self.name = name
+        self._target = target
+        self._func = target if callable(target) else None
+        self.calls = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    @property
+    def func(self):
+        """處理函式（字串形式的目標只在第一次呼叫時載入，之後直接使用）"""
+        if self._func is None:
+            module_name, _, attribute = self._target.partition(':')
+            self._func = getattr(importlib.import_module(module_name), attribute)
+        return self._func
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'avg_seconds': self.total_seconds / self.calls if self.calls else 0.0,
+            'max_seconds': self.max_seconds,
+        }
+
+
+class MessageRouter:
+    """文字訊息路由表，負責以下功能：
+    - 選單指令（含別名）在啟動時登記成 dict，每則訊息只需一次查表
+    - 模式（查詢、聊天、分析、盯盤）依登記順序檢查用戶狀態，交給第一個開啟的模式處理
+    - 全域指令（例如 Deemo）不論用戶在哪個模式都會處理
+    - 自動記錄每條路由的呼叫次數、失敗次數與執行時間
+    """
+
+    def __init__(self):
+        self._commands = {}   # key: 指令文字（含別名）, value: (Route, 是否為全域指令)
+        self._modes = []      # [(Route, 檢查模式是否開啟的函式)]，依登記順序檢查
+        self._routes = {}     # key: 路由名稱, value: Route
+        self._lock = threading.Lock()
+        self._unrouted = 0
+
+    def _route(self, name, target):
+        if name in self._routes:
+            raise ValueError(f"路由 {name} 已經登記過")
+        route = self._routes[name] = Route(name, target)
+        return route
+
+    def command(self, name, aliases, target, global_command=False):
+        """登記選單指令
+
+        Args:
+            name (str): 路由名稱
+            aliases (list): 觸發指令的文字（例如 ['1', '叔叔我要報']）
+            target (callable | str): 處理函式，或 'module:function' 字串
+            global_command (bool): 用戶在任何模式中都處理此指令，否則只在沒有開啟模式時處理
+        """
+        route = self._route(name, target)
+        for alias in aliases:
+            if alias in self._commands:
+                raise ValueError(f"指令 {alias} 已經登記在 {self._commands[alias][0].name}")
+            self._commands[alias] = (route, global_command)
+
+    def mode(self, name, is_active, target):
+        """登記模式處理函式
+
+        Args:
+            name (str): 路由名稱
+            is_active (callable): is_active(user_id) 回傳用戶是否開啟此模式
+            target (callable | str): 處理函式，或 'module:function' 字串
+        """
+        self._modes.append((self._route(name, target), is_active))
+
+    def preload(self):
+        """先載入所有以字串登記的處理函式（服務前預熱用，第一則訊息不必等模組載入）
+
+        Returns:
+            dict: 載入失敗的路由 {路由名稱: 錯誤訊息}，其餘路由照常載入
+        """
+        failures = {}
+        for name, route in self._routes.items():
+            try:
+                route.func
+            except Exception as e:
+                failures[name] = str(e)
+        return failures
+
+    def active_mode(self, user_id):
+        """回傳用戶目前開啟的模式路由，沒有開啟任何模式時回傳 None"""
+        for route, is_active in self._modes:
+            if is_active(user_id):
+                return route
+        return None
+
+    def resolve(self, text, user_id):
+        """找出處理這則訊息的路由，沒有符合的路由時回傳 None"""
+        command = self._commands.get(text)
+        if command is not None and command[1]:
+            return command[0]
+        mode = self.active_mode(user_id)
+        if mode is not None:
+            return mode
+        return command[0] if command is not None else None
+
+    def dispatch(self, text, line_bot_api, event, user_id):
+        """把訊息交給對應的路由處理，回傳處理的路由名稱（沒有符合的路由時回傳 None）"""
+        route = self.resolve(text, user_id)
+        if route is None:
+            with self._lock:
+                self._unrouted += 1
+            return None
+
+        started = time.monotonic()
+        try:
+            route.func(text=text, line_bot_api=line_bot_api, event=event, user_id=user_id)
+        except Exception:
+            with self._lock:
+                route.failures += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                route.calls += 1
+                route.total_seconds += elapsed
+                route.max_seconds = max(route.max_seconds, elapsed)
+        return route.name
+
+    def stats(self):
+        """回傳各路由的統計數據"""
+        with self._lock:
+            return {
+                'commands': len(self._commands),
+                'modes': len(self._modes),
+                'unrouted': self._unrouted,
+                'routes': {name: route.stats() for name, route in self._routes.items()},
+            }
+
+
+def set_states(user_id, fetch=False, chat=False, predict=False, train=False, watch=False):
+    """集中管理指定用戶的所有狀態設置"""
+    allow_validator.allow_validator.enable_fetch_stock_data(user_id, fetch)
+    allow_validator.allow_validator.enable_ai_chat(user_id, chat)
+    allow_validator.allow_validator.enable_intelligent_prediction(user_id, predict)
+    allow_validator.allow_validator.enable_watchlist(user_id, watch)
+    training_validator.training_validator.mark_as_ready(user_id, train)
+
+
+def reply_text(line_bot_api, event, text):
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=event.reply_token,
+            messages=[TextMessage(text=text)]
+        )
+    )
+
+
+def deemo_command(text, line_bot_api, event, user_id):
+    """回覆 Deemo 輪播選單"""
+    Deemo_carousel_template.reply_with_deemo_carousel(
+        line_bot_api,       # 傳入 LINE Bot API 實例，用於發送訊息
+        event.reply_token,  # 傳入當前事件的回覆令牌，確保訊息回覆給正確用戶
+        user_id=user_id
+    )
+
+
+def fetch_stock_data_command(text, line_bot_api, event, user_id):
+    """進入股票查詢模式"""
+    reply_text(line_bot_api, event, f'{role}要給你報，請輸入股票代號，或按0退出')
+    set_states(user_id, fetch=True)
+
+
+def ai_chat_command(text, line_bot_api, event, user_id):
+    """進入聊天模式"""
+    reply_text(line_bot_api, event, f'{role}跟你聊，請輸入你要的聊的，或按0退出')
+    set_states(user_id, chat=True)
+
+
+def intelligent_prediction_command(text, line_bot_api, event, user_id):
+    """進入股票分析模式"""
+    reply_text(line_bot_api, event, f'{role}給你分析，請輸入你要詢問的股票代號，或按0退出')
+    set_states(user_id, predict=True)
+
+
+def watchlist_command(text, line_bot_api, event, user_id):
+    """進入盯盤模式"""
+    reply_text(line_bot_api, event, f'{role}幫你盯盤，盤中條件達到時會通知你\n{watchlist_handler.USAGE}')
+    set_states(user_id, watch=True)
+
+
+# 實例化文字訊息路由表（啟動時登記一次）
+message_router = MessageRouter()
+
+# 選單指令
+message_router.command('deemo', ['Deemo'], deemo_command, global_command=True)
+message_router.command('fetch_stock_data', ['1', '叔叔我要報', '叔叔我要抱'], fetch_stock_data_command)
+message_router.command('ai_chat', ['2', '我要撩叔叔', '我要聊叔叔'], ai_chat_command)
+message_router.command('intelligent_prediction', ['3', '叔叔我要分析'], intelligent_prediction_command)
+message_router.command('watchlist', ['4', '叔叔幫我盯盤'], watchlist_command)
+
+# 模式處理函式（可替換為同模組中的其他方法）
+message_router.mode('fetch_stock_data_mode', allow_validator.allow_validator.is_allow_fetch_stock_data,
+                    'handlers.fetch_stock_data_handler:fetch_stock_data_handler')
+# google_ai_chat_function >> 用google的AI
+# local_ai_chat_function >> 用本地的AI
+# rag_ai_chat_function >> 智能聊天與網路檢索（RAG）整合主流程，但是api消耗較大，可以換成本地AI
+message_router.mode('ai_chat_mode', allow_validator.allow_validator.is_allow_ai_chat,
+                    'handlers.ai_chat_handler:rag_ai_chat_function')
+# ANN_OHLCV_output5_intelligent_prediction_function >> 輸入開高低收，5輸出
+# ANN_OHLCV_output2_intelligent_prediction_function >> 輸入開高低收，2輸出
+# ANN_3DayKbar_output5_intelligent_prediction_function >> 輸入3天k棒，5輸出
+# ANN_3DayKbar_output2_intelligent_prediction_function >> 輸入3天k棒，2輸出
+message_router.mode('intelligent_prediction_mode', allow_validator.allow_validator.is_allow_intelligent_prediction,
+                    'handlers.intelligent_prediction_handler:ANN_3DayKbar_output2_intelligent_prediction_function')
+message_router.mode('watchlist_mode', allow_validator.allow_validator.is_allow_watchlist,
+                    watchlist_handler.watchlist_function)
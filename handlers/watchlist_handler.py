@@ -0,0 +1,100 @@
+import re
+
+from linebot.v3.messaging import (
+    ReplyMessageRequest,  # 回覆訊息請求
+    TextMessage           # 文字訊息物件
+)
+
+# 自選股與提醒條件
+import watchlist
+
+from handlers.fetch_stock_data_handler import resolve_stock_code
+
+from validators import allow_validator
+
+
+# 載入個性和腳色
+import ai_character_settings
+adjective=ai_character_settings.AiCharacterSettings.adjective # AI的個性形容詞
+role=ai_character_settings.AiCharacterSettings.role           # AI的角色設定
+
+
+# 設定提醒的指令格式：「股票代號或名稱 條件符號 門檻值」
+RULE_PATTERN = re.compile(r'^(?P<symbol>\S+)\s*(?P<op>>|<|＞|＜|%|％|量)\s*(?P<value>\d+(?:\.\d+)?)$')
+
+# 條件符號對應的提醒條件種類
+OPERATORS = {
+    '>': 'above', '＞': 'above',
+    '<': 'below', '＜': 'below',
+    '%': 'change_pct', '％': 'change_pct',
+    '量': 'volume_spike',
+}
+
+USAGE = (
+    '盯盤指令：\n'
+    '2330 >600  漲破600提醒\n'
+    '2330 <550  跌破550提醒\n'
+    '2330 %3    漲跌幅達3%提醒\n'
+    '2330 量2   成交量達平均2倍提醒\n'
+    '刪 2330    刪除這檔的所有提醒\n'
+    '清單       列出我的提醒\n'
+    '按0退出'
+)
+
+
+def describe_rule(rule):
+    """把提醒條件轉成文字"""
+    unit = {'above': '', 'below': '', 'change_pct': '%', 'volume_spike': '倍'}[rule['kind']]
+    return f"{rule['symbol']} {watchlist.TRIGGER_KINDS[rule['kind']]} {rule['value']:g}{unit}"
+
+
+def reply_text(line_bot_api, event, text):
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=event.reply_token,
+            messages=[TextMessage(text=text)]
+        )
+    )
+
+
+def watchlist_function(text, line_bot_api, event, user_id):
+    """盯盤模式：設定、刪除、列出自選股提醒條件，盤中由背景輪詢器推播提醒"""
+    store = watchlist.watchlist_store
+
+    # 退出盯盤模式（已設定的提醒繼續有效）
+    if text == '0':
+        allow_validator.allow_validator.enable_watchlist(user_id, False)
+        return
+
+    if text == '':
+        return
+
+    if text == '清單':
+        rules = store.user_rules(user_id)
+        if rules:
+            message = '你的盯盤提醒：\n' + '\n'.join(describe_rule(rule) for rule in rules)
+        else:
+            message = f'你還沒有設定盯盤提醒\n{USAGE}'
+        reply_text(line_bot_api, event, message)
+
+    elif text.startswith('刪'):
+        code = resolve_stock_code(text[1:].strip())
+        removed = store.remove_symbol(user_id, code) if code else 0
+        if removed:
+            reply_text(line_bot_api, event, f'已刪除 {code} 的 {removed} 個提醒')
+        else:
+            reply_text(line_bot_api, event, '你沒有盯這檔股票喔')
+
+    else:
+        match = RULE_PATTERN.match(text.strip())
+        code = resolve_stock_code(match.group('symbol')) if match else None
+        if match is None:
+            reply_text(line_bot_api, event, USAGE)
+        elif code is None:
+            reply_text(line_bot_api, event, f'沒有這股票不要騙{role}\n{USAGE}')
+        else:
+            rule = store.add_rule(user_id, code, OPERATORS[match.group('op')], match.group('value'))
+            if rule is None:
+                reply_text(line_bot_api, event, f'最多只能設定 {store.max_rules_per_user} 個提醒，請先刪除一些')
+            else:
+                reply_text(line_bot_api, event, f'{role}幫你盯著：{describe_rule(rule)}\n繼續輸入條件，或按0退出')
@@ -0,0 +1,239 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（逾時、重試與斷路器設定）
+load_dotenv()
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """目標主機連續失敗，斷路器開啟中，暫時不送出請求"""
+
+
+# 伺服器暫時性錯誤，值得稍後重試的狀態碼
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 重複送出不會造成副作用的方法，連線中斷或逾時都可以重試
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+def _is_connect_error(error):
+    """判斷錯誤是否發生在建立連線階段（請求還沒送出，任何方法都可以安全重試）"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        import urllib3
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+class _HostState:
+    """單一主機的連線 session、斷路器狀態與統計數據"""
+
+    def __init__(self, pool_maxsize):
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self.consecutive_failures = 0
+        self.opened_at = None        # 斷路器開啟的時間，None 表示關閉
+        self.half_open_trial = False  # 斷路器半開時是否已有一個試探請求在進行
+        self.counters = {'requests': 0, 'retries': 0, 'failures': 0, 'circuit_rejections': 0}
+
+    def connection_counts(self):
+        """從 urllib3 連線池讀取新建立的連線數與請求數，差值即為重複使用連線的次數"""
+        new_connections = 0
+        requests_sent = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                new_connections += pool.num_connections
+                requests_sent += pool.num_requests
+        return new_connections, max(requests_sent - new_connections, 0)
+
+
+class HttpClient:
+    """行程共用的對外 HTTP 用戶端，負責以下功能：
+    - 每個主機一個保持連線 (keep-alive) 的 session 與連線池，省去每次請求的 DNS、TCP、TLS 成本
+    - 所有請求都有連線與讀取逾時
+    - 暫時性錯誤以加上隨機抖動的指數退避重試
+    - 每個主機各自的斷路器：連續失敗達門檻後暫停請求，冷卻後放行一個試探請求
+    - 記錄重複使用與新建立的連線數等統計數據
+    - 最多保留 max_hosts 個主機（網路檢索會連到任意網站），超過時關閉最久沒用到的主機的 session
+    """
+
+    def __init__(self, pool_maxsize=10, connect_timeout=5, read_timeout=15, max_retries=2,
+                 backoff_base=0.5, backoff_max=8, failure_threshold=5, reset_timeout=30, max_hosts=32):
+        """
+        Args:
+            pool_maxsize (int): 每個主機的連線池大小
+            connect_timeout (float): 預設連線逾時秒數
+            read_timeout (float): 預設讀取逾時秒數
+            max_retries (int): 最多重試次數（不含第一次請求）
+            backoff_base (float): 退避基準秒數，第 n 次重試最多等待 backoff_base * 2^n 秒
+            backoff_max (float): 單次退避的最長等待秒數
+            failure_threshold (int): 連續失敗幾次後開啟斷路器
+            reset_timeout (float): 斷路器開啟後多少秒放行試探請求
+            max_hosts (int): 最多保留的主機數（各自有 session 與連線池）
+        """
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_hosts = max_hosts
+
+        self._hosts = OrderedDict()  # key: 主機 (scheme://netloc), value: _HostState，依最近使用時間排列（最舊的在前）
+        self._hosts_pid = None
+        self._lock = threading.Lock()
+
+    def _host_state(self, host):
+        """取得主機狀態，fork 後在新行程重新建立（不可沿用父行程的連線）"""
+        evicted = []
+        with self._lock:
+            if self._hosts_pid != os.getpid():
+                self._hosts = OrderedDict()
+                self._hosts_pid = os.getpid()
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self.pool_maxsize)
+                while len(self._hosts) > self.max_hosts:
+                    evicted.append(self._hosts.popitem(last=False)[1])
+            else:
+                self._hosts.move_to_end(host)
+        # 被淘汰的主機關閉連線池（進行中的請求完成後連線直接關閉，不放回連線池）
+        for old_state in evicted:
+            old_state.session.close()
+        return state
+
+    def _allow_request(self, state):
+        """斷路器檢查：關閉時放行；開啟且冷卻時間已過時只放行一個試探請求"""
+        with self._lock:
+            if state.opened_at is None:
+                return True
+            if time.time() - state.opened_at >= self.reset_timeout and not state.half_open_trial:
+                state.half_open_trial = True
+                return True
+            state.counters['circuit_rejections'] += 1
+            return False
+
+    def _record_result(self, state, success):
+        """更新斷路器狀態"""
+        with self._lock:
+            state.half_open_trial = False
+            if success:
+                state.consecutive_failures = 0
+                state.opened_at = None
+                return
+            state.counters['failures'] += 1
+            state.consecutive_failures += 1
+            if state.opened_at is not None or state.consecutive_failures >= self.failure_threshold:
+                # 試探請求失敗或連續失敗達門檻，重新開始冷卻
+                state.opened_at = time.time()
+
+    def _backoff(self, attempt):
+        """加上隨機抖動的指數退避等待秒數（full jitter，避免多個請求同時重試）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, retries=None, **kwargs):
+        """送出 HTTP 請求，參數與 requests.request 相同
+
+        Args:
+            method (str): HTTP 方法
+            url (str): 網址
+            retries (int): 覆寫預設的最多重試次數
+            **kwargs: headers、params、json、timeout 等 requests 參數
+
+        Returns:
+            requests.Response: 最後一次請求的回應（狀態碼錯誤不會拋出例外，由呼叫端自行處理）
+
+        Raises:
+            CircuitOpenError: 主機的斷路器開啟中
+            requests.exceptions.RequestException: 重試後仍然連線失敗或逾時
+        """
+        parts = urlsplit(url)
+        host = f'{parts.scheme}://{parts.netloc}'
+        state = self._host_state(host)
+        kwargs.setdefault('timeout', self.timeout)
+        max_retries = self.max_retries if retries is None else retries
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            if not self._allow_request(state):
+                raise CircuitOpenError(f'{host} 連續失敗，暫停請求中')
+
+            with self._lock:
+                state.counters['requests'] += 1
+            try:
+                response = state.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self._record_result(state, success=False)
+                # 非冪等方法只有在連線都還沒建立時才重試，避免重複送出
+                if attempt >= max_retries or not (idempotent or _is_connect_error(e)):
+                    raise
+            except Exception:
+                # 網址格式錯誤等其他例外也要結束半開的試探請求，否則斷路器會一直拒絕該主機
+                self._record_result(state, success=False)
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self._record_result(state, success=True)
+                    return response
+                self._record_result(state, success=False)
+                if attempt >= max_retries:
+                    return response
+                response.close()
+
+            with self._lock:
+                state.counters['retries'] += 1
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """回傳各主機的統計數據"""
+        with self._lock:
+            hosts = dict(self._hosts)
+        result = {}
+        for host, state in hosts.items():
+            new_connections, reused_connections = state.connection_counts()
+            with self._lock:
+                result[host] = {
+                    **state.counters,
+                    'new_connections': new_connections,
+                    'reused_connections': reused_connections,
+                    'circuit_open': state.opened_at is not None,
+                }
+        return result
+
+
+# 實例化行程共用的 HTTP 用戶端
+http_client = HttpClient(
+    pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', '10')),
+    connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+    read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', '15')),
+    max_retries=int(os.getenv('HTTP_MAX_RETRIES', '2')),
+    backoff_base=float(os.getenv('HTTP_BACKOFF_BASE', '0.5')),
+    backoff_max=float(os.getenv('HTTP_BACKOFF_MAX', '8')),
+    failure_threshold=int(os.getenv('HTTP_CIRCUIT_FAILURE_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('HTTP_CIRCUIT_RESET_TIMEOUT', '30')),
+    max_hosts=int(os.getenv('HTTP_MAX_HOSTS', '32')),
+)
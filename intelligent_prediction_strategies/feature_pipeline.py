@@ -0,0 +1,391 @@
+import os
+import threading
+import time
+
+import psycopg2
+import pandas as pd
+import numpy as np
+from dotenv import load_dotenv
+
+# 本地歷史股價快取（依日期排序，只向資料庫查詢新資料）
+import stock_history_cache
+
+# K 棒型態判斷（整欄向量化版本）
+from intelligent_prediction_strategies.kbar_classifier import add_k_type_columns
+
+# 加載 .env 文件中的環境變數
+load_dotenv()
+
+
+# 共用特徵資料表的欄位（各策略從這裡切出自己需要的特徵）
+BASE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'k-2_status', 'k-1_status', 'k_status', 'price_change_percent']
+
+# 隔天漲跌幅的分界（±3%）
+PRICE_CHANGE_THRESHOLD = 0.03
+
+
+class StrategySpec:
+    """智慧預測策略的宣告式設定
+
+    每個策略只需描述自己用哪些特徵、怎麼把隔天漲跌幅分類成標籤、以及輸出幾個類別，
+    資料抓取、K 棒型態與標籤計算都由本模組共用。
+    """
+
+    def __init__(self, name, feature_columns, label_choices, status_mapping):
+        """
+        參數:
+        name : str
+            策略名稱，例如 'ANN_3DayKbar_output2'
+        feature_columns : list
+            模型輸入的特徵欄位
+        label_choices : list
+            隔天漲跌幅四個區間對應的狀態值，依序為
+            漲幅大於3%、漲幅0%~3%、跌幅0%~3%、跌幅大於3%（沒有漲跌為 0）
+        status_mapping : dict
+            狀態碼對應的文字描述
+        """
+        self.name = name
+        self.feature_columns = list(feature_columns)
+        self.label_choices = list(label_choices)
+        self.status_mapping = dict(status_mapping)
+        self.num_classes = len(self.status_mapping)  # 輸出類別數（含沒有變化的 0）
+
+        # 相同分類方式的策略共用同一個標籤欄位
+        self.label_column = 'status_' + '_'.join(str(choice) for choice in self.label_choices)
+
+
+class FeatureFrameCache:
+    """以股票代碼為鍵的特徵資料表快取
+
+    同一檔股票只從資料庫抓一次、只計算一次 K 棒型態與漲跌幅，
+    各策略的標籤欄位也只在第一次用到時計算一次，之後都從同一張表切出資料。
+    """
+
+    def __init__(self, ttl=600, max_entries=32):
+        """
+        參數:
+        ttl : int
+            快取有效秒數，過期後會重新從資料庫抓取
+        max_entries : int
+            最多快取幾檔股票，超過時移除最久沒用到的
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._frames = {}  # key: ticker, value: {'df': DataFrame, 'loaded_at': float, 'used_at': float}
+        self._lock = threading.Lock()
+        self._ticker_locks = {}  # 每檔股票各自的鎖，避免同時重複抓取同一檔
+
+    def _ticker_lock(self, ticker):
+        with self._lock:
+            return self._ticker_locks.setdefault(ticker, threading.Lock())
+
+    def get(self, ticker, loader):
+        """取得指定股票的特徵資料表，快取不存在或已過期時呼叫 loader(ticker) 重新建立"""
+        with self._ticker_lock(ticker):
+            with self._lock:
+                entry = self._frames.get(ticker)
+                if entry is not None and time.time() - entry['loaded_at'] < self.ttl:
+                    entry['used_at'] = time.time()
+                    return entry['df']
+
+            df = loader(ticker)
+
+            # 空資料表（查無資料或發生錯誤）不快取，下次再重新嘗試
+            if df.empty:
+                return df
+
+            with self._lock:
+                now = time.time()
+                self._frames[ticker] = {'df': df, 'loaded_at': now, 'used_at': now}
+                if len(self._frames) > self.max_entries:
+                    oldest = min(self._frames, key=lambda key: self._frames[key]['used_at'])
+                    self._frames.pop(oldest)
+            return df
+
+    def invalidate(self, ticker=None):
+        """移除指定股票的快取，不指定則清空全部"""
+        with self._lock:
+            if ticker is None:
+                self._frames.clear()
+            else:
+                self._frames.pop(ticker, None)
+
+
+class FeatureScaler:
+    """最大最小值標準化（與 sklearn MinMaxScaler 的預設行為相同，輸出範圍 0~1）
+
+    在 prepare_data 中用訓練資料 fit 一次後隨模型保存，預測時直接用同一組最大最小值轉換，
+    不必再讀取整段訓練資料重新 fit，轉換成本只和特徵數有關。
+    可用 to_dict / from_dict 轉成 JSON 可保存的格式。
+    """
+
+    def __init__(self, feature_names=None, data_min=None, data_max=None):
+        """
+        參數:
+        feature_names : list
+            特徵欄位名稱，轉換 DataFrame 時依此順序取欄位
+        data_min, data_max : array-like
+            各特徵在訓練資料中的最小值與最大值
+        """
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.data_min = None if data_min is None else np.asarray(data_min, dtype=np.float64)
+        self.data_max = None if data_max is None else np.asarray(data_max, dtype=np.float64)
+
+    def _as_array(self, X):
+        """DataFrame 依 feature_names 的順序取欄位，其餘輸入直接轉成浮點數陣列"""
+        if isinstance(X, pd.DataFrame) and self.feature_names is not None:
+            X = X[self.feature_names]
+        return np.asarray(X, dtype=np.float64)
+
+    def fit(self, X):
+        """記錄各特徵的最大最小值（忽略缺值）"""
+        if isinstance(X, pd.DataFrame):
+            self.feature_names = list(X.columns)
+        X = self._as_array(X)
+        self.data_min = np.nanmin(X, axis=0)
+        self.data_max = np.nanmax(X, axis=0)
+        return self
+
+    def transform(self, X):
+        """依訓練資料的最大最小值轉換，最大值等於最小值的特徵只減去最小值"""
+        data_range = self.data_max - self.data_min
+        data_range = np.where(data_range == 0, 1.0, data_range)
+        return (self._as_array(X) - self.data_min) / data_range
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+    def to_dict(self):
+        """轉成可存成 JSON 的 dict"""
+        return {
+            'feature_names': self.feature_names,
+            'data_min': self.data_min.tolist(),
+            'data_max': self.data_max.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """由 to_dict 的結果還原"""
+        return cls(data['feature_names'], data['data_min'], data['data_max'])
+
+
+# 歷史資料（資料庫）與今日資料（yfinance）各自的快取
+history_cache = FeatureFrameCache(ttl=int(os.getenv('FEATURE_CACHE_TTL', '600')))
+today_cache = FeatureFrameCache(ttl=int(os.getenv('TODAY_FEATURE_CACHE_TTL', '60')))
+
+# 保護標籤欄位的新增動作（多個策略可能同時對同一張表新增欄位）
+_label_lock = threading.Lock()
+
+
+def _load_stock_history(ticker):
+    """從本地歷史股價快取讀取股票歷史資料（只向資料庫查詢新資料），並計算 K 棒型態與隔天漲跌幅"""
+    try:
+        df = stock_history_cache.stock_history_cache.load(ticker)
+
+    except psycopg2.DatabaseError as e:
+        print("資料庫錯誤：", e)
+        return pd.DataFrame()
+
+    except Exception as e:
+        print("發生錯誤：", e)
+        return pd.DataFrame()
+
+    if df.empty:
+        return df
+
+    # 應用型態判斷並新增前一日、前兩日的歷史狀態欄位
+    add_k_type_columns(df)
+
+    # 計算隔天漲跌幅，隔天開盤價減去今天的收盤價
+    # 最後一天沒有隔天開盤價，所以直接用今天的收盤價相減，讓值等於0
+    price_change = df['open'].shift(-1).fillna(df['close'])
+    df['price_change_percent'] = (price_change - df['close']) / df['close']
+
+    return df
+
+
+def _ensure_label_column(df, spec):
+    """確認資料表已有該策略的標籤欄位，沒有的話依漲跌幅分類計算一次（呼叫端需持有 _label_lock）"""
+    if spec.label_column not in df.columns:
+        price_change_percent = df['price_change_percent']
+        conditions = [
+            (price_change_percent > PRICE_CHANGE_THRESHOLD),                                          # 漲幅大於3%
+            (price_change_percent > 0) & (price_change_percent <= PRICE_CHANGE_THRESHOLD),             # 漲幅大於0%且小於等於3%
+            (price_change_percent < 0) & (price_change_percent >= -PRICE_CHANGE_THRESHOLD),            # 跌幅大於0%且小於等於3%
+            (price_change_percent < -PRICE_CHANGE_THRESHOLD)                                          # 跌幅大於3%
+        ]
+        # 使用 np.select 根據條件設置狀態，default=0 表示沒有漲跌
+        df[spec.label_column] = np.select(conditions, spec.label_choices, default=0)
+
+
+def fetch_stock_data(ticker, spec):
+    """根據股票代碼取得策略要用的歷史資料表（共用快取，同一檔股票只抓一次、只算一次特徵）
+
+    參數:
+    ticker (str): 股票代碼，例如 '2330.TW'
+    spec (StrategySpec): 策略設定
+
+    返回:
+    pd.DataFrame: 包含 open, high, low, close, volume, k-2_status, k-1_status, k_status,
+                  price_change_percent, status 的 DataFrame，查無資料或錯誤時為空的 DataFrame
+    """
+    df = history_cache.get(ticker, _load_stock_history)
+    if df.empty:
+        return df
+
+    with _label_lock:
+        _ensure_label_column(df, spec)
+
+        # 切出共用欄位與該策略的標籤欄位（回傳新的 DataFrame，不影響快取內容）
+        df = df[BASE_COLUMNS + [spec.label_column]].rename(columns={spec.label_column: 'status'})
+
+    print("以下為獲取的資料表:")
+    print(df)
+    return df
+
+
+def prepare_data(df, spec, shuffle=False):
+    """
+    將數據標準化並創建訓練數據集。
+
+    參數:
+    df : DataFrame
+        至少包含策略特徵欄位與 status 的數據。
+    spec : StrategySpec
+        策略設定，決定要取哪些特徵欄位。
+    shuffle : bool
+        為真值的時候觸發隨機洗牌 df
+
+    返回:
+    X_train : numpy.ndarray
+        訓練集特徵數據。
+    y_train : numpy.ndarray
+        訓練集目標數據。
+    scaler : FeatureScaler
+        用訓練資料 fit 好的標準化轉換，預測時沿用。
+    """
+
+    # 如果shuffle為true就會隨機洗牌 df
+    # 隨機選擇所有行，frac=1 表示選擇 100% 的行。
+    if shuffle:
+        df = df.sample(frac=1).reset_index(drop=True)
+
+    X = df[spec.feature_columns]
+    y_train = df['status']
+
+    # 資料歸一化（最大最小方法）
+    # y不用轉換，因為是固定的狀態碼
+    scaler = FeatureScaler()
+    scaler.fit(X)           # 訓練
+    X_train = scaler.transform(X) # 轉換
+
+    print("成功返回X_train:")
+    print(X_train)
+    print("成功返回y_train:")
+    print(y_train)
+    return X_train, y_train, scaler
+
+
+def _load_stock_today(ticker):
+    """從 yfinance 抓取最近3日的資料並計算 K 棒型態，K 棒型態需要前兩日的資料"""
+    import yfinance as yf
+    # 獲取股票數據
+    stock = yf.Ticker(ticker)
+
+    # 獲取3日的數據
+    data = stock.history(period='3d')
+
+    # 直接轉換為DataFrame
+    df = data[['Open', 'High', 'Low', 'Close', 'Volume']].copy()
+    df.columns = ['open', 'high', 'low', 'close', 'volume']  # 統一欄位名稱
+
+    if df.empty:
+        return df
+
+    # 應用型態判斷並新增前一日、前兩日的歷史狀態欄位
+    add_k_type_columns(df)
+
+    # 調整欄位順序
+    columns_order = ['open', 'high', 'low', 'close', 'volume', 'k-2_status', 'k-1_status', 'k_status']
+    return df.reindex(columns=columns_order)
+
+
+def fetch_stock_data_today(ticker):
+    """
+    給股票代號，返回今日的開高收低量與 K 棒型態的資料表（共用快取，各策略不重複抓取）。
+
+    參數:
+    ticker (str):
+        股票代碼，例如 '2330.TW'。
+
+    返回:
+    df : DataFrame
+        返回今日的 open, high, low, close, volume, k-2_status, k-1_status, k_status 資料表。
+    """
+    df = today_cache.get(ticker, _load_stock_today)
+
+    # 過濾最新日
+    df = df.iloc[[-1]]  # 取最後一筆(最新日)
+
+    print("成功返回資料表:")
+    print(df)
+
+    # 返回 DataFrame
+    return df
+
+
+def prediction(model, scaler, X_test):
+    """
+    用訓練時 fit 好的標準化轉換處理X_test並做預測，返回預測結果。
+
+    參數:
+    model : keras.Model
+        訓練好的模型。
+    scaler : FeatureScaler
+        prepare_data 返回的標準化轉換，保持與訓練資料相同的最大最小值。
+    X_test : DataFrame 或 numpy.ndarray
+        要預測的目標數據。
+
+    返回:
+    predictions : numpy.ndarray
+        輸出預測結果的狀態碼。
+    """
+
+    # 資料歸一化（沿用訓練資料的最大最小值）
+    X_test = scaler.transform(X_test)
+
+    # 預測
+    predictions = model.predict(X_test)
+
+    print("predictions預測的機率分布:")
+    print(np.round(predictions[0],3))
+
+    # 用np.argmax把[]中的最適結果印出來
+    predictions = np.argmax(predictions,axis=1)
+
+    print('prelabel:',predictions)
+
+    return predictions
+
+
+def convert_status(status_codes, spec):
+    """
+    把預測結果的狀態碼轉換成文字。
+
+    參數:
+    status_codes : numpy.ndarray
+        預測結果的狀態碼。
+    spec : StrategySpec
+        策略設定，提供狀態碼對應的文字描述。
+
+    返回:
+    status_description : str
+        第一筆預測結果的文字描述
+    """
+    # 使用列表推導式進行轉換
+    status_descriptions = [spec.status_mapping[code] for code in status_codes]
+
+    # 顯示結果
+    print("預測結果為:" + str(status_descriptions))
+
+    return str(status_descriptions[0])
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+
+
+def get_k_type(row):
+    """簡化版 K 棒型態判斷（逐筆版本，保留作為向量化版本的對照基準）
+
+    參數說明:
+    row : pd.Series - 需包含 open, high, low, close 四個價格欄位
+
+    返回狀態碼:
+    0: 無效數據     1: 紅K鎚子線     2: 大陽線     3: 倒鎚紅K線
+    4: 紡錘紅K線    5: 十字線  6: 紡錘黑K線    7: 倒鎚黑K線
+    8: 黑K鎚子線    9: 大陰線
+    """
+    # 解構價格數據：從輸入的 Series 中提取四個關鍵價格
+    o = row['open']   # 開盤價
+    h = row['high']   # 最高價
+    l = row['low']    # 最低價
+    c = row['close']  # 收盤價
+
+    # 異常數據檢查區塊
+    # 檢查缺失值與價格合理性 (排除異常數據)
+    if any(pd.isna([o, h, l, c])):  # 任一價格為缺失值
+        return 0
+    if h < l:                       # 最高價低於最低價
+        return 0
+    if o > h or o < l or c > h or c < l:  # 開盤/收盤超出高低範圍
+        return 0
+
+    # 核心指標計算區塊
+    body = c - o                # 實體方向與大小 (正值為陽線，負值為陰線)
+    body_size = abs(body)       # 實體絕對長度
+    upper_shadow = h - max(o, c)  # 上影線長度 = 最高價 - 實體頂部
+    lower_shadow = min(o, c) - l  # 下影線長度 = 實體底部 - 最低價
+    total_range = h - l         # 當日總波動範圍
+
+    # 防除零處理：當 total_range=0 時，設定 body_ratio=0 (一字線情況已單獨處理)
+    body_ratio = body_size / total_range if total_range != 0 else 0  # 身體比例
+    is_bullish = body > 0       # 判斷陰陽線 (body > 0 會寫入值 = 陽線, body = 0 就不寫入 = 陰線)
+
+    # 極端型態優先判斷區塊
+    # 一字線判斷：四價相同，視為十字線變體
+    if h == l:
+        return 5  # 狀態碼5=十字線
+
+    # 大陽線判斷：開盤=最低價，收盤接近最高價 (允許5%以內上影線)
+    # 條件：開盤在最低點 且 收盤達到最高價的95%以上
+    if o == l and c >= h * 0.95:
+        return 2  # 狀態碼2=大陽線
+
+    # 大陰線判斷：開盤=最高價，收盤接近最低價 (允許5%以內下影線)
+    # 條件：開盤在最高點 且 收盤低於最低價的105% (因允許5%影線，實際應為 c <= l * 1.05)
+    if o == h and c <= l * 1.05:
+        return 9  # 狀態碼9=大陰線
+
+    # 影線主導型態判斷區塊
+    # 倒鎚線判斷：長上影(>=1.8倍實體) + 短下影(<=0.5倍實體)
+    # 此處使用絕對值比較，避免除零問題
+    if upper_shadow >= 1.8 * body_size and lower_shadow <= 0.5 * body_size:
+        return 3 if is_bullish else 7  # 陽線=倒鎚紅K(3)，陰線=倒鎚黑K(7)
+
+    # 鎚子線判斷：長下影(>=1.8倍實體) + 短上影(<=0.5倍實體)
+    if lower_shadow >= 1.8 * body_size and upper_shadow <= 0.5 * body_size:
+        return 1 if is_bullish else 8  # 陽線=紅鎚(1)，陰線=黑鎚(8)
+
+    # 紡錘線判斷區塊
+    # 條件：實體佔比20%~40% 且 影線對稱(差異<30%總波動)
+    if 0.2 < body_ratio < 0.4 and abs(upper_shadow - lower_shadow) < 0.3 * total_range:
+        return 4 if is_bullish else 6  # 陽線=紡錘紅(4)，陰線=紡錘黑(6)
+
+    # 十字線判斷區塊
+    # 條件：實體佔比<20% 且 有波動(total_range>0)
+    if body_ratio < 0.2 and total_range > 0:
+        return 5  # 狀態碼5=十字線
+
+    # 最終回退機制
+    # 當不滿足任何明確型態時，根據陰陽線返回對應紡錘線
+    return 4 if is_bullish else 6  # 陽線回退紡錘紅(4)，陰線回退紡錘黑(6)
+
+
+def get_k_types(open_prices, high_prices, low_prices, close_prices):
+    """向量化 K 棒型態判斷，一次處理整段價格序列
+
+    判斷規則與優先順序和 get_k_type 完全相同，只是改用整欄陣列運算，
+    不再對每一筆資料呼叫一次 Python 函式。
+
+    參數說明:
+    open_prices, high_prices, low_prices, close_prices : array-like
+        長度相同的開高低收價格序列（可為 pd.Series 或 numpy.ndarray）
+
+    返回:
+    numpy.ndarray - 每筆資料的狀態碼 (int64)，代碼定義同 get_k_type
+    """
+    o = np.asarray(open_prices, dtype=np.float64)
+    h = np.asarray(high_prices, dtype=np.float64)
+    l = np.asarray(low_prices, dtype=np.float64)
+    c = np.asarray(close_prices, dtype=np.float64)
+
+    # 核心指標計算（NaN 會在無效數據條件中優先被排除）
+    body = c - o
+    body_size = np.abs(body)
+    upper_shadow = h - np.maximum(o, c)
+    lower_shadow = np.minimum(o, c) - l
+    total_range = h - l
+    is_bullish = body > 0
+
+    # 防除零處理：total_range=0 時 body_ratio=0
+    body_ratio = np.zeros_like(total_range)
+    np.divide(body_size, total_range, out=body_ratio, where=total_range != 0)
+
+    # 異常數據：缺失值、最高價低於最低價、開盤/收盤超出高低範圍
+    invalid = (
+        np.isnan(o) | np.isnan(h) | np.isnan(l) | np.isnan(c)
+        | (h < l)
+        | (o > h) | (o < l) | (c > h) | (c < l)
+    )
+
+    # np.select 會採用第一個成立的條件，順序即為逐筆版本的判斷優先順序
+    conditions = [
+        invalid,                                                                   # 無效數據
+        h == l,                                                                    # 一字線
+        (o == l) & (c >= h * 0.95),                                                # 大陽線
+        (o == h) & (c <= l * 1.05),                                                # 大陰線
+        (upper_shadow >= 1.8 * body_size) & (lower_shadow <= 0.5 * body_size),     # 倒鎚線
+        (lower_shadow >= 1.8 * body_size) & (upper_shadow <= 0.5 * body_size),     # 鎚子線
+        (0.2 < body_ratio) & (body_ratio < 0.4)
+        & (np.abs(upper_shadow - lower_shadow) < 0.3 * total_range),               # 紡錘線
+        (body_ratio < 0.2) & (total_range > 0),                                    # 十字線
+    ]
+    choices = [
+        0,
+        5,
+        2,
+        9,
+        np.where(is_bullish, 3, 7),
+        np.where(is_bullish, 1, 8),
+        np.where(is_bullish, 4, 6),
+        5,
+    ]
+
+    # 最終回退機制：根據陰陽線返回對應紡錘線
+    return np.select(conditions, choices, default=np.where(is_bullish, 4, 6)).astype(np.int64)
+
+
+def add_k_type_columns(df):
+    """在資料表加上 k_status、k-1_status、k-2_status 三個 K 棒型態欄位
+
+    參數:
+    df : DataFrame - 需包含 open, high, low, close 四個價格欄位
+
+    返回:
+    df : DataFrame - 原資料表（直接新增欄位）
+    """
+    # 應用型態判斷
+    df['k_status'] = get_k_types(df['open'], df['high'], df['low'], df['close'])
+
+    # 新增歷史狀態欄位，前兩日不存在的狀態填 0 (無效數據)
+    df['k-1_status'] = df['k_status'].shift(1, fill_value=0)  # 前一日狀態
+    df['k-2_status'] = df['k_status'].shift(2, fill_value=0)  # 前兩日狀態
+    return df
+
+
+def random_ohlc(rows, seed=0):
+    """產生隨機開高低收資料，涵蓋一字線、開盤即最高/最低、缺失值與異常數據等邊界情況"""
+    rng = np.random.default_rng(seed)
+
+    # 以 0.5 元為跳動單位，讓開盤=最高/最低等相等條件能實際出現
+    base = rng.integers(100, 1200, rows) * 0.5
+    o = base + rng.integers(-10, 11, rows) * 0.5
+    c = base + rng.integers(-10, 11, rows) * 0.5
+    h = np.maximum(o, c) + rng.integers(0, 6, rows) * 0.5
+    l = np.minimum(o, c) - rng.integers(0, 6, rows) * 0.5
+
+    # 加入一字線、缺失值與高低價顛倒的異常數據
+    flat = rng.random(rows) < 0.02
+    o[flat] = h[flat] = l[flat] = c[flat] = base[flat]
+    h[rng.random(rows) < 0.01] = np.nan
+    swapped = rng.random(rows) < 0.01
+    h[swapped], l[swapped] = l[swapped], h[swapped]
+
+    return pd.DataFrame({'open': o, 'high': h, 'low': l, 'close': c})
+
+
+if __name__ == "__main__":
+    import time
+
+    # 等價性檢查：隨機資料逐筆版本與向量化版本的結果必須完全相同
+    df = random_ohlc(200000, seed=42)
+    expected = df.apply(get_k_type, axis=1).to_numpy()
+    actual = get_k_types(df['open'], df['high'], df['low'], df['close'])
+    mismatch = np.flatnonzero(expected != actual)
+    print("各狀態碼筆數:", np.bincount(actual, minlength=10))
+    if len(mismatch):
+        print(df.iloc[mismatch[:10]].assign(expected=expected[mismatch[:10]], actual=actual[mismatch[:10]]))
+        raise SystemExit(f"向量化結果不一致：{len(mismatch)} 筆")
+    print("等價性檢查通過")
+
+    # 效能比較：10k / 100k / 1M 筆資料
+    for rows in (10_000, 100_000, 1_000_000):
+        df = random_ohlc(rows)
+
+        start = time.perf_counter()
+        df.apply(get_k_type, axis=1)
+        row_wise = time.perf_counter() - start
+
+        start = time.perf_counter()
+        get_k_types(df['open'], df['high'], df['low'], df['close'])
+        vectorized = time.perf_counter() - start
+
+        print(f"{rows:>9} 筆：逐筆 {row_wise:.3f}s，向量化 {vectorized:.4f}s，加速 {row_wise / vectorized:.0f} 倍")
@@ -0,0 +1,197 @@
+import numpy as np
+
+# 訓練時 fit 好的標準化轉換，與模型權重存在同一個檔案
+from intelligent_prediction_strategies.feature_pipeline import FeatureScaler
+
+
+# 模型檔案格式版本，格式改變時遞增
+ARTIFACT_FORMAT_VERSION = 1
+
+
+def _relu(x):
+    return np.maximum(x, 0)
+
+
+def _softmax(x):
+    # 先減去每列最大值避免 exp 溢位，結果與 Keras 的 softmax 相同
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+# Dense 層支援的激活函數
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': _relu,
+    'softmax': _softmax,
+    'sigmoid': _sigmoid,
+    'tanh': np.tanh,
+}
+
+
+class DenseNetwork:
+    """只用 NumPy 執行的全連接網路前向傳播
+
+    智慧預測的模型只有幾層 Dense（4/5 個輸入 → 64 → 32 → 3/5 類 softmax），
+    匯出權重後用矩陣乘法直接計算機率，預測時不必載入 TensorFlow，
+    也省去 model.predict 每次呼叫的框架開銷。提供與 keras.Model 相同的 predict(X) 介面。
+    """
+
+    def __init__(self, layers):
+        """
+        Args:
+            layers (list): [(kernel, bias, activation), ...]，kernel 形狀為 (輸入數, 輸出數)
+        """
+        self.layers = []
+        for kernel, bias, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"不支援的激活函數：{activation}")
+            # 與 Keras 相同使用 float32 計算
+            self.layers.append((np.asarray(kernel, dtype=np.float32), np.asarray(bias, dtype=np.float32), activation))
+
+    @classmethod
+    def from_keras(cls, model):
+        """從訓練好的 keras Sequential 模型取出每一層 Dense 的權重與激活函數"""
+        layers = []
+        for layer in model.layers:
+            weights = layer.get_weights()
+            if not weights:
+                continue  # Input、Dropout 等沒有權重的層在預測時不影響結果
+            config = layer.get_config()
+            if layer.__class__.__name__ != 'Dense':
+                raise ValueError(f"不支援的層：{layer.__class__.__name__}")
+            kernel = weights[0]
+            bias = weights[1] if config.get('use_bias', True) else np.zeros(kernel.shape[1], dtype=np.float32)
+            activation = config.get('activation', 'linear')
+            if not isinstance(activation, str):
+                raise ValueError(f"不支援的激活函數：{activation}")
+            layers.append((kernel, bias, activation))
+        return cls(layers)
+
+    @property
+    def input_size(self):
+        return self.layers[0][0].shape[0]
+
+    def predict(self, X, verbose=None):
+        """執行前向傳播，返回每一列的各類別機率 (shape: [samples, 類別數])"""
+        output = np.asarray(X, dtype=np.float32)
+        if output.ndim == 1:
+            output = output.reshape(1, -1)
+        for kernel, bias, activation in self.layers:
+            output = ACTIVATIONS[activation](output @ kernel + bias)
+        return output
+
+
+def save_artifact(path, network, scaler=None):
+    """把網路權重與標準化參數存成單一 .npz 檔案
+
+    Args:
+        path (str): 檔案路徑（.npz）
+        network (DenseNetwork): 要保存的網路
+        scaler (FeatureScaler): 訓練資料的標準化轉換
+    """
+    arrays = {
+        'version': np.array(ARTIFACT_FORMAT_VERSION),
+        'activations': np.array([activation for _, _, activation in network.layers]),
+    }
+    for i, (kernel, bias, _) in enumerate(network.layers):
+        arrays[f'kernel_{i}'] = kernel
+        arrays[f'bias_{i}'] = bias
+    if scaler is not None:
+        arrays['scaler_min'] = scaler.data_min
+        arrays['scaler_max'] = scaler.data_max
+        arrays['scaler_features'] = np.array(scaler.feature_names or [])
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_artifact(path):
+    """讀取 save_artifact 保存的檔案
+
+    Returns:
+        tuple: (DenseNetwork, FeatureScaler)，沒有保存標準化參數時 scaler 為 None
+
+    Raises:
+        ValueError: 檔案格式版本不符
+    """
+    with np.load(path, allow_pickle=False) as data:
+        if int(data['version']) != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(f"模型檔案格式版本不符：{int(data['version'])}")
+        activations = [str(activation) for activation in data['activations']]
+        network = DenseNetwork([
+            (data[f'kernel_{i}'], data[f'bias_{i}'], activation) for i, activation in enumerate(activations)
+        ])
+        scaler = None
+        if 'scaler_min' in data:
+            feature_names = [str(name) for name in data['scaler_features']] or None
+            scaler = FeatureScaler(feature_names, data['scaler_min'], data['scaler_max'])
+    return network, scaler
+
+
+def random_network(input_size, num_classes, seed=0):
+    """產生與智慧預測模型相同結構（輸入 → 64 → 32 → 類別數）的隨機權重網路"""
+    rng = np.random.default_rng(seed)
+    sizes = [input_size, 64, 32, num_classes]
+    activations = ['relu', 'relu', 'softmax']
+    return DenseNetwork([
+        (rng.normal(0, 0.5, (n_in, n_out)), rng.normal(0, 0.1, n_out), activation)
+        for n_in, n_out, activation in zip(sizes[:-1], sizes[1:], activations)
+    ])
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(42)
+    X = rng.random((1000, 5)).astype(np.float32)
+
+    # 等價性檢查：與 keras 的 model.predict 結果相同（沒有安裝 TensorFlow 時略過）
+    try:
+        import keras
+        from keras import layers
+    except ImportError:
+        keras = None
+        print("沒有安裝 keras，略過與 model.predict 的等價性檢查")
+
+    if keras is not None:
+        model = keras.Sequential([
+            layers.Input(shape=(5,)),
+            layers.Dense(64, activation='relu'),
+            layers.Dense(32, activation='relu'),
+            layers.Dense(5, activation='softmax'),
+        ])
+        network = DenseNetwork.from_keras(model)
+        expected = model.predict(X, verbose=0)
+        actual = network.predict(X)
+        print("最大機率誤差:", np.abs(expected - actual).max())
+        if not np.array_equal(expected.argmax(axis=1), actual.argmax(axis=1)):
+            raise SystemExit("預測類別與 model.predict 不一致")
+        if not np.allclose(expected, actual, atol=1e-6):
+            raise SystemExit("預測機率與 model.predict 不一致")
+        print("等價性檢查通過")
+
+        start = time.perf_counter()
+        for _ in range(100):
+            model.predict(X[:1], verbose=0)
+        print(f"model.predict 單筆：{(time.perf_counter() - start) * 10:.3f} ms")
+    else:
+        network = random_network(5, 5)
+
+    # 保存與讀取後結果必須完全相同
+    scaler = FeatureScaler(['open', 'high', 'low', 'close', 'volume'], np.zeros(5), np.ones(5))
+    path = os.path.join(tempfile.mkdtemp(), 'model.npz')
+    save_artifact(path, network, scaler)
+    loaded, loaded_scaler = load_artifact(path)
+    assert np.array_equal(loaded.predict(X), network.predict(X))
+    assert loaded_scaler.feature_names == scaler.feature_names
+    print(f"保存與讀取檢查通過，檔案大小 {os.path.getsize(path)} bytes")
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        network.predict(X[:1])
+    print(f"NumPy 前向傳播單筆：{(time.perf_counter() - start) / 10:.4f} ms")
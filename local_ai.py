@@ -1,7 +1,14 @@
-import requests
+import os
 import json
+import requests
 from dotenv import load_dotenv
 
+# 行程共用的 HTTP 用戶端（連線池、逾時、重試與斷路器）
+import http_client
+
+# 用戶狀態儲存（多個 worker 行程共用）
+import user_state_store
+
 # 初始化環境變數（用於管理API金鑰等敏感資訊）
 load_dotenv()
 
@@ -9,6 +16,9 @@ load_dotenv()
 # url = os.getenv('open_url') + "/api/chat"  # 外部API端點範例（需配合ngrok等反向代理工具）
 url = "http://localhost:11434/api/chat"  # 本地Ollama API端點（需保持ollama的草尼馬在右下角出現持續運行）
 
+# 本地模型生成回應可能較久，讀取逾時另外設定（連線逾時沿用共用設定）
+timeout = (float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')), float(os.getenv('LOCAL_AI_TIMEOUT', '120')))
+
 class ChatLimiter:
     """對話歷史狀態管理類別
     
@@ -19,27 +29,11 @@ class ChatLimiter:
     - 以 user_id 為鍵值，確保多用戶狀態獨立互不干擾
     """
 
-    def __init__(self):
-        # 用字典管理多用戶狀態，key 是 user_id，value 是該用戶的狀態字典
-        # 狀態字典包含：
-        #   'history_restore' (bool): 是否需要重置對話歷史，True 表示需要重置
-        #   'chat_history' (list): 該用戶的對話歷史記錄，為一個訊息字典列表
-        self.user_states = {}
-
-    def _init_user_state(self, user_id):
-        """
-        初始化指定用戶的狀態字典
-        如果 user_id 尚未存在於 user_states 中，則建立預設狀態：
-            - history_restore 設為 True，表示預設需要重置對話歷史
-            - chat_history 設為空列表，表示尚無歷史訊息
-        參數：
-            user_id (str): 用戶唯一識別ID
-        """
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {
-                'history_restore': True,
-                'chat_history': []
-            }
+    def __init__(self, store=None):
+        # 用戶狀態儲存（多個 worker 行程共用），每位用戶存放：
+        #   'local_ai.history_restore' (bool): 是否需要重置對話歷史，True 表示需要重置（預設 True）
+        #   'local_ai.chat_history' (list): 該用戶的對話歷史記錄，為一個訊息字典列表（預設空列表）
+        self._store = store or user_state_store.user_state_store
 
     def is_history_restore(self, user_id) -> bool:
         """
@@ -51,8 +45,7 @@ class ChatLimiter:
         回傳：
             bool: True 表示該用戶的對話歷史需要重置，False 表示保持現有歷史
         """
-        self._init_user_state(user_id)
-        return self.user_states[user_id]['history_restore']
+        return self._store.get(user_id, 'local_ai.history_restore', True)
 
     def set_history_restore(self, user_id, value: bool):
         """
@@ -62,8 +55,7 @@ class ChatLimiter:
             user_id (str): 用戶唯一識別ID
             value (bool): True 表示需要重置，False 表示不需重置
         """
-        self._init_user_state(user_id)
-        self.user_states[user_id]['history_restore'] = value
+        self._store.set(user_id, 'local_ai.history_restore', value)
 
     def get_chat_history(self, user_id):
         """
@@ -75,8 +67,7 @@ class ChatLimiter:
         回傳：
             list: 該用戶的對話歷史訊息列表，每筆訊息為字典（如 {"role": "user", "content": "..."}）
         """
-        self._init_user_state(user_id)
-        return self.user_states[user_id]['chat_history']
+        return self._store.get(user_id, 'local_ai.chat_history', [])
 
     def set_chat_history(self, user_id, history):
         """
@@ -86,8 +77,7 @@ class ChatLimiter:
             user_id (str): 用戶唯一識別ID
             history (list): 新的對話歷史訊息列表，通常為字典列表
         """
-        self._init_user_state(user_id)
-        self.user_states[user_id]['chat_history'] = history
+        self._store.set(user_id, 'local_ai.chat_history', history)
 
 # 全局狀態管理實例（單例模式）
 chat_limiter = ChatLimiter()
@@ -135,24 +125,30 @@ def ai_chat(user_input="你好", system="妳是妹妹", reset_input="r", user_id
         {"role": "user", "content": user_input}  # 當前用戶輸入
     ]
     
-    # API請求構造
-    response = requests.post(
-        url,
-        json={
-            "model": "gemma3:1b",  # 模型選擇 llama2-uncensored:latest, gemma3:1b （可選）
-            "messages": messages,  # 完整對話上下文
-            "stream": False,  # 禁用流式響應，禁用一個字一個字回復（簡化處理邏輯）
-            "options": {  # 生成參數
-                "temperature": 0.7,  # 創造性控制（0=嚴謹，1=創意）
-                "max_tokens": 100  # 最大輸出長度（約70-100漢字）
+    # API請求構造（共用保持連線的 session，含逾時；連線失敗時重試）
+    try:
+        response = http_client.http_client.post(
+            url,
+            timeout=timeout,
+            json={
+                "model": "gemma3:1b",  # 模型選擇 llama2-uncensored:latest, gemma3:1b （可選）
+                "messages": messages,  # 完整對話上下文
+                "stream": False,  # 禁用流式響應，禁用一個字一個字回復（簡化處理邏輯）
+                "options": {  # 生成參數
+                    "temperature": 0.7,  # 創造性控制（0=嚴謹，1=創意）
+                    "max_tokens": 100  # 最大輸出長度（約70-100漢字）
+                }
             }
-        }
-    )
+        )
+    except requests.exceptions.RequestException as e:
+        # 本地模型沒有啟動、逾時或斷路器開啟中，不寫入對話歷史
+        print(f"本地模型連線失敗：{e}")
+        return "發生錯誤，請稍後再試"
     
     # 響應處理
     try:
         ai_reply = json.loads(response.text)['message']['content']
-    except KeyError as e:
+    except (KeyError, ValueError) as e:
         print(f"API響應解析錯誤：{e}")
         ai_reply = "發生錯誤，請稍後再試"
 
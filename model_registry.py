@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（模型目錄與容量設定）
+load_dotenv()
+
+
+class ModelRegistry:
+    """訓練好的模型登錄庫，負責以下功能：
+    - 以 (策略, 股票代碼, 訓練次數, 訓練資料指紋) 為鍵保存模型與對應的 scaler
+    - 模型匯出成 NumPy 權重檔，讀取與預測都不需要載入 TensorFlow
+    - 相同條件再次預測時直接取用，不必重新訓練
+    - 依最久未使用 (LRU) 與總容量上限淘汰舊模型；批次預訓練的模型不計入數量上限，只在超過總容量時最後才淘汰
+    - 同一策略與股票的訓練資料改變（新的日K進來）時，舊指紋的模型自動作廢
+    """
+
+    def __init__(self, registry_dir, max_entries=200, max_bytes=512 * 1024 * 1024, memory_entries=16):
+        """
+        Args:
+            registry_dir (str): 模型保存的根目錄
+            max_entries (int): 最多保存的模型數（不含批次預訓練的模型）
+            max_bytes (int): 所有模型檔案的總容量上限
+            memory_entries (int): 在記憶體中保留已載入模型的數量
+        """
+        self.registry_dir = registry_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+
+        self._index = None               # key: 模型鍵值, value: 描述資料（延遲到第一次使用才掃描目錄）
+        self._loaded = OrderedDict()     # 已載入記憶體的模型，key: 模型鍵值, value: (DenseNetwork, scaler)
+        self._lock = threading.RLock()
+        self._counters = {'hits': 0, 'misses': 0, 'puts': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def fingerprint(X_train, y_train):
+        """計算訓練資料的指紋，資料內容（含新增的日K）有任何改變時指紋都會不同"""
+        digest = hashlib.sha1()
+        for array in (np.asarray(X_train), np.asarray(y_train)):
+            array = np.ascontiguousarray(array)
+            digest.update(str((array.shape, array.dtype.str)).encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(strategy, ticker, epochs, fingerprint):
+        """組成模型鍵值（同時作為目錄名稱）"""
+        return '__'.join([strategy, re.sub(r'[^0-9A-Za-z._-]', '_', ticker), f'e{epochs}', fingerprint[:16]])
+
+    def _load_index(self):
+        """掃描模型目錄建立索引（呼叫端需持有鎖）"""
+        if self._index is not None:
+            return self._index
+        self._index = {}
+        if os.path.isdir(self.registry_dir):
+            for key in os.listdir(self.registry_dir):
+                if '.tmp-' in key:
+                    continue  # 其他行程正在寫入的暫存目錄
+                meta = self._read_meta(key)
+                if meta is None:
+                    # 沒有描述檔代表已損毀，直接清除
+                    shutil.rmtree(os.path.join(self.registry_dir, key), ignore_errors=True)
+                else:
+                    self._index[key] = meta
+        return self._index
+
+    def _remove(self, key):
+        """移除指定模型（呼叫端需持有鎖）"""
+        self._index.pop(key, None)
+        self._loaded.pop(key, None)
+        shutil.rmtree(os.path.join(self.registry_dir, key), ignore_errors=True)
+
+    def _evict(self):
+        """依最久未使用順序淘汰模型，直到數量與容量都在上限內（呼叫端需持有鎖）
+
+        批次預訓練的模型每檔股票與策略各一份，新的日K進來時會被新指紋的模型取代，數量不會無限成長，
+        因此不計入數量上限；超過總容量時先淘汰用戶訓練的模型，仍超過才淘汰預訓練的模型。
+        """
+        by_last_used = sorted(self._index, key=lambda key: (self._index[key].get('pretrained', False),
+                                                              self._index[key]['last_used']))
+        count = sum(1 for meta in self._index.values() if not meta.get('pretrained', False))
+        total_bytes = sum(meta['size'] for meta in self._index.values())
+        while by_last_used and (count > self.max_entries or total_bytes > self.max_bytes):
+            key = by_last_used.pop(0)
+            meta = self._index[key]
+            if meta.get('pretrained', False) and total_bytes <= self.max_bytes:
+                break
+            if not meta.get('pretrained', False):
+                count -= 1
+            total_bytes -= meta['size']
+            self._remove(key)
+            self._counters['evictions'] += 1
+
+    def get(self, strategy, ticker, epochs, fingerprint):
+        """取得已訓練的模型
+
+        Returns:
+            tuple: (DenseNetwork, scaler)，沒有符合的模型時回傳 None；
+                   DenseNetwork 提供與 keras 模型相同的 predict 介面
+        """
+        key = self.make_key(strategy, ticker, epochs, fingerprint)
+        with self._lock:
+            index = self._load_index()
+            meta = index.get(key)
+            if meta is None:
+                # 可能是其他行程（例如批次預訓練）之後才寫入的模型
+                meta = self._read_meta(key)
+                if meta is not None:
+                    index[key] = meta
+            if meta is None or meta['fingerprint'] != fingerprint:
+                self._counters['misses'] += 1
+                return None
+
+            if key in self._loaded:
+                meta['last_used'] = time.time()
+                self._counters['hits'] += 1
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+
+            try:
+                entry = self._read(key)
+            except (OSError, ValueError) as e:
+                # 模型檔案已被其他行程移除或損毀，視為沒有快取
+                print(f"[ModelRegistry] 載入模型 {key} 失敗：", e)
+                self._remove(key)
+                self._counters['misses'] += 1
+                return None
+
+            meta['last_used'] = time.time()
+            self._counters['hits'] += 1
+            self._loaded[key] = entry
+            if len(self._loaded) > self.memory_entries:
+                self._loaded.popitem(last=False)
+            return entry
+
+    def _read_meta(self, key):
+        """讀取指定模型的描述檔，不存在時回傳 None"""
+        try:
+            with open(os.path.join(self.registry_dir, key, 'meta.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read(self, key):
+        """從磁碟載入模型與 scaler（只用 NumPy，不載入 TensorFlow）"""
+        from intelligent_prediction_strategies import numpy_inference
+        return numpy_inference.load_artifact(os.path.join(self.registry_dir, key, 'model.npz'))
+
+    def put(self, strategy, ticker, epochs, fingerprint, model, scaler=None, pretrained=False):
+        """保存訓練好的模型，並作廢同一策略與股票下訓練資料已過時的模型
+
+        Args:
+            model: 訓練好的 keras 模型或 DenseNetwork，保存時匯出成 NumPy 權重
+            scaler (FeatureScaler): 訓練資料的標準化轉換
+            pretrained (bool): 是否為批次預訓練的模型（不計入數量上限）
+        """
+        from intelligent_prediction_strategies import numpy_inference
+        network = model
+        if not isinstance(model, numpy_inference.DenseNetwork):
+            network = numpy_inference.DenseNetwork.from_keras(model)
+
+        key = self.make_key(strategy, ticker, epochs, fingerprint)
+        directory = os.path.join(self.registry_dir, key)
+        tmp_directory = directory + f'.tmp-{os.getpid()}-{threading.get_ident()}'
+
+        # 先寫到暫存目錄，寫完才改名，避免其他行程讀到寫一半的模型
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        numpy_inference.save_artifact(os.path.join(tmp_directory, 'model.npz'), network, scaler)
+
+        size = sum(os.path.getsize(os.path.join(tmp_directory, name)) for name in os.listdir(tmp_directory))
+        now = time.time()
+        meta = {
+            'strategy': strategy,
+            'ticker': ticker,
+            'epochs': epochs,
+            'fingerprint': fingerprint,
+            'created_at': now,
+            'last_used': now,
+            'size': size,
+            'pretrained': pretrained,
+        }
+        with open(os.path.join(tmp_directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        with self._lock:
+            index = self._load_index()
+            # 同鍵值的模型（可能由其他行程寫入）直接以新模型取代
+            self._remove(key)
+            os.replace(tmp_directory, directory)
+            index[key] = meta
+            self._loaded[key] = (network, scaler)
+            if len(self._loaded) > self.memory_entries:
+                self._loaded.popitem(last=False)
+            self._counters['puts'] += 1
+
+            # 同一策略與股票的舊訓練資料模型已過時（新的日K已進來），直接作廢
+            for other_key, other_meta in list(index.items()):
+                if (other_meta['strategy'] == strategy and other_meta['ticker'] == ticker
+                        and other_meta['fingerprint'] != fingerprint):
+                    self._remove(other_key)
+                    self._counters['invalidations'] += 1
+
+            self._evict()
+
+    def invalidate(self, ticker=None, strategy=None):
+        """作廢符合條件的模型，不指定條件則清空全部"""
+        with self._lock:
+            index = self._load_index()
+            for key, meta in list(index.items()):
+                if (ticker is None or meta['ticker'] == ticker) and (strategy is None or meta['strategy'] == strategy):
+                    self._remove(key)
+                    self._counters['invalidations'] += 1
+
+    def contains(self, strategy, ticker, epochs, fingerprint, pretrained=False):
+        """檢查磁碟上是否有指定的模型（會重新讀取描述檔，其他行程寫入或淘汰的結果也會反映）
+
+        Args:
+            pretrained (bool): 只算標記為批次預訓練的模型
+        """
+        key = self.make_key(strategy, ticker, epochs, fingerprint)
+        meta = self._read_meta(key)
+        if meta is None or meta['fingerprint'] != fingerprint:
+            return False
+        return not pretrained or meta.get('pretrained', False)
+
+    def stats(self):
+        """回傳模型登錄庫統計數據"""
+        with self._lock:
+            index = self._load_index()
+            return {
+                **self._counters,
+                'entries': len(index),
+                'pretrained_entries': sum(1 for meta in index.values() if meta.get('pretrained', False)),
+                'bytes': sum(meta['size'] for meta in index.values()),
+                'loaded_in_memory': len(self._loaded),
+            }
+
+
+# 實例化模型登錄庫
+model_registry = ModelRegistry(
+    registry_dir=os.getenv('MODEL_REGISTRY_DIR', os.path.join('cache', 'models')),
+    max_entries=int(os.getenv('MODEL_REGISTRY_MAX_ENTRIES', '200')),
+    max_bytes=int(os.getenv('MODEL_REGISTRY_MAX_MB', '512')) * 1024 * 1024,
+    memory_entries=int(os.getenv('MODEL_REGISTRY_MEMORY_ENTRIES', '16')),
+)
@@ -0,0 +1,223 @@
+import os
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from dotenv import load_dotenv
+
+# 模型登錄庫（訓練好的模型保存在共用目錄，web 行程之後可以直接讀取 NumPy 權重預測）
+import model_registry
+
+# 載入 .env 檔案中的環境變數（預測模式、預測 worker 位址與金鑰設定）
+load_dotenv()
+
+
+# local: 在目前行程中訓練與預測；remote: 交給獨立的預測 worker 行程，web 行程不載入 TensorFlow
+PREDICTION_MODE = os.getenv('PREDICTION_MODE', 'local')
+
+# 已知的策略模組（策略名稱對應 intelligent_prediction_strategies 中的模組）
+STRATEGY_MODULE_TEMPLATE = 'intelligent_prediction_strategies.{}_intelligent_prediction'
+
+# 載入後代表行程已經含有機器學習套件（用來確認 web 行程沒有載入）
+ML_MODULES = ('tensorflow', 'keras', 'tensorboard', 'matplotlib')
+
+
+class PredictionServiceError(Exception):
+    """預測 worker 無法連線、逾時或訓練失敗"""
+
+
+def parse_address(address):
+    """'host:port' 轉成 TCP 位址，其他字串視為 Unix socket 路徑"""
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def train_and_predict(strategy, ticker, epochs, fingerprint, X_train, y_train, scaler):
+    """訓練模型、保存到模型登錄庫並預測明日漲跌（需要 TensorFlow，只在訓練用的行程執行）
+
+    Returns:
+        str: 預測結果的文字描述
+    """
+    import importlib
+    strategy_module = importlib.import_module(STRATEGY_MODULE_TEMPLATE.format(strategy))
+
+    # 啟動模型訓練
+    model = strategy_module.train_model(
+        X_train,
+        y_train,
+        epochs=epochs,
+        batch_size=5,
+        validation_split=0.25
+    )
+
+    # 保存到模型登錄庫，之後相同條件的請求可以直接使用（保存失敗不影響本次預測）
+    try:
+        model_registry.model_registry.put(strategy, ticker, epochs, fingerprint, model, scaler)
+    except Exception as e:
+        print("保存模型失敗：", e)
+
+    # 獲取最新股價數據並提取特徵數據，執行預測並轉換預測結果為文字描述
+    stock_data_today_df = strategy_module.fetch_stock_data_today(ticker)
+    X_test = stock_data_today_df[strategy_module.SPEC.feature_columns]
+    predictions = strategy_module.prediction(model, scaler, X_test)
+    return strategy_module.convert_status(predictions)
+
+
+class PredictionServer:
+    """預測 worker（獨立行程），負責以下功能：
+    - 透過本地 IPC（Unix socket 或 localhost TCP，以金鑰驗證）接收 web 行程送來的訓練請求
+    - 只有這個行程載入 TensorFlow/Keras，web、報價與聊天行程維持精簡
+    - 同時訓練的數量上限為 max_concurrency，其餘請求等待
+    """
+
+    def __init__(self, address, authkey, max_concurrency=1):
+        """
+        Args:
+            address (str | tuple): Unix socket 路徑或 (host, port)
+            authkey (bytes): 連線驗證金鑰
+            max_concurrency (int): 同時進行的訓練數
+        """
+        self.address = address
+        self.authkey = authkey
+        self._slots = threading.Semaphore(max_concurrency)
+
+    def serve_forever(self):
+        if isinstance(self.address, str):
+            directory = os.path.dirname(self.address)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(self.address):
+                os.remove(self.address)  # 上次未正常結束留下的 socket 檔
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"[PredictionServer] 開始接收訓練請求：{self.address}")
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    # 金鑰錯誤等連線失敗只影響該連線
+                    print("[PredictionServer] 接受連線失敗：", e)
+                    continue
+                threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection):
+        with connection:
+            try:
+                request = connection.recv()
+            except (EOFError, OSError):
+                return
+            with self._slots:
+                try:
+                    result = train_and_predict(**request)
+                except Exception as e:
+                    print(f"[PredictionServer] {request.get('ticker')} 訓練失敗：", e)
+                    response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+                else:
+                    response = {'ok': True, 'result': result}
+            try:
+                connection.send(response)
+            except (EOFError, OSError) as e:
+                # web 行程已經放棄等待，模型仍已保存在登錄庫
+                print("[PredictionServer] 回傳結果失敗：", e)
+
+
+class PredictionService:
+    """訓練與預測的進入點，依 PREDICTION_MODE 在本行程執行或交給預測 worker，並記錄統計數據"""
+
+    def __init__(self, mode, address, authkey, timeout=3600):
+        """
+        Args:
+            mode (str): 'local' 或 'remote'
+            address (str | tuple): 預測 worker 的位址（remote 模式使用）
+            authkey (bytes): 連線驗證金鑰
+            timeout (float): 等待預測 worker 回傳結果的最長秒數
+        """
+        if mode not in ('local', 'remote'):
+            raise ValueError(f"未知的預測模式：{mode}")
+        self.mode = mode
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'failed': 0, 'unavailable': 0, 'timeouts': 0, 'total_seconds': 0.0}
+
+    def _request_remote(self, request):
+        try:
+            connection = Client(self.address, authkey=self.authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            with self._lock:
+                self._counters['unavailable'] += 1
+            raise PredictionServiceError(f"無法連線到預測 worker {self.address}：{e}") from e
+        with connection:
+            connection.send(request)
+            if not connection.poll(self.timeout):
+                with self._lock:
+                    self._counters['timeouts'] += 1
+                raise PredictionServiceError(f"預測 worker 超過 {self.timeout} 秒沒有回應")
+            response = connection.recv()
+        if not response['ok']:
+            raise PredictionServiceError(response['error'])
+        return response['result']
+
+    def train_and_predict(self, strategy, ticker, epochs, fingerprint, X_train, y_train, scaler):
+        """訓練模型並回傳預測結果的文字描述（remote 模式下會阻塞到預測 worker 完成，請在背景執行緒呼叫）"""
+        request = {
+            'strategy': strategy, 'ticker': ticker, 'epochs': epochs, 'fingerprint': fingerprint,
+            'X_train': X_train, 'y_train': y_train, 'scaler': scaler,
+        }
+        started = time.monotonic()
+        with self._lock:
+            self._counters['requests'] += 1
+        try:
+            if self.mode == 'remote':
+                return self._request_remote(request)
+            return train_and_predict(**request)
+        except Exception:
+            with self._lock:
+                self._counters['failed'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._counters['total_seconds'] += time.monotonic() - started
+
+    def stats(self):
+        """回傳預測服務統計數據"""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'ml_stack_imported': sorted(name for name in ML_MODULES if name in sys.modules),
+                **self._counters,
+            }
+
+
+# 預測 worker 的位址與金鑰（未設定金鑰時使用 channel secret，兩個行程讀取同一份 .env）
+PREDICTION_SERVICE_ADDRESS = parse_address(os.getenv('PREDICTION_SERVICE_ADDRESS', 'data/prediction.sock'))
+PREDICTION_SERVICE_AUTHKEY = (os.getenv('PREDICTION_SERVICE_AUTHKEY') or os.getenv('YOUR_CHANNEL_SECRET') or '').encode() or None
+
+# 實例化訓練與預測的進入點
+prediction_service = PredictionService(
+    mode=PREDICTION_MODE,
+    address=PREDICTION_SERVICE_ADDRESS,
+    authkey=PREDICTION_SERVICE_AUTHKEY,
+    timeout=float(os.getenv('PREDICTION_SERVICE_TIMEOUT', '3600')),
+)
+
+
+if __name__ == "__main__":
+    # 獨立的預測 worker：python prediction_service.py（web 行程設定 PREDICTION_MODE=remote）
+    import warmup
+    for name in ('matplotlib', 'kbar', 'keras'):
+        func, _ = warmup.WARMUP_STEPS[name]
+        try:
+            func()
+        except Exception as e:
+            print(f"[PredictionServer] 預熱步驟 {name} 失敗：", e)
+
+    PredictionServer(
+        PREDICTION_SERVICE_ADDRESS,
+        PREDICTION_SERVICE_AUTHKEY,
+        max_concurrency=int(os.getenv('PREDICTION_WORKER_CONCURRENCY', '1')),
+    ).serve_forever()
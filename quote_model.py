@@ -0,0 +1,150 @@
+"""即時報價的數值資料結構與回覆文字格式
+
+證交所回傳的報價欄位全部是字串（五檔以 _ 分隔），這裡解析一次成數字，
+單檔查詢直接用 Quote 物件產生回覆文字，只有大量資料分析時才轉成資料表。
+"""
+
+
+def _to_float(value):
+    """把報價欄位轉成數字，'-'、空字串等沒有資料時回傳 None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    number = _to_float(value)
+    return None if number is None else int(number)
+
+
+def _to_levels(value, parse):
+    """把以 _ 分隔的五檔字串（結尾多一個 _）轉成數字 tuple（'-' 轉成 None，保持價量對齊）"""
+    if not value:
+        return ()
+    return tuple(parse(item) for item in value.split('_') if item)
+
+
+def format_price(value):
+    """價格最多顯示到小數第二位，去掉多餘的 0（605.0000 顯示為 605）"""
+    if value is None:
+        return '-'
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
+
+
+def format_volume(value):
+    return '-' if value is None else f'{value:,}'
+
+
+class Quote:
+    """單檔股票的即時報價（價格為 float、成交量為 int，沒有資料時為 None）"""
+
+    __slots__ = (
+        'code', 'name', 'full_name', 'exchange', 'date', 'time', 'trade_time',
+        'trade_price', 'trade_volume', 'volume', 'open', 'high', 'low', 'prev_close',
+        'limit_up', 'limit_down', 'ask_prices', 'ask_volumes', 'bid_prices', 'bid_volumes',
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_mis(cls, raw):
+        """由證交所 getStockInfo 回傳的原始報價 dict 建立"""
+        return cls(
+            code=raw.get('c'),
+            name=raw.get('n'),
+            full_name=raw.get('nf'),
+            exchange=raw.get('ex'),
+            date=raw.get('d'),
+            time=raw.get('t'),
+            trade_time=raw.get('ot'),
+            trade_price=_to_float(raw.get('z')),
+            trade_volume=_to_int(raw.get('tv')),
+            volume=_to_int(raw.get('v')),
+            open=_to_float(raw.get('o')),
+            high=_to_float(raw.get('h')),
+            low=_to_float(raw.get('l')),
+            prev_close=_to_float(raw.get('y')),
+            limit_up=_to_float(raw.get('u')),
+            limit_down=_to_float(raw.get('w')),
+            ask_prices=_to_levels(raw.get('a'), _to_float),
+            ask_volumes=_to_levels(raw.get('f'), _to_int),
+            bid_prices=_to_levels(raw.get('b'), _to_float),
+            bid_volumes=_to_levels(raw.get('g'), _to_int),
+        )
+
+    @property
+    def price(self):
+        """目前價格：有成交價用成交價，本盤尚未成交時用最佳買價"""
+        if self.trade_price is not None:
+            return self.trade_price
+        return self.bid_prices[0] if self.bid_prices else None
+
+    @property
+    def change_pct(self):
+        """相對昨收價的漲跌幅（%），沒有價格或昨收價時為 None"""
+        price = self.price
+        if price is None or not self.prev_close:
+            return None
+        return (price - self.prev_close) / self.prev_close * 100
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f'Quote({self.code} {self.name} price={self.price} volume={self.volume})'
+
+
+def format_details(quote):
+    """「詳細資料」回覆文字"""
+    change_pct = quote.change_pct
+    lines = [
+        f'{quote.code} {quote.name or ""}'.strip(),
+        f'公司全名：{quote.full_name or "-"}',
+        f'市場：{"上市" if quote.exchange == "tse" else "上櫃" if quote.exchange == "otc" else "-"}',
+        f'當盤成交價：{format_price(quote.price)}',
+        f'漲跌幅：{"-" if change_pct is None else f"{change_pct:+.2f}%"}',
+        f'當盤成交量：{format_volume(quote.trade_volume)}',
+        f'累積成交量：{format_volume(quote.volume)}',
+        f'開盤：{format_price(quote.open)}',
+        f'最高：{format_price(quote.high)}',
+        f'最低：{format_price(quote.low)}',
+        f'昨收價：{format_price(quote.prev_close)}',
+        f'漲停價：{format_price(quote.limit_up)}',
+        f'跌停價：{format_price(quote.limit_down)}',
+        f'最近交易日：{quote.date or "-"}',
+        f'最近成交時刻：{quote.trade_time or quote.time or "-"}',
+    ]
+    return '\n'.join(lines)
+
+
+def format_last_trade(quote):
+    """「當盤成交價」回覆文字"""
+    return (
+        f'當盤成交價：{format_price(quote.price)}\n'
+        f'當盤成交量：{format_volume(quote.trade_volume)}'
+    )
+
+
+def format_order_book(quote):
+    """「最佳五檔」回覆文字（賣價由高到低排在上方，買價由高到低排在下方）"""
+    lines = [f'{quote.code} {quote.name or ""} 最佳五檔'.strip(), '價格　　數量']
+    asks = list(zip(quote.ask_prices, quote.ask_volumes))
+    for level, (price, volume) in reversed(list(enumerate(asks, 1))):
+        lines.append(f'賣{level}　{format_price(price)}　{format_volume(volume)}')
+    lines.append('──────')
+    for level, (price, volume) in enumerate(zip(quote.bid_prices, quote.bid_volumes), 1):
+        lines.append(f'買{level}　{format_price(price)}　{format_volume(volume)}')
+    if not asks and not quote.bid_prices:
+        lines.append('目前沒有五檔資料')
+    return '\n'.join(lines)
+
+
+def quotes_to_dataframe(quotes):
+    """把多筆 Quote 轉成以股票代號為索引的數值資料表（大量資料分析用）"""
+    import pandas as pd
+    df = pd.DataFrame([quote.to_dict() for quote in quotes], columns=list(Quote.__slots__))
+    return df.set_index('code')
+
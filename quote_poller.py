@@ -0,0 +1,273 @@
+import fcntl
+import os
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（輪詢間隔、提醒設定與 LINE 存取權杖）
+load_dotenv()
+
+import WebCrawler_MIS_TWSE
+import quote_model
+import twse_calendar
+import watchlist
+
+
+# LINE multicast 每次最多傳送的用戶數
+MULTICAST_MAX_RECIPIENTS = 500
+
+
+class _SymbolState:
+    """單一股票的輪詢狀態（上一次的價格、成交量與今天已觸發的提醒）"""
+
+    def __init__(self, volume_window):
+        self.last_price = None
+        self.last_volume = None
+        self.volume_deltas = deque(maxlen=volume_window)  # 最近幾次輪詢期間的成交量
+        self.trading_day = None
+        self.fired_today = set()       # 今天已觸發的 (條件種類, 門檻值)，漲跌幅與爆量每天只提醒一次
+        self.last_cross_alert = {}     # key: (條件種類, 門檻值), value: 上次穿越提醒的時間
+
+
+class QuotePoller:
+    """盤中自選股輪詢器，負責以下功能：
+    - 交易時段內依固定間隔，以批次請求查詢所有用戶自選股的聯集（同一檔股票不論幾人追蹤只查一次）
+    - 判斷價格漲破/跌破、漲跌幅、成交量爆量等提醒條件
+    - 相同條件的用戶合併成一次 multicast 推播，只有一人時用 push
+    - 收盤後與休市日停止輪詢，等到下一次開盤
+    - 多個 worker 行程都啟動輪詢器時，以檔案鎖選出一個行程輪詢，其餘待命，
+      輪詢的行程結束後由待命的行程接手，不會重複推播
+    """
+
+    def __init__(self, store, interval=10, volume_window=20, volume_min_samples=5, cross_cooldown=300,
+                 lock_path=None, standby_interval=60):
+        """
+        Args:
+            store (watchlist.WatchlistStore): 自選股
+            interval (float): 盤中輪詢間隔秒數
+            volume_window (int): 計算平均成交量時參考的輪詢次數
+            volume_min_samples (int): 累積幾次輪詢的成交量後才開始判斷爆量
+            cross_cooldown (float): 價格在門檻附近來回穿越時，同一條件再次提醒的最短間隔秒數
+            lock_path (str): 選出輪詢行程的檔案鎖路徑（預設為自選股檔案旁的 .poller.lock，
+                需放在所有 worker 共用的檔案系統上）
+            standby_interval (float): 待命的行程多少秒嘗試接手一次
+        """
+        self.store = store
+        self.interval = interval
+        self.volume_window = volume_window
+        self.volume_min_samples = volume_min_samples
+        self.cross_cooldown = cross_cooldown
+        self.lock_path = lock_path or f'{store.path}.poller.lock'
+        self.standby_interval = standby_interval
+
+        self._states = {}  # key: 股票代號, value: _SymbolState
+        self._counters = {'polls': 0, 'symbols_polled': 0, 'alerts': 0, 'messages_sent': 0, 'push_failures': 0, 'poll_failures': 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._leader_file = None  # 持有檔案鎖的檔案，保持開啟直到行程結束
+        self._leader_pid = None
+
+    def start(self):
+        """啟動背景輪詢執行緒（重複呼叫不會重複啟動，fork 後在新行程重新啟動）"""
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='quote-poller', daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+
+    def _acquire_leader(self):
+        """嘗試以非阻塞的檔案鎖成為輪詢行程，回傳目前行程是否持有鎖"""
+        if self._leader_file is not None:
+            if self._leader_pid == os.getpid():
+                return True
+            # fork 前由父行程取得的鎖屬於父行程，子行程關閉繼承的檔案後自己競爭
+            self._leader_file.close()
+            self._leader_file = None
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.lock_path, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._leader_file = lock_file
+        self._leader_pid = os.getpid()
+        print(f"[QuotePoller] 行程 {os.getpid()} 負責盤中自選股輪詢")
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                leader = self._acquire_leader()
+            except OSError as e:
+                print("[QuotePoller] 無法建立輪詢鎖檔案：", e)
+                leader = False
+            if not leader:
+                # 其他行程正在輪詢：待命，定期嘗試接手
+                self._stop.wait(self.standby_interval)
+                continue
+
+            calendar = twse_calendar.twse_calendar
+            now = calendar.now()
+            if not calendar.is_market_open(now):
+                # 非交易時段：睡到下一次開盤（最多一分鐘醒來一次，休市日檔案更新或自選股異動時不會睡過頭）
+                wait = (calendar.next_open(now) - now).total_seconds()
+                self._stop.wait(min(max(wait, 1), 60))
+                continue
+
+            started = time.monotonic()
+            try:
+                self.poll_once(now)
+            except Exception as e:
+                print("[QuotePoller] 輪詢失敗：", e)
+                with self._lock:
+                    self._counters['poll_failures'] += 1
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0))
+
+    def poll_once(self, now=None):
+        """查詢所有自選股一次並發送觸發的提醒"""
+        now = now or twse_calendar.twse_calendar.now()
+        rules = self.store.rules_by_symbol()
+        if not rules:
+            return
+
+        quotes = WebCrawler_MIS_TWSE.fetch_quotes(list(rules))
+        with self._lock:
+            self._counters['polls'] += 1
+            self._counters['symbols_polled'] += len(rules)
+            # 已沒有人追蹤的股票不再保留狀態
+            for symbol in list(self._states):
+                if symbol not in rules:
+                    del self._states[symbol]
+
+        for symbol, conditions in rules.items():
+            quote = quotes.get(symbol)
+            if quote is None:
+                continue
+            for text, user_ids in self._evaluate(symbol, quote, conditions, now):
+                self._notify(user_ids, text)
+
+    def _evaluate(self, symbol, quote, conditions, now):
+        """判斷單一股票的所有條件，回傳 [(提醒文字, [user_id, ...]), ...]
+
+        每組 (條件種類, 門檻值) 只判斷一次，再發給所有設定相同條件的用戶
+        """
+        quote = quote_model.Quote.from_mis(quote)
+        price = quote.price
+        prev_close = quote.prev_close
+        volume = quote.volume
+        name = quote.name or symbol
+
+        with self._lock:
+            state = self._states.get(symbol)
+            if state is None:
+                state = self._states[symbol] = _SymbolState(self.volume_window)
+            if state.trading_day != now.date():
+                # 新的交易日：清除前一天的提醒紀錄與成交量（成交量每天從 0 開始累計）
+                state.trading_day = now.date()
+                state.fired_today.clear()
+                state.last_price = None
+                state.last_volume = None
+                state.volume_deltas.clear()
+
+            volume_delta = None
+            average_delta = None
+            if volume is not None:
+                if state.last_volume is not None and volume >= state.last_volume:
+                    volume_delta = volume - state.last_volume
+                    if len(state.volume_deltas) >= self.volume_min_samples:
+                        average_delta = sum(state.volume_deltas) / len(state.volume_deltas)
+                    state.volume_deltas.append(volume_delta)
+                state.last_volume = volume
+
+            alerts = []
+            for (kind, value), user_ids in conditions.items():
+                text = None
+                if kind in ('above', 'below'):
+                    if price is None or state.last_price is None:
+                        continue
+                    crossed = (state.last_price < value <= price) if kind == 'above' else (state.last_price > value >= price)
+                    last_alert = state.last_cross_alert.get((kind, value), 0)
+                    if crossed and time.time() - last_alert >= self.cross_cooldown:
+                        state.last_cross_alert[(kind, value)] = time.time()
+                        text = f'{symbol} {name} 價格{"漲破" if kind == "above" else "跌破"} {value:g}，目前 {quote_model.format_price(price)}'
+                elif (kind, value) in state.fired_today:
+                    continue
+                elif kind == 'change_pct':
+                    if price is None or not prev_close:
+                        continue
+                    change = quote.change_pct
+                    if abs(change) >= value:
+                        text = f'{symbol} {name} 漲跌幅 {change:+.2f}%，目前 {quote_model.format_price(price)}（昨收 {quote_model.format_price(prev_close)}）'
+                elif kind == 'volume_spike':
+                    if volume_delta is None or not average_delta:
+                        continue
+                    if volume_delta >= average_delta * value:
+                        text = f'{symbol} {name} 成交量爆量：{quote_model.format_volume(volume_delta)} 張，為近期平均的 {volume_delta / average_delta:.1f} 倍'
+
+                if text is not None:
+                    if kind in ('change_pct', 'volume_spike'):
+                        state.fired_today.add((kind, value))
+                    alerts.append((text, user_ids))
+
+            if price is not None:
+                state.last_price = price
+            self._counters['alerts'] += len(alerts)
+        return alerts
+
+    def _notify(self, user_ids, text):
+        """推播提醒：多位用戶用 multicast（每次最多 500 人），只有一位用 push"""
+        from linebot.v3.messaging import (
+            Configuration, ApiClient, MessagingApi, MulticastRequest, PushMessageRequest, TextMessage
+        )
+        configuration = Configuration(access_token=os.getenv('YOUR_CHANNEL_ACCESS_TOKEN'))
+        messages = [TextMessage(text='【盯盤提醒】' + text)]
+        user_ids = list(dict.fromkeys(user_ids))
+        try:
+            with ApiClient(configuration) as api_client:
+                line_bot_api = MessagingApi(api_client)
+                if len(user_ids) == 1:
+                    line_bot_api.push_message(PushMessageRequest(to=user_ids[0], messages=messages))
+                else:
+                    for start in range(0, len(user_ids), MULTICAST_MAX_RECIPIENTS):
+                        chunk = user_ids[start:start + MULTICAST_MAX_RECIPIENTS]
+                        line_bot_api.multicast(MulticastRequest(to=chunk, messages=messages))
+            with self._lock:
+                self._counters['messages_sent'] += len(user_ids)
+        except Exception as e:
+            print("[QuotePoller] 推播提醒失敗：", e)
+            with self._lock:
+                self._counters['push_failures'] += 1
+
+    def stats(self):
+        """回傳輪詢統計數據"""
+        with self._lock:
+            return {
+                'running': self._thread_pid == os.getpid() and self._thread is not None and self._thread.is_alive(),
+                'leader': self._leader_file is not None and self._leader_pid == os.getpid(),
+                'tracked_symbols': len(self._states),
+                'interval': self.interval,
+                **self._counters,
+            }
+
+
+# 實例化盤中自選股輪詢器
+quote_poller = QuotePoller(
+    store=watchlist.watchlist_store,
+    interval=float(os.getenv('WATCHLIST_POLL_INTERVAL', '10')),
+    volume_window=int(os.getenv('WATCHLIST_VOLUME_WINDOW', '20')),
+    volume_min_samples=int(os.getenv('WATCHLIST_VOLUME_MIN_SAMPLES', '5')),
+    cross_cooldown=float(os.getenv('WATCHLIST_CROSS_COOLDOWN', '300')),
+    lock_path=os.getenv('WATCHLIST_POLLER_LOCK_FILE'),
+)
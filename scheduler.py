@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（時間輪刻度與大小設定）
+load_dotenv()
+
+
+class Scheduler:
+    """單一執行緒的延遲任務排程器（雜湊時間輪），負責以下功能：
+    - 所有延遲任務（對話狀態重置、定期清理等）共用一個執行緒，不再每個任務建立一個 threading.Timer
+    - 任務以 key 識別，重新排程同一個 key 會取代原本的任務，新增、取消、重新排程都是 O(1)
+    - 支援固定間隔重複執行的任務
+    - 任務應該很快結束（不要在排程執行緒中做網路請求等耗時工作），以免延誤其他任務
+    """
+
+    def __init__(self, tick=0.5, wheel_size=512):
+        """
+        Args:
+            tick (float): 時間輪每一格的秒數，也是任務執行時間的精度
+            wheel_size (int): 時間輪的格數，超過一圈的任務會在經過的格子中繼續等待
+        """
+        self.tick = tick
+        self.wheel_size = wheel_size
+        self._wheel = [dict() for _ in range(wheel_size)]  # 每一格: {key: (執行時間, 任務函式, 重複間隔)}
+        self._slots = {}                                   # key: 任務 key, value: 所在的格子
+        self._running = {}                                 # key: 執行中的重複任務 key, value: 執行期間是否被取消
+        self._lock = threading.Lock()
+        self._counters = {'scheduled': 0, 'cancelled': 0, 'executed': 0, 'failed': 0, 'max_lag_seconds': 0.0}
+        self._started_at = time.monotonic()
+        self._next_tick = 0  # 下一個要處理的刻度
+        self._thread = None
+        self._thread_pid = None
+
+    def _tick_of(self, when):
+        return int((when - self._started_at) / self.tick)
+
+    def _insert(self, key, when, func, interval):
+        """放入任務（呼叫端需持有 _lock）"""
+        if key in self._running:
+            self._running[key] = False
+        old_slot = self._slots.pop(key, None)
+        if old_slot is not None:
+            self._wheel[old_slot].pop(key, None)
+        # 放在執行時間之後的第一個刻度（處理該刻度時一定已經到期）；已經過期的任務放在下一個要處理的刻度
+        slot = max(self._tick_of(when) + 1, self._next_tick) % self.wheel_size
+        self._wheel[slot][key] = (when, func, interval)
+        self._slots[key] = slot
+
+    def schedule(self, key, delay, func):
+        """delay 秒後執行 func（不帶參數），同一個 key 已有任務時取代原本的任務"""
+        self._ensure_thread()
+        with self._lock:
+            self._insert(key, time.monotonic() + delay, func, None)
+            self._counters['scheduled'] += 1
+
+    def every(self, key, interval, func):
+        """每隔 interval 秒執行一次 func（不帶參數），第一次在 interval 秒後執行"""
+        self._ensure_thread()
+        with self._lock:
+            self._insert(key, time.monotonic() + interval, func, interval)
+            self._counters['scheduled'] += 1
+
+    def cancel(self, key):
+        """取消任務，回傳是否有任務被取消"""
+        with self._lock:
+            if key in self._running:
+                self._running[key] = True
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                return False
+            self._wheel[slot].pop(key, None)
+            self._counters['cancelled'] += 1
+            return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._slots)
+
+    def _ensure_thread(self):
+        """確保排程執行緒已啟動（延遲到第一次排入任務才啟動，並處理 fork 後執行緒遺失的情況）"""
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def _due_tasks(self, now):
+        """取出到目前為止所有到期的任務（呼叫端需持有 _lock）"""
+        due = []
+        current_tick = self._tick_of(now)
+        # 落後超過一圈時（例如 fork 後第一次執行）只需要把每一格檢查一次
+        self._next_tick = max(self._next_tick, current_tick - self.wheel_size + 1)
+        while self._next_tick <= current_tick:
+            slot = self._next_tick % self.wheel_size
+            bucket = self._wheel[slot]
+            for key, (when, func, interval) in list(bucket.items()):
+                # 超過一圈的任務留在格子中，等時間輪轉到對應的圈數
+                if when <= now:
+                    del bucket[key]
+                    del self._slots[key]
+                    due.append((key, when, func, interval))
+            self._next_tick += 1
+        return due
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            now = time.monotonic()
+            with self._lock:
+                due = self._due_tasks(now)
+
+            for key, when, func, interval in due:
+                if interval is not None:
+                    with self._lock:
+                        self._running[key] = False
+                try:
+                    func()
+                except Exception as e:
+                    print(f"[Scheduler] 任務 {key} 執行失敗：", e)
+                    status = 'failed'
+                else:
+                    status = 'executed'
+                with self._lock:
+                    self._counters[status] += 1
+                    self._counters['max_lag_seconds'] = max(self._counters['max_lag_seconds'], now - when)
+                    # 重複任務排入下一次（執行期間被重新排程或取消時以新的設定為準）
+                    if interval is not None:
+                        cancelled = self._running.pop(key, False)
+                        if not cancelled and key not in self._slots:
+                            # 依原本的執行時間推算下一次，不因執行延遲而逐漸漂移（落後太多時從現在重新計算）
+                            next_when = when + interval
+                            if next_when <= time.monotonic():
+                                next_when = time.monotonic() + interval
+                            self._insert(key, next_when, func, interval)
+
+    def stats(self):
+        """回傳排程統計數據"""
+        with self._lock:
+            return {
+                'pending': len(self._slots),
+                'tick': self.tick,
+                'running': self._thread_pid == os.getpid() and self._thread is not None and self._thread.is_alive(),
+                **self._counters,
+            }
+
+
+# 實例化行程共用的排程器
+scheduler = Scheduler(
+    tick=float(os.getenv('SCHEDULER_TICK', '0.5')),
+    wheel_size=int(os.getenv('SCHEDULER_WHEEL_SIZE', '512')),
+)
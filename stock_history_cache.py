@@ -0,0 +1,234 @@
+import datetime
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+# 行程共用的資料庫連線池
+import db_pool
+
+# 載入 .env 檔案中的環境變數（快取目錄設定）
+load_dotenv()
+
+
+# 快取檔案格式版本，格式改變時遞增，舊快取會自動整批重新抓取
+CACHE_FORMAT_VERSION = 1
+
+# 快取的欄位（依序即為查詢的欄位順序）
+COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+FULL_QUERY = "SELECT date, open, high, low, close, volume FROM stock_data WHERE ticker = %s ORDER BY date;"
+INCREMENTAL_QUERY = "SELECT date, open, high, low, close, volume FROM stock_data WHERE ticker = %s AND date > %s ORDER BY date;"
+
+
+class StockHistoryCache:
+    """以股票代碼分目錄的本地歷史股價快取，負責以下功能：
+    - 每個欄位存成一個 .npy 檔，可用 memory map 直接讀取
+    - 記錄最後同步的日期，之後只查詢該日期之後的新資料並附加到檔案
+    - 資料表欄位結構或快取格式改變時，自動整批重新抓取
+    - 同步與寫入時持有每檔股票的檔案鎖，多個 worker 或批次預訓練行程不會同時改寫同一檔
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Args:
+            cache_dir (str): 快取根目錄
+        """
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._ticker_locks = {}  # 每檔股票各自的鎖，避免同一行程的多個執行緒同時同步同一檔
+        self._counters = {'loads': 0, 'full_reloads': 0, 'incremental_syncs': 0, 'appended_rows': 0, 'stale_retries': 0}
+
+    def _ticker_lock(self, ticker):
+        with self._lock:
+            return self._ticker_locks.setdefault(ticker, threading.Lock())
+
+    def _ticker_dir(self, ticker):
+        """股票代碼對應的快取目錄（只保留檔名安全的字元）"""
+        return os.path.join(self.cache_dir, re.sub(r'[^0-9A-Za-z._-]', '_', ticker))
+
+    @contextmanager
+    def _locked(self, ticker):
+        """同時持有行程內與跨行程的每檔股票鎖（檔案鎖為快取目錄中的 .lock）"""
+        with self._ticker_lock(ticker):
+            directory = self._ticker_dir(ticker)
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, '.lock'), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self, ticker):
+        """讀取快取描述檔，不存在或格式不符時回傳 None"""
+        try:
+            with open(os.path.join(self._ticker_dir(ticker), 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != CACHE_FORMAT_VERSION:
+            return None
+        return meta
+
+    def _read_columns(self, ticker, meta):
+        """以 memory map 方式讀取各欄位陣列"""
+        directory = self._ticker_dir(ticker)
+        return {
+            column: np.load(os.path.join(directory, f"{column}.{meta['generation']}.npy"), mmap_mode='r')
+            for column in COLUMNS
+        }
+
+    def _write(self, ticker, columns, schema):
+        """寫入新一代的欄位檔案，最後再以原子操作替換描述檔，讀取中的舊檔案不受影響"""
+        directory = self._ticker_dir(ticker)
+        os.makedirs(directory, exist_ok=True)
+        old_meta = self._read_meta(ticker)
+
+        generation = uuid.uuid4().hex
+        for column in COLUMNS:
+            np.save(os.path.join(directory, f"{column}.{generation}.npy"), columns[column])
+
+        meta = {
+            'version': CACHE_FORMAT_VERSION,
+            'generation': generation,
+            'schema': [list(item) for item in schema],
+            'rows': int(len(columns['date'])),
+            'last_date': str(columns['date'][-1]),
+        }
+        tmp_path = os.path.join(directory, f"meta.json.{generation}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+
+        # 保留上一代的欄位檔案：其他行程可能剛讀到舊的描述檔、還沒開啟欄位檔案，
+        # 要等到下一次寫入時才移除（已開啟的 memory map 在 Linux 上仍可繼續讀取）
+        keep = {generation}
+        if old_meta is not None:
+            keep.add(old_meta['generation'])
+        for name in os.listdir(directory):
+            if name.endswith('.npy') and name.split('.')[-2] not in keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        return meta
+
+    @staticmethod
+    def _rows_to_columns(rows):
+        """把查詢結果轉成各欄位的 numpy 陣列"""
+        values = list(zip(*rows)) if rows else [[] for _ in COLUMNS]
+        columns = {'date': np.array(values[0], dtype='datetime64[D]')}
+        for column, data in zip(COLUMNS[1:], values[1:]):
+            array = np.array(data)
+            # 有缺值（None）或非數值時統一轉成浮點數，缺值變成 NaN
+            if array.dtype.kind not in 'if':
+                array = np.array([np.nan if value is None else value for value in data], dtype=np.float64)
+            columns[column] = array
+        return columns
+
+    def _full_reload(self, ticker):
+        """整批重新抓取該股票的歷史資料"""
+        schema, rows = db_pool.db_pool.fetch_with_schema(FULL_QUERY, (ticker,))
+        with self._lock:
+            self._counters['full_reloads'] += 1
+        if not rows:
+            return None
+        return self._write(ticker, self._rows_to_columns(rows), schema)
+
+    def sync(self, ticker):
+        """同步指定股票的快取：有快取時只抓最後同步日期之後的新資料，否則整批抓取
+
+        Returns:
+            dict: 快取描述檔內容，查無資料時回傳 None
+        """
+        meta = self._read_meta(ticker)
+        if meta is None:
+            return self._full_reload(ticker)
+
+        last_date = datetime.date.fromisoformat(meta['last_date'])
+        schema, rows = db_pool.db_pool.fetch_with_schema(INCREMENTAL_QUERY, (ticker, last_date))
+
+        # 資料表欄位結構改變（欄位名稱或型別不同），舊快取不可再用
+        if [list(item) for item in schema] != meta['schema']:
+            print(f"[StockHistoryCache] {ticker} 的資料表結構已改變，重新抓取全部資料")
+            return self._full_reload(ticker)
+
+        with self._lock:
+            self._counters['incremental_syncs'] += 1
+            self._counters['appended_rows'] += len(rows)
+        if not rows:
+            return meta
+
+        existing = self._read_columns(ticker, meta)
+        new = self._rows_to_columns(rows)
+        merged = {}
+        for column in COLUMNS:
+            if existing[column].dtype != new[column].dtype:
+                # 舊資料為整數、新資料有缺值時統一用浮點數
+                merged[column] = np.concatenate([existing[column].astype(np.float64), new[column].astype(np.float64)])
+            else:
+                merged[column] = np.concatenate([existing[column], new[column]])
+        return self._write(ticker, merged, schema)
+
+    def load(self, ticker):
+        """同步並讀取指定股票的歷史資料
+
+        Args:
+            ticker (str): 股票代碼，例如 '2330.TW'
+
+        Returns:
+            pd.DataFrame: 包含 date, open, high, low, close, volume 的 DataFrame，查無資料時為空的 DataFrame
+        """
+        with self._locked(ticker):
+            with self._lock:
+                self._counters['loads'] += 1
+            try:
+                meta = self.sync(ticker)
+                columns = self._read_columns(ticker, meta) if meta is not None else None
+            except FileNotFoundError:
+                # 描述檔指向的欄位檔案不存在（例如被手動刪除或舊版程式的寫入衝突），整批重新抓取修復快取
+                print(f"[StockHistoryCache] {ticker} 的快取檔案不完整，重新抓取全部資料")
+                with self._lock:
+                    self._counters['stale_retries'] += 1
+                meta = self._full_reload(ticker)
+                columns = self._read_columns(ticker, meta) if meta is not None else None
+            if meta is None:
+                return pd.DataFrame(columns=COLUMNS)
+
+        df = pd.DataFrame({column: np.asarray(columns[column]) for column in COLUMNS})
+        df['date'] = df['date'].dt.date  # 與資料庫查詢結果相同，使用 datetime.date
+        return df
+
+    def invalidate(self, ticker):
+        """刪除指定股票的快取，下次讀取時整批重新抓取（保留 .lock，其他行程可能正在等待這個鎖）"""
+        with self._locked(ticker):
+            directory = self._ticker_dir(ticker)
+            for name in os.listdir(directory):
+                if name == '.lock':
+                    continue
+                path = os.path.join(directory, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def stats(self):
+        """回傳快取統計數據"""
+        with self._lock:
+            return dict(self._counters)
+
+
+# 實例化本地歷史股價快取
+stock_history_cache = StockHistoryCache(os.getenv('STOCK_CACHE_DIR', os.path.join('cache', 'stock_history')))
@@ -0,0 +1,276 @@
+"""本地股票代號索引
+
+用法:
+    python ticker_index.py refresh      # 重新下載上市/上櫃清單並更新索引檔
+    python ticker_index.py search 台積   # 測試代號、名稱查詢
+"""
+import difflib
+import json
+import os
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（索引檔路徑設定）
+load_dotenv()
+
+
+# 索引檔格式版本，格式改變時遞增，舊索引檔視為不存在
+INDEX_FORMAT_VERSION = 1
+
+# 證交所 ISIN 清單（strMode=2 上市、strMode=4 上櫃），包含代號、簡稱與證券類別
+ISIN_URLS = {
+    'tse': 'https://isin.twse.com.tw/isin/C_public.jsp?strMode=2',
+    'otc': 'https://isin.twse.com.tw/isin/C_public.jsp?strMode=4',
+}
+
+# 公司全名（上市、上櫃公司基本資料）
+FULL_NAME_URLS = {
+    'tse': ('https://openapi.twse.com.tw/v1/opendata/t187ap03_L', '公司代號', '公司名稱'),
+    'otc': ('https://www.tpex.org.tw/openapi/v1/mopsfin_t187ap03_O', 'SecuritiesCompanyCode', 'CompanyName'),
+}
+
+# ISIN 清單中要收錄的證券類別（權證等數量龐大且不會被查詢的類別不收錄）
+SECURITY_TYPES = {'股票': 'stock', 'ETF': 'etf', '臺灣存託憑證(TDR)': 'tdr'}
+
+TICKERS_QUERY = "SELECT DISTINCT ticker FROM stock_data;"
+
+
+def _parse_isin_page(html, market):
+    """解析 ISIN 清單頁面，回傳 [{'code', 'name', 'market', 'type'}, ...]"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    entries = []
+    section = None
+    for row in soup.select('tr'):
+        cells = row.find_all('td')
+        if len(cells) == 1:
+            # 只有一格的列是類別標題，例如「股票」、「ETF」
+            section = SECURITY_TYPES.get(cells[0].get_text(strip=True))
+            continue
+        if section is None or len(cells) < 6:
+            continue
+        # 第一欄格式為「代號　簡稱」，以全形空白分隔
+        parts = cells[0].get_text(strip=True).replace('　', ' ').split(None, 1)
+        if len(parts) == 2:
+            entries.append({'code': parts[0], 'name': parts[1].strip(), 'market': market, 'type': section})
+    return entries
+
+
+class TickerIndex:
+    """本地股票代號索引，負責以下功能：
+    - 收錄上市、上櫃股票與 ETF 的代號、簡稱、全名，以及 stock_data 中有歷史資料的股票
+    - 啟動時從索引檔載入，驗證代號只需查詢字典，不必向證交所確認
+    - 索引檔被其他行程更新（refresh）後，在 reload_interval 秒內依修改時間自動重新載入
+    - 支援以公司名稱、代號或名稱開頭、相近名稱查詢股票
+    - refresh 重新下載清單並以原子操作更新索引檔
+    """
+
+    def __init__(self, path, reload_interval=60):
+        """
+        Args:
+            path (str): 索引檔路徑
+            reload_interval (float): 檢查索引檔修改時間的間隔秒數
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_code = {}         # key: 股票代號, value: 股票資料 dict
+        self._by_name = {}         # key: 簡稱或全名, value: 股票代號
+        self._history = None       # stock_data 中有資料的股票代號 (XXXX.TW)，None 表示未知
+        self._mtime = None         # 載入時索引檔的修改時間
+        self._checked_at = 0.0     # 上次檢查修改時間的時間
+        self.built_at = None
+
+    def load(self):
+        """從索引檔載入（檔案不存在或格式不符時索引為空，驗證改回原本的線上查詢）"""
+        mtime = self._file_mtime()
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_FORMAT_VERSION:
+                raise ValueError(f"索引檔格式版本不符：{data.get('version')}")
+        except (OSError, ValueError) as e:
+            print(f"[TickerIndex] 無法載入股票代號索引 {self.path}：{e}")
+            data = {'entries': [], 'history_tickers': None, 'built_at': None}
+
+        by_code = {}
+        by_name = {}
+        for entry in data['entries']:
+            by_code[entry['code']] = entry
+            for name in (entry.get('name'), entry.get('full_name')):
+                if name:
+                    by_name.setdefault(name, entry['code'])
+
+        with self._lock:
+            self._by_code = by_code
+            self._by_name = by_name
+            self._history = set(data['history_tickers']) if data['history_tickers'] is not None else None
+            self.built_at = data['built_at']
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+            self._loaded = True
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _ensure_loaded(self):
+        """尚未載入時載入；每 reload_interval 秒檢查一次索引檔，修改時間改變時重新載入"""
+        if not self._loaded:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        if self._file_mtime() != self._mtime:
+            self.load()
+
+    @property
+    def available(self):
+        """索引是否有資料可用"""
+        self._ensure_loaded()
+        return bool(self._by_code)
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._by_code)
+
+    def get(self, code):
+        """取得股票資料，不存在時回傳 None"""
+        self._ensure_loaded()
+        return self._by_code.get(code)
+
+    def is_listed(self, code):
+        """代號是否為上市或上櫃的股票/ETF，索引沒有資料時回傳 None（未知）"""
+        self._ensure_loaded()
+        if not self._by_code:
+            return None
+        return code in self._by_code
+
+    def search(self, text, limit=5):
+        """以代號、名稱、代號或名稱開頭、相近名稱查詢股票
+
+        Returns:
+            list: 依符合程度排序的股票資料 dict
+        """
+        self._ensure_loaded()
+        text = text.strip()
+        if not text:
+            return []
+
+        codes = []
+        if text in self._by_code:
+            codes.append(text)
+        if text in self._by_name:
+            codes.append(self._by_name[text])
+        if len(codes) < limit:
+            codes += sorted(code for code in self._by_code if code.startswith(text))
+        if len(codes) < limit:
+            codes += [code for name, code in self._by_name.items() if name.startswith(text)]
+        if len(codes) < limit:
+            codes += [code for name, code in self._by_name.items() if text in name]
+        if len(codes) < limit:
+            codes += [self._by_name[name] for name in difflib.get_close_matches(text, list(self._by_name), n=limit, cutoff=0.5)]
+
+        return [self._by_code[code] for code in list(dict.fromkeys(codes))[:limit]]
+
+    def resolve(self, text):
+        """把用戶輸入的代號、公司名稱或名稱開頭轉成股票代號，無法唯一確定時回傳 None"""
+        self._ensure_loaded()
+        text = text.strip()
+        if not text:
+            return None
+        if text in self._by_code:
+            return text
+        if text in self._by_name:
+            return self._by_name[text]
+
+        # 名稱開頭只對應到一檔股票時（例如「台積」）直接採用
+        codes = {code for name, code in self._by_name.items() if name.startswith(text)}
+        return codes.pop() if len(codes) == 1 else None
+
+    def refresh(self):
+        """重新下載上市/上櫃清單、公司全名與 stock_data 的股票代號，更新索引檔並重新載入"""
+        import http_client
+
+        entries = {}
+        for market, url in ISIN_URLS.items():
+            response = http_client.http_client.get(url, timeout=(5, 60))
+            response.raise_for_status()
+            # ISIN 清單頁面為 MS950 (Big5) 編碼
+            html = response.content.decode('cp950', errors='replace')
+            for entry in _parse_isin_page(html, market):
+                entries[entry['code']] = entry
+
+        # 公司全名為額外資訊，下載失敗不影響索引
+        for market, (url, code_field, name_field) in FULL_NAME_URLS.items():
+            try:
+                response = http_client.http_client.get(url, timeout=(5, 60))
+                response.raise_for_status()
+                for row in response.json():
+                    code = str(row.get(code_field, '')).strip()
+                    if code in entries:
+                        entries[code]['full_name'] = str(row.get(name_field, '')).strip()
+            except Exception as e:
+                print(f"[TickerIndex] 下載{market}公司全名失敗：{e}")
+
+        # stock_data 中有歷史資料的股票（智慧預測需要）
+        history_tickers = None
+        try:
+            import db_pool
+            _, rows = db_pool.db_pool.fetch_all(TICKERS_QUERY)
+            history_tickers = sorted(row[0] for row in rows)
+        except Exception as e:
+            print(f"[TickerIndex] 讀取 stock_data 股票代號失敗：{e}")
+
+        data = {
+            'version': INDEX_FORMAT_VERSION,
+            'built_at': time.time(),
+            'entries': sorted(entries.values(), key=lambda entry: entry['code']),
+            'history_tickers': history_tickers,
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+        self.load()
+        return len(entries)
+
+    def stats(self):
+        """回傳索引統計數據"""
+        self._ensure_loaded()
+        return {
+            'entries': len(self._by_code),
+            'history_tickers': None if self._history is None else len(self._history),
+            'built_at': self.built_at,
+            'reload_interval': self.reload_interval,
+        }
+
+
+# 實例化股票代號索引
+ticker_index = TickerIndex(
+    os.getenv('TICKER_INDEX_FILE', os.path.join('cache', 'ticker_index.json')),
+    reload_interval=float(os.getenv('TICKER_INDEX_RELOAD_INTERVAL', '60')),
+)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == 'refresh':
+        count = ticker_index.refresh()
+        print(f"已更新股票代號索引：{count} 檔，stock_data 股票 {ticker_index.stats()['history_tickers']} 檔")
+    elif len(sys.argv) >= 3 and sys.argv[1] == 'search':
+        for entry in ticker_index.search(sys.argv[2]):
+            print(entry['code'], entry['name'], entry['market'], entry['type'], entry.get('full_name', ''))
+    else:
+        print(__doc__)
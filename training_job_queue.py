@@ -0,0 +1,187 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（佇列長度、worker 數量等設定）
+load_dotenv()
+
+
+class TrainingJobQueue:
+    """模型訓練任務佇列，負責以下功能：
+    - handler 排入訓練任務後立即返回，不佔住 webhook 執行緒與 reply token
+    - 背景 worker 依序執行訓練任務（每個 worker 同時只跑一個 fit）
+    - 限制佇列長度與每位用戶同時進行的任務數，避免大量請求拖垮整個機器人
+    - 提供任務狀態查詢與統計數據
+    """
+
+    def __init__(self, max_workers=1, max_queue_size=20, max_jobs_per_user=1, max_finished_jobs=200):
+        """初始化訓練任務佇列
+
+        Args:
+            max_workers (int): 背景 worker 數量，也就是同時進行訓練的最大任務數
+            max_queue_size (int): 佇列中等待的最大任務數，超過就拒絕新任務
+            max_jobs_per_user (int): 每位用戶同時排隊或訓練中的最大任務數
+            max_finished_jobs (int): 保留已結束任務狀態的筆數，避免記憶體無限成長
+        """
+        self.max_workers = max_workers
+        self.max_jobs_per_user = max_jobs_per_user
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._jobs = {}                                     # key: job_id, value: 任務狀態字典
+        self._finished_job_ids = deque(maxlen=max_finished_jobs)
+        self._active_jobs_per_user = {}                     # key: user_id, value: 排隊中+訓練中的任務數
+        self._counters = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+        self._lock = threading.Lock()
+        self._workers = []
+        self._workers_pid = None
+
+    def _ensure_workers(self):
+        """確保背景 worker 已啟動（延遲到第一次排入任務才啟動，並處理 fork 後執行緒遺失的情況）"""
+        if self._workers_pid == os.getpid() and all(worker.is_alive() for worker in self._workers):
+            return
+        self._workers = []
+        for index in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'training-worker-{index}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self._workers_pid = os.getpid()
+
+    def submit(self, user_id, ticker, strategy, epochs, func, on_failure=None):
+        """排入一個訓練任務
+
+        Args:
+            user_id (str): 用戶ID
+            ticker (str): 股票代碼 (格式: XXXX.TW)
+            strategy (str): 策略名稱
+            epochs (int): 訓練次數
+            func (callable): 實際執行訓練並回傳結果的函式（不帶參數）
+            on_failure (callable): 任務失敗時呼叫的函式，會傳入例外物件
+
+        Returns:
+            tuple: (job_id, 狀態)，狀態為
+                'queued' - 已排入佇列
+                'user_limit' - 該用戶已有進行中的任務
+                'queue_full' - 佇列已滿
+        """
+        with self._lock:
+            self._ensure_workers()
+
+            # 每位用戶同時只能有限數量的任務，避免同一人連續送出拖住其他人
+            if self._active_jobs_per_user.get(user_id, 0) >= self.max_jobs_per_user:
+                self._counters['rejected'] += 1
+                return None, 'user_limit'
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'job_id': job_id,
+                'user_id': user_id,
+                'ticker': ticker,
+                'strategy': strategy,
+                'epochs': epochs,
+                'status': 'queued',
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'error': None,
+            }
+
+            try:
+                self._queue.put_nowait((job_id, func, on_failure))
+            except queue.Full:
+                self._counters['rejected'] += 1
+                return None, 'queue_full'
+
+            self._jobs[job_id] = job
+            self._active_jobs_per_user[user_id] = self._active_jobs_per_user.get(user_id, 0) + 1
+            self._counters['submitted'] += 1
+            return job_id, 'queued'
+
+    def _worker_loop(self):
+        """背景 worker：從佇列取出任務並執行"""
+        while True:
+            job_id, func, on_failure = self._queue.get()
+            with self._lock:
+                job = self._jobs[job_id]
+                job['status'] = 'running'
+                job['started_at'] = time.time()
+
+            try:
+                func()
+            except Exception as e:
+                print(f"[TrainingJob] 任務 {job_id} 失敗：", e)
+                self._finish(job_id, 'failed', error=str(e))
+                if on_failure is not None:
+                    try:
+                        on_failure(e)
+                    except Exception as callback_error:
+                        print(f"[TrainingJob] 任務 {job_id} 的失敗通知發生錯誤：", callback_error)
+            else:
+                self._finish(job_id, 'done')
+            finally:
+                self._queue.task_done()
+
+    def _finish(self, job_id, status, error=None):
+        """標記任務結束，並釋放該用戶的任務名額"""
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = status
+            job['finished_at'] = time.time()
+            job['error'] = error
+            self._counters['completed' if status == 'done' else 'failed'] += 1
+
+            user_id = job['user_id']
+            remaining = self._active_jobs_per_user.get(user_id, 1) - 1
+            if remaining > 0:
+                self._active_jobs_per_user[user_id] = remaining
+            else:
+                self._active_jobs_per_user.pop(user_id, None)
+
+            # 只保留最近的已結束任務，較舊的直接移除
+            if len(self._finished_job_ids) == self._finished_job_ids.maxlen:
+                self._jobs.pop(self._finished_job_ids[0], None)
+            self._finished_job_ids.append(job_id)
+
+    def get_job(self, job_id):
+        """取得指定任務的狀態（回傳副本，找不到時回傳 None）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def get_user_jobs(self, user_id):
+        """取得指定用戶的所有任務狀態"""
+        with self._lock:
+            return [dict(job) for job in self._jobs.values() if job['user_id'] == user_id]
+
+    def queue_position(self, job_id):
+        """取得任務目前在佇列中的位置（1 表示下一個執行），不在排隊中則回傳 0"""
+        with self._lock:
+            queued = [job for job in self._jobs.values() if job['status'] == 'queued']
+        queued.sort(key=lambda job: job['submitted_at'])
+        for position, job in enumerate(queued, 1):
+            if job['job_id'] == job_id:
+                return position
+        return 0
+
+    def stats(self):
+        """回傳佇列統計數據"""
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job['status'] == 'running')
+            return {
+                'queued': self._queue.qsize(),
+                'running': running,
+                'max_queue_size': self._queue.maxsize,
+                'max_workers': self.max_workers,
+                **self._counters,
+            }
+
+
+# 實例化訓練任務佇列
+training_job_queue = TrainingJobQueue(
+    max_workers=int(os.getenv('TRAINING_MAX_WORKERS', '1')),
+    max_queue_size=int(os.getenv('TRAINING_MAX_QUEUE_SIZE', '20')),
+    max_jobs_per_user=int(os.getenv('TRAINING_MAX_JOBS_PER_USER', '1')),
+)
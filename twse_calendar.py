@@ -0,0 +1,114 @@
+import datetime
+import os
+import threading
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（休市日檔案與報價快取秒數設定）
+load_dotenv()
+
+
+# 台灣時間（沒有日光節約時間，固定 UTC+8）
+TAIPEI = datetime.timezone(datetime.timedelta(hours=8), name='Asia/Taipei')
+
+# 一般交易時段
+SESSION_OPEN = datetime.time(9, 0)
+SESSION_CLOSE = datetime.time(13, 30)
+
+
+class TwseCalendar:
+    """證交所交易日曆，負責以下功能：
+    - 判斷某一天是否為交易日（週一到週五，排除本地休市日檔案中的日期）
+    - 判斷目前是否在交易時段，以及下一次開盤的時間
+    - 依交易時段決定即時報價的快取秒數：盤中只快取幾秒，收盤後快取到下一次開盤
+    """
+
+    def __init__(self, holidays_file, intraday_ttl=5, close_grace=300):
+        """
+        Args:
+            holidays_file (str): 休市日檔案，每行一個 YYYY-MM-DD 日期，# 之後為註解
+            intraday_ttl (float): 盤中報價快取秒數
+            close_grace (float): 收盤後仍視為盤中的秒數（等待收盤撮合結果更新）
+        """
+        self.holidays_file = holidays_file
+        self.intraday_ttl = intraday_ttl
+        self.close_grace = close_grace
+        self._holidays = None
+        self._checked_year = None  # 已確認過休市日檔案是否有該年度的日期
+        self._lock = threading.Lock()
+
+    def holidays(self):
+        """讀取休市日（第一次使用時才讀檔，檔案不存在時視為沒有休市日）"""
+        with self._lock:
+            if self._holidays is None:
+                self._holidays = set()
+                try:
+                    with open(self.holidays_file, encoding='utf-8') as f:
+                        for line in f:
+                            line = line.split('#', 1)[0].strip()
+                            if line:
+                                self._holidays.add(datetime.date.fromisoformat(line))
+                except FileNotFoundError:
+                    print(f"[TwseCalendar] 找不到休市日檔案 {self.holidays_file}，只排除週末")
+                self._checked_year = None
+            year = self.now().year
+            if self._checked_year != year:
+                # 每年需要依證交所公告更新，沒有今年的日期時平日的休市日都會被當成交易日
+                self._checked_year = year
+                if not any(holiday.year == year for holiday in self._holidays):
+                    print(f"[TwseCalendar] 警告：休市日檔案 {self.holidays_file} 沒有 {year} 年的日期，"
+                          f"請依證交所公告的市場開休市日期更新")
+            return self._holidays
+
+    def reload(self):
+        """重新讀取休市日檔案"""
+        with self._lock:
+            self._holidays = None
+
+    def is_trading_day(self, date):
+        """是否為交易日"""
+        return date.weekday() < 5 and date not in self.holidays()
+
+    def now(self):
+        return datetime.datetime.now(TAIPEI)
+
+    def _session_bounds(self, date):
+        """某一天的開盤與收盤時間（台灣時間）"""
+        return (datetime.datetime.combine(date, SESSION_OPEN, tzinfo=TAIPEI),
+                datetime.datetime.combine(date, SESSION_CLOSE, tzinfo=TAIPEI))
+
+    def is_market_open(self, now=None):
+        """目前是否在交易時段內（含收盤後的緩衝時間）"""
+        now = (now or self.now()).astimezone(TAIPEI)
+        if not self.is_trading_day(now.date()):
+            return False
+        session_open, session_close = self._session_bounds(now.date())
+        return session_open <= now < session_close + datetime.timedelta(seconds=self.close_grace)
+
+    def next_open(self, now=None):
+        """下一次開盤的時間（目前在盤中則為下一個交易日的開盤）"""
+        now = (now or self.now()).astimezone(TAIPEI)
+        date = now.date()
+        if now >= self._session_bounds(date)[0]:
+            date += datetime.timedelta(days=1)
+        # 最多往後找一年，避免休市日檔案設定錯誤時無窮迴圈
+        for _ in range(366):
+            if self.is_trading_day(date):
+                return self._session_bounds(date)[0]
+            date += datetime.timedelta(days=1)
+        return self._session_bounds(date)[0]
+
+    def quote_ttl(self, now=None):
+        """即時報價的快取秒數：盤中為 intraday_ttl，盤後到下一次開盤為止"""
+        now = (now or self.now()).astimezone(TAIPEI)
+        if self.is_market_open(now):
+            return self.intraday_ttl
+        return max((self.next_open(now) - now).total_seconds(), self.intraday_ttl)
+
+
+# 實例化證交所交易日曆
+twse_calendar = TwseCalendar(
+    holidays_file=os.getenv('TWSE_HOLIDAYS_FILE', 'twse_holidays.txt'),
+    intraday_ttl=float(os.getenv('QUOTE_CACHE_TTL', '5')),
+    close_grace=float(os.getenv('QUOTE_CLOSE_GRACE', '300')),
+)
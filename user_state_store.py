@@ -0,0 +1,469 @@
+import functools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（狀態儲存後端設定）
+load_dotenv()
+
+
+def _value_size(value):
+    """狀態值序列化後的位元組數（估計佔用的記憶體與磁碟空間）"""
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+class MemoryBackend:
+    """行程內的字典後端（開發用，只有單一 worker 時狀態才會一致）"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._data = OrderedDict()  # key: user_id, value: {狀態名稱: 值}，依最近使用時間排列（最舊的在前）
+        self._sizes = {}            # key: user_id, value: {狀態名稱: 位元組數}
+        self._accessed = {}         # key: user_id, value: 最近使用時間
+        self._lock = threading.Lock()
+
+    def _touch(self, user_id):
+        if user_id in self._data:
+            self._data.move_to_end(user_id)
+            self._accessed[user_id] = time.time()
+
+    def load(self, user_id):
+        with self._lock:
+            self._touch(user_id)
+            return dict(self._data.get(user_id, {}))
+
+    def save(self, user_id, changes, deletes=()):
+        sizes = {key: _value_size(value) for key, value in changes.items()}
+        with self._lock:
+            state = self._data.setdefault(user_id, {})
+            state.update(changes)
+            self._sizes.setdefault(user_id, {}).update(sizes)
+            for key in deletes:
+                state.pop(key, None)
+                self._sizes[user_id].pop(key, None)
+            if state:
+                self._touch(user_id)
+            else:
+                self._remove(user_id)
+
+    def _remove(self, user_id):
+        """移除用戶的所有狀態，回傳釋放的位元組數（呼叫端需持有 _lock）"""
+        self._data.pop(user_id, None)
+        self._accessed.pop(user_id, None)
+        return sum(self._sizes.pop(user_id, {}).values())
+
+    def acquire_busy(self, user_id, owner, lease):
+        """只有單一行程，同一用戶的事件已由事件通道依序處理，不需要跨行程標記"""
+        return True
+
+    def release_busy(self, user_id, owner):
+        pass
+
+    def users(self):
+        with self._lock:
+            return len(self._data)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(sum(sizes.values()) for sizes in self._sizes.values())
+
+    def evict(self, idle_before, max_users, max_bytes, keep=()):
+        """移除閒置過久的用戶，再依最近使用時間移除超過筆數或位元組上限的用戶
+
+        Returns:
+            list: [(user_id, 釋放的位元組數, 原因), ...]，原因為 'idle'、'max_users' 或 'max_bytes'
+        """
+        evicted = []
+        with self._lock:
+            for user_id in list(self._data):
+                if self._accessed.get(user_id, 0) < idle_before and user_id not in keep:
+                    evicted.append((user_id, self._remove(user_id), 'idle'))
+
+            total = sum(sum(sizes.values()) for sizes in self._sizes.values())
+            for user_id in list(self._data):
+                if user_id in keep:
+                    continue
+                if max_users and len(self._data) > max_users:
+                    reason = 'max_users'
+                elif max_bytes and total > max_bytes:
+                    reason = 'max_bytes'
+                else:
+                    break
+                freed = self._remove(user_id)
+                total -= freed
+                evicted.append((user_id, freed, reason))
+        return evicted
+
+
+class SQLiteBackend:
+    """本地 SQLite 後端（WAL 模式），同一台機器上的多個 worker 行程共用用戶狀態
+
+    值以 pickle 保存，訓練數據 (numpy 陣列) 與標準化轉換也能直接存入
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        """每個執行緒各自的連線（fork 後重新建立）"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS user_state ('
+                'user_id TEXT NOT NULL, key TEXT NOT NULL, value BLOB, updated_at REAL NOT NULL, '
+                'PRIMARY KEY (user_id, key))'
+            )
+            # 每位用戶最近使用的時間（讀取也算使用），閒置過久或超過上限時依此決定移除順序
+            connection.execute('CREATE TABLE IF NOT EXISTS user_access (user_id TEXT PRIMARY KEY, accessed_at REAL NOT NULL)')
+            # 正在處理該用戶事件的行程（跨行程的處理中標記，超過 expires_at 視為已失效）
+            connection.execute('CREATE TABLE IF NOT EXISTS user_busy (user_id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def load(self, user_id):
+        connection = self._connection()
+        rows = connection.execute('SELECT key, value FROM user_state WHERE user_id = ?', (user_id,)).fetchall()
+        if rows:
+            connection.execute('INSERT OR REPLACE INTO user_access (user_id, accessed_at) VALUES (?, ?)', (user_id, time.time()))
+        return {key: pickle.loads(value) for key, value in rows}
+
+    def save(self, user_id, changes, deletes=()):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO user_state (user_id, key, value, updated_at) VALUES (?, ?, ?, ?)',
+                [(user_id, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now) for key, value in changes.items()]
+            )
+            connection.executemany('DELETE FROM user_state WHERE user_id = ? AND key = ?', [(user_id, key) for key in deletes])
+            connection.execute('INSERT OR REPLACE INTO user_access (user_id, accessed_at) VALUES (?, ?)', (user_id, now))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def acquire_busy(self, user_id, owner, lease):
+        """標記用戶處理中，其他行程已標記且尚未失效時回傳 False"""
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM user_busy WHERE user_id = ? AND expires_at < ?', (user_id, now))
+            connection.execute(
+                'INSERT OR IGNORE INTO user_busy (user_id, owner, expires_at) VALUES (?, ?, ?)', (user_id, owner, now + lease)
+            )
+            row = connection.execute('SELECT owner FROM user_busy WHERE user_id = ?', (user_id,)).fetchone()
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return row is not None and row[0] == owner
+
+    def release_busy(self, user_id, owner):
+        self._connection().execute('DELETE FROM user_busy WHERE user_id = ? AND owner = ?', (user_id, owner))
+
+    def users(self):
+        return self._connection().execute('SELECT COUNT(DISTINCT user_id) FROM user_state').fetchone()[0]
+
+    def total_bytes(self):
+        return self._connection().execute('SELECT COALESCE(SUM(LENGTH(value)), 0) FROM user_state').fetchone()[0]
+
+    def evict(self, idle_before, max_users, max_bytes, keep=()):
+        """移除閒置過久的用戶，再依最近使用時間移除超過筆數或位元組上限的用戶
+
+        Returns:
+            list: [(user_id, 釋放的位元組數, 原因), ...]，原因為 'idle'、'max_users' 或 'max_bytes'
+        """
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # 依最近使用時間排列（最舊的在前），沒有使用紀錄的視為最舊
+            rows = connection.execute(
+                'SELECT s.user_id, SUM(LENGTH(s.value)), COALESCE(a.accessed_at, 0) '
+                'FROM user_state s LEFT JOIN user_access a ON a.user_id = s.user_id '
+                'GROUP BY s.user_id ORDER BY 3'
+            ).fetchall()
+            users = len(rows)
+            total = sum(size for _, size, _ in rows)
+            evicted = []
+            for user_id, size, accessed_at in rows:
+                if user_id in keep:
+                    continue
+                if accessed_at < idle_before:
+                    reason = 'idle'
+                elif max_users and users > max_users:
+                    reason = 'max_users'
+                elif max_bytes and total > max_bytes:
+                    reason = 'max_bytes'
+                else:
+                    break
+                users -= 1
+                total -= size
+                evicted.append((user_id, size, reason))
+            connection.executemany('DELETE FROM user_state WHERE user_id = ?', [(user_id,) for user_id, _, _ in evicted])
+            connection.executemany('DELETE FROM user_access WHERE user_id = ?', [(user_id,) for user_id, _, _ in evicted])
+            # 已沒有狀態的用戶不再保留使用紀錄
+            connection.execute('DELETE FROM user_access WHERE user_id NOT IN (SELECT user_id FROM user_state)')
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return evicted
+
+
+class _Session:
+    """單一事件處理期間的用戶狀態（一次讀入、結束時一次寫回）"""
+
+    def __init__(self, user_id, values):
+        self.user_id = user_id
+        self.values = values
+        self.changes = {}
+        self.deletes = set()
+        self.depth = 1
+
+
+class UserStateStore:
+    """用戶狀態儲存，負責以下功能：
+    - 各功能的用戶狀態（模式開關、對話鎖、訓練數據、聊天歷史等）集中存放在可替換的後端
+    - 多個 worker 行程使用 SQLite 後端時，同一用戶的連續訊息不論落在哪個行程都看到相同狀態
+    - session() 在處理一個事件時只讀取一次該用戶的所有狀態，結束時把修改一次寫回
+    - session() 期間在後端寫入跨行程的處理中標記，同一用戶的事件落在不同 worker 行程時
+      後到的行程等標記解除才讀取狀態，兩個行程的寫回不會互相覆蓋
+    - 沒有 session 時（例如背景訓練執行緒）每次讀寫直接存取後端
+    - 定期移除閒置超過 idle_ttl 的用戶狀態，並依最近使用時間限制用戶數與總位元組數
+    """
+
+    def __init__(self, backend, idle_ttl=1800, max_users=10000, max_bytes=256 * 1024 * 1024, sweep_interval=60,
+                 busy_wait=30, busy_lease=120):
+        """
+        Args:
+            backend (MemoryBackend | SQLiteBackend): 狀態儲存後端
+            idle_ttl (float): 用戶閒置多少秒後移除其狀態（回到主選單、清除訓練數據與聊天歷史）
+            max_users (int): 最多保留的用戶數，0 表示不限制
+            max_bytes (int): 所有用戶狀態的總位元組數上限，0 表示不限制
+            sweep_interval (float): 定期清理的間隔秒數（由排程器定期呼叫 sweep）
+            busy_wait (float): 其他行程正在處理同一用戶時最多等待的秒數，超過時照常處理
+            busy_lease (float): 處理中標記的有效秒數（行程中途結束時標記在此之後失效）
+        """
+        self.backend = backend
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.busy_wait = busy_wait
+        self.busy_lease = busy_lease
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._active = {}  # key: user_id, value: 本行程中處理中的 session 數（處理中的用戶不會被移除）
+        self._counters = {
+            'sessions': 0, 'loads': 0, 'saves': 0, 'sweeps': 0, 'busy_waits': 0, 'busy_timeouts': 0,
+            'evicted_users': 0, 'evicted_bytes': 0, 'evicted_idle': 0, 'evicted_max_users': 0, 'evicted_max_bytes': 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _current(self, user_id):
+        """目前執行緒中該用戶的 session，沒有時回傳 None"""
+        session = getattr(self._local, 'session', None)
+        if session is not None and session.user_id == user_id:
+            return session
+        return None
+
+    def _load(self, user_id):
+        self._count('loads')
+        return self.backend.load(user_id)
+
+    def _save(self, user_id, changes, deletes=()):
+        if changes or deletes:
+            self._count('saves')
+            self.backend.save(user_id, changes, deletes)
+
+    def _acquire_busy(self, user_id, owner):
+        """等到其他行程不再處理該用戶，並標記為本執行緒處理中"""
+        deadline = time.monotonic() + self.busy_wait
+        waited = False
+        while not self.backend.acquire_busy(user_id, owner, self.busy_lease):
+            if time.monotonic() >= deadline:
+                print(f"[UserStateStore] 用戶 {user_id} 的處理中標記超過 {self.busy_wait} 秒未解除，照常處理")
+                self._count('busy_timeouts')
+                return False
+            if not waited:
+                waited = True
+                self._count('busy_waits')
+            time.sleep(0.05)
+        return True
+
+    @contextmanager
+    def session(self, user_id):
+        """處理一個事件期間使用的 session（同一執行緒內可重複進入）"""
+        session = self._current(user_id)
+        if session is not None:
+            session.depth += 1
+            try:
+                yield session
+            finally:
+                session.depth -= 1
+            return
+
+        previous = getattr(self._local, 'session', None)
+        owner = f'{os.getpid()}:{threading.get_ident()}'
+        with self._lock:
+            self._active[user_id] = self._active.get(user_id, 0) + 1
+        try:
+            # 先取得處理中標記再讀取狀態，才會讀到其他行程寫回後的狀態
+            busy = self._acquire_busy(user_id, owner)
+            try:
+                session = _Session(user_id, self._load(user_id))
+                self._local.session = session
+                self._count('sessions')
+                try:
+                    yield session
+                finally:
+                    self._local.session = previous
+                    self._save(user_id, session.changes, session.deletes)
+            finally:
+                if busy:
+                    self.backend.release_busy(user_id, owner)
+        finally:
+            with self._lock:
+                remaining = self._active.get(user_id, 1) - 1
+                if remaining > 0:
+                    self._active[user_id] = remaining
+                else:
+                    self._active.pop(user_id, None)
+
+    def event_session(self, func):
+        """裝飾 webhook 事件處理函式，處理期間開啟事件來源用戶的 session"""
+        @functools.wraps(func)
+        def wrapper(event):
+            user_id = getattr(getattr(event, 'source', None), 'user_id', None)
+            if user_id is None:
+                return func(event)
+            with self.session(user_id):
+                return func(event)
+        return wrapper
+
+    def get(self, user_id, key, default=None):
+        """讀取用戶狀態"""
+        session = self._current(user_id)
+        values = session.values if session is not None else self._load(user_id)
+        return values.get(key, default)
+
+    def get_many(self, user_id, keys, default=None):
+        """一次讀取多個用戶狀態，回傳 {狀態名稱: 值}"""
+        session = self._current(user_id)
+        values = session.values if session is not None else self._load(user_id)
+        return {key: values.get(key, default) for key in keys}
+
+    def set(self, user_id, key, value, write_through=False):
+        """寫入用戶狀態
+
+        Args:
+            write_through (bool): 在 session 中也立即寫回後端（對話鎖等需要讓其他行程馬上看到的狀態）
+        """
+        self.update(user_id, {key: value}, write_through=write_through)
+
+    def update(self, user_id, changes, write_through=False):
+        """一次寫入多個用戶狀態"""
+        session = self._current(user_id)
+        if session is None:
+            self._save(user_id, dict(changes))
+            return
+        session.values.update(changes)
+        session.deletes.difference_update(changes)
+        if write_through:
+            self._save(user_id, dict(changes))
+            for key in changes:
+                session.changes.pop(key, None)
+        else:
+            session.changes.update(changes)
+
+    def delete(self, user_id, *keys):
+        """刪除用戶狀態"""
+        session = self._current(user_id)
+        if session is None:
+            self._save(user_id, {}, keys)
+            return
+        for key in keys:
+            session.values.pop(key, None)
+            session.changes.pop(key, None)
+            session.deletes.add(key)
+
+    def sweep(self):
+        """移除閒置過久的用戶狀態，並依最近使用時間移除超過上限的用戶
+
+        Returns:
+            int: 移除的用戶數
+        """
+        with self._lock:
+            keep = set(self._active)
+        evicted = self.backend.evict(time.time() - self.idle_ttl, self.max_users, self.max_bytes, keep=keep)
+        with self._lock:
+            self._counters['sweeps'] += 1
+            for _, size, reason in evicted:
+                self._counters['evicted_users'] += 1
+                self._counters['evicted_bytes'] += size
+                self._counters['evicted_' + reason] += 1
+        return len(evicted)
+
+    def stats(self):
+        """回傳狀態儲存統計數據"""
+        with self._lock:
+            counters = dict(self._counters)
+            active = len(self._active)
+        return {
+            'backend': self.backend.name,
+            'users': self.backend.users(),
+            'bytes': self.backend.total_bytes(),
+            'active_sessions': active,
+            'idle_ttl': self.idle_ttl,
+            'max_users': self.max_users,
+            'max_bytes': self.max_bytes,
+            **counters,
+        }
+
+
+def _create_backend():
+    """依 USER_STATE_BACKEND 建立後端：memory（預設）或 sqlite"""
+    backend = os.getenv('USER_STATE_BACKEND', 'memory')
+    if backend == 'sqlite':
+        return SQLiteBackend(os.getenv('USER_STATE_DB', os.path.join('data', 'user_state.db')))
+    if backend != 'memory':
+        print(f"[UserStateStore] 不支援的狀態後端 {backend}，改用 memory")
+    return MemoryBackend()
+
+
+# 實例化用戶狀態儲存
+user_state_store = UserStateStore(
+    backend=_create_backend(),
+    idle_ttl=float(os.getenv('USER_STATE_IDLE_TTL', '1800')),
+    max_users=int(os.getenv('USER_STATE_MAX_USERS', '10000')),
+    max_bytes=int(float(os.getenv('USER_STATE_MAX_MB', '256')) * 1024 * 1024),
+    sweep_interval=float(os.getenv('USER_STATE_SWEEP_INTERVAL', '60')),
+    busy_wait=float(os.getenv('USER_STATE_BUSY_WAIT', '30')),
+    # 預設與事件通道的處理時間上限相同，處理逾時的事件不再擋住同一用戶的後續事件
+    busy_lease=float(os.getenv('USER_STATE_BUSY_LEASE', os.getenv('EVENT_LANE_MAX_IN_FLIGHT', '120'))),
+)
@@ -1,51 +1,56 @@
+# 用戶狀態儲存（多個 worker 行程共用）
+import user_state_store
+
+
 class AllowValidator:
     """功能權限集中控制器，支援多用戶狀態管理"""
-    def __init__(self):
-        """初始化多用戶功能權限字典"""
-        # key: user_id, value: dict，存放各功能權限布林值
-        self._user_states = {}
-
-    def _init_user_state(self, user_id: str):
-        """初始化指定用戶的權限狀態，若不存在則建立預設值"""
-        if user_id not in self._user_states:
-            self._user_states[user_id] = {
-                'fetch_stock_data': False,
-                'ai_chat': False,
-                'intelligent_prediction': False,
-            }
+    def __init__(self, store=None):
+        """初始化多用戶功能權限
+
+        Args:
+            store (UserStateStore): 用戶狀態儲存，各功能權限布林值存放在 'allow.<功能>' 狀態中
+        """
+        self._store = store or user_state_store.user_state_store
+
+    def _get(self, user_id: str, feature: str) -> bool:
+        """取得指定用戶的功能權限，尚未設定時預設為 False"""
+        return self._store.get(user_id, 'allow.' + feature, False)
+
+    def _set(self, user_id: str, feature: str, enable: bool):
+        self._store.set(user_id, 'allow.' + feature, enable)
 
     def is_allow_fetch_stock_data(self, user_id: str) -> bool:
         """檢查指定用戶的股票數據爬取權限"""
-        self._init_user_state(user_id)
-        return self._user_states[user_id]['fetch_stock_data']
+        return self._get(user_id, 'fetch_stock_data')
 
     def is_allow_ai_chat(self, user_id: str) -> bool:
         """檢查指定用戶的 AI 聊天功能權限"""
-        self._init_user_state(user_id)
-        return self._user_states[user_id]['ai_chat']
+        return self._get(user_id, 'ai_chat')
 
     def is_allow_intelligent_prediction(self, user_id: str) -> bool:
         """檢查指定用戶的智能預測功能權限"""
-        self._init_user_state(user_id)
-        return self._user_states[user_id]['intelligent_prediction']
+        return self._get(user_id, 'intelligent_prediction')
+
+    def is_allow_watchlist(self, user_id: str) -> bool:
+        """檢查指定用戶的盯盤（自選股提醒）設定權限"""
+        return self._get(user_id, 'watchlist')
 
     def enable_fetch_stock_data(self, user_id: str, enable: bool):
         """設置指定用戶的股票數據爬取權限"""
-        self._init_user_state(user_id)
-        self._user_states[user_id]['fetch_stock_data'] = enable
+        self._set(user_id, 'fetch_stock_data', enable)
 
     def enable_ai_chat(self, user_id: str, enable: bool):
         """設置指定用戶的 AI 聊天功能權限"""
-        self._init_user_state(user_id)
-        self._user_states[user_id]['ai_chat'] = enable
+        self._set(user_id, 'ai_chat', enable)
 
     def enable_intelligent_prediction(self, user_id: str, enable: bool):
         """設置指定用戶的智能預測功能權限"""
-        self._init_user_state(user_id)
-        self._user_states[user_id]['intelligent_prediction'] = enable
+        self._set(user_id, 'intelligent_prediction', enable)
+
+    def enable_watchlist(self, user_id: str, enable: bool):
+        """設置指定用戶的盯盤（自選股提醒）設定權限"""
+        self._set(user_id, 'watchlist', enable)
 
 
 # 實例化多用戶權限控制器
 allow_validator = AllowValidator()
-
-
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（預熱步驟與模式設定）
+load_dotenv()
+
+# 行程開始載入程式的時間（計算啟動到就緒的秒數）
+_started_at = time.monotonic()
+
+
+def warm_handlers():
+    """載入文字訊息路由表中所有的處理函式（AI 聊天、智慧預測等較重的模組）"""
+    from handlers import message_router
+    failures = message_router.message_router.preload()
+    if failures:
+        raise RuntimeError(f"部分處理函式載入失敗：{failures}")
+
+
+def warm_matplotlib():
+    """載入 matplotlib 並設定非 GUI 的 Agg 後端（訓練後繪製準確率圖表用）"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+
+
+def warm_yfinance():
+    """載入 yfinance（抓取今日資料用）"""
+    import yfinance
+
+
+def warm_kbar():
+    """用假資料跑一次 K 棒型態分類"""
+    import pandas as pd
+    from intelligent_prediction_strategies.kbar_classifier import add_k_type_columns
+    df = pd.DataFrame({
+        'open': [100.0, 101.0, 99.0],
+        'high': [102.0, 103.0, 101.0],
+        'low': [99.0, 100.0, 97.0],
+        'close': [101.0, 100.0, 100.0],
+        'volume': [1000, 1200, 900],
+    })
+    add_k_type_columns(df)
+
+
+def warm_numpy_forward():
+    """用隨機權重跑一次 NumPy 前向傳播（預測時使用的推論路徑）"""
+    import numpy as np
+    from intelligent_prediction_strategies import numpy_inference
+    network = numpy_inference.random_network(4, 3)
+    network.predict(np.zeros((1, 4), dtype=np.float32))
+
+
+def warm_keras():
+    """載入 Keras，建立與訓練時相同結構的模型並跑一次前向傳播（初始化 TensorFlow 執行環境）"""
+    import numpy as np
+    import keras
+    from keras import layers
+    model = keras.Sequential([
+        layers.Input(shape=(4,)),
+        layers.Dense(64, activation='relu'),
+        layers.Dense(32, activation='relu'),
+        layers.Dense(3, activation='softmax'),
+    ])
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    model.predict(np.zeros((1, 4), dtype=np.float32), verbose=0)
+
+
+# 可用的預熱步驟: {名稱: (函式, 是否每個行程各自執行)}
+# TensorFlow 的執行緒池在 fork 後不能沿用，Keras 只在實際服務的行程中初始化
+WARMUP_STEPS = {
+    'handlers': (warm_handlers, False),
+    'matplotlib': (warm_matplotlib, False),
+    'yfinance': (warm_yfinance, False),
+    'kbar': (warm_kbar, False),
+    'numpy_forward': (warm_numpy_forward, False),
+    'keras': (warm_keras, True),
+}
+
+
+class Warmup:
+    """服務前的預熱，負責以下功能：
+    - 啟動時先載入較重的模組、跑一次假資料的前向傳播與 K 棒分類，第一個用戶不必等模組載入
+    - 搭配 gunicorn --preload 時在 master 行程預熱一次（不啟動執行緒、不執行每個行程各自的步驟），
+      fork 出的 worker 直接沿用已載入的模組，不能跨 fork 沿用的步驟（Keras）由 post_fork 在每個 worker 中背景執行
+    - 全部步驟完成後才標記為就緒（提供給 /ready 檢查），並記錄啟動到就緒的秒數與每個步驟的耗時
+    - 單一步驟失敗（例如沒有安裝該套件）只記錄錯誤，不阻擋服務
+    """
+
+    def __init__(self, steps):
+        """
+        Args:
+            steps (list): 要執行的步驟名稱，依序執行（見 WARMUP_STEPS）
+        """
+        unknown = [name for name in steps if name not in WARMUP_STEPS]
+        if unknown:
+            raise ValueError(f"未知的預熱步驟：{unknown}")
+        self.steps = list(steps)
+        self._lock = threading.Lock()
+        self._results = {}        # key: 步驟名稱, value: {'seconds': 耗時, 'error': 錯誤訊息}
+        self._ready_at = None
+        self._ready_pid = None
+        self._started = False
+        self._thread = None
+
+    def _run_steps(self, steps):
+        for name in steps:
+            func, _ = WARMUP_STEPS[name]
+            started = time.monotonic()
+            error = None
+            try:
+                func()
+            except Exception as e:
+                print(f"[Warmup] 預熱步驟 {name} 失敗：", e)
+                error = str(e)
+            with self._lock:
+                self._results[name] = {'seconds': time.monotonic() - started, 'error': error}
+
+    def _mark_ready(self):
+        with self._lock:
+            self._ready_at = time.monotonic()
+            self._ready_pid = os.getpid()
+            time_to_ready = self._ready_at - _started_at
+        print(f"[Warmup] 行程 {os.getpid()} 預熱完成，啟動到就緒 {time_to_ready:.2f} 秒")
+
+    def _run(self, steps):
+        self._run_steps(steps)
+        self._mark_ready()
+
+    def start(self, background=False, preload=False):
+        """執行預熱
+
+        Args:
+            background (bool): 在背景執行緒中預熱（服務立即開始，/ready 在完成前回傳未就緒），
+                否則在目前執行緒中預熱完才返回
+            preload (bool): gunicorn --preload 的 master 行程：只在目前執行緒執行可跨 fork 沿用的步驟，
+                不啟動執行緒也不標記就緒，worker 在 post_fork 呼叫 after_fork 完成其餘步驟
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if preload:
+            self._run_steps([name for name in self.steps if not WARMUP_STEPS[name][1]])
+        elif background:
+            self._thread = threading.Thread(target=self._run, args=(self.steps,), name='warmup', daemon=True)
+            self._thread.start()
+        else:
+            self._run(self.steps)
+
+    def after_fork(self):
+        """gunicorn post_fork：在 worker 中背景執行每個行程各自的步驟，完成後標記就緒"""
+        self._lock = threading.Lock()
+        self._ready_at = None
+        self._ready_pid = None
+        steps = [name for name in self.steps if WARMUP_STEPS[name][1]]
+        self._thread = threading.Thread(target=self._run, args=(steps,), name='warmup', daemon=True)
+        self._thread.start()
+
+    def is_ready(self):
+        """目前行程是否已完成預熱"""
+        with self._lock:
+            return self._ready_pid == os.getpid()
+
+    def stats(self):
+        """回傳預熱統計數據"""
+        with self._lock:
+            ready = self._ready_pid == os.getpid()
+            return {
+                'ready': ready,
+                'time_to_ready': self._ready_at - _started_at if ready else None,
+                'uptime': time.monotonic() - _started_at,
+                'steps': dict(self._results),
+            }
+
+
+# 只有訓練模型的行程需要的步驟（PREDICTION_MODE=remote 時交給預測 worker，web 行程不載入）
+ML_WARMUP_STEPS = ('matplotlib', 'keras')
+
+# 預設預熱步驟
+DEFAULT_WARMUP_STEPS = [
+    name for name in WARMUP_STEPS if os.getenv('PREDICTION_MODE', 'local') != 'remote' or name not in ML_WARMUP_STEPS
+]
+
+# 實例化服務前預熱（WARMUP_STEPS 以逗號分隔，設為空字串表示不預熱）
+warmup = Warmup([
+    name.strip() for name in os.getenv('WARMUP_STEPS', ','.join(DEFAULT_WARMUP_STEPS)).split(',') if name.strip()
+])
@@ -0,0 +1,152 @@
+import fcntl
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數（自選股檔案路徑與上限設定）
+load_dotenv()
+
+
+# 觸發條件種類
+TRIGGER_KINDS = {
+    'above': '價格漲破',          # 成交價由下往上突破 value
+    'below': '價格跌破',          # 成交價由上往下跌破 value
+    'change_pct': '漲跌幅達',     # 相對昨收價的漲跌幅絕對值達 value %
+    'volume_spike': '成交量爆量',  # 單次輪詢期間的成交量達近期平均的 value 倍
+}
+
+
+class WatchlistStore:
+    """多用戶自選股與提醒條件，負責以下功能：
+    - 保存每位用戶的提醒條件（股票代號、條件種類、門檻值）
+    - 依股票代號彙整所有用戶的條件，輪詢時每檔股票只查詢一次
+    - 存成 JSON 檔並以檔案鎖保護，多個 worker 行程看到同一份自選股
+    """
+
+    def __init__(self, path, max_rules_per_user=20):
+        """
+        Args:
+            path (str): 自選股檔案路徑
+            max_rules_per_user (int): 每位用戶最多的提醒條件數
+        """
+        self.path = path
+        self.max_rules_per_user = max_rules_per_user
+        self._lock = threading.Lock()
+        self._rules = {}     # key: user_id, value: [條件 dict, ...]
+        self._mtime = None   # 最後讀取時的檔案修改時間，檔案被其他行程更新時重新讀取
+
+    @contextmanager
+    def _file_lock(self):
+        """跨行程的檔案鎖，避免多個行程同時改寫自選股檔案"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reload(self):
+        """檔案有更新時重新讀取（呼叫端需持有 _lock）"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._rules, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._rules = json.load(f)
+            self._mtime = mtime
+        except (OSError, ValueError) as e:
+            print(f"[WatchlistStore] 讀取自選股檔案失敗：{e}")
+
+    def _save(self):
+        """以原子操作寫回檔案（呼叫端需持有 _lock 與檔案鎖）"""
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._rules, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def add_rule(self, user_id, symbol, kind, value):
+        """新增提醒條件
+
+        Returns:
+            dict: 新增的條件，超過每位用戶上限時回傳 None
+
+        Raises:
+            ValueError: 條件種類不存在
+        """
+        if kind not in TRIGGER_KINDS:
+            raise ValueError(f"不支援的提醒條件：{kind}")
+        rule = {'id': uuid.uuid4().hex[:8], 'symbol': symbol, 'kind': kind, 'value': float(value)}
+        with self._lock, self._file_lock():
+            self._reload()
+            rules = self._rules.setdefault(user_id, [])
+            if len(rules) >= self.max_rules_per_user:
+                return None
+            rules.append(rule)
+            self._save()
+        return rule
+
+    def remove_symbol(self, user_id, symbol):
+        """移除用戶對指定股票的所有提醒條件，回傳移除的條件數"""
+        with self._lock, self._file_lock():
+            self._reload()
+            rules = self._rules.get(user_id, [])
+            kept = [rule for rule in rules if rule['symbol'] != symbol]
+            removed = len(rules) - len(kept)
+            if removed:
+                if kept:
+                    self._rules[user_id] = kept
+                else:
+                    self._rules.pop(user_id, None)
+                self._save()
+        return removed
+
+    def user_rules(self, user_id):
+        """取得用戶的所有提醒條件"""
+        with self._lock:
+            self._reload()
+            return [dict(rule) for rule in self._rules.get(user_id, [])]
+
+    def rules_by_symbol(self):
+        """依股票代號彙整所有用戶的條件
+
+        Returns:
+            dict: {股票代號: {(條件種類, 門檻值): [user_id, ...]}}，相同條件的用戶合併在一起
+        """
+        with self._lock:
+            self._reload()
+            grouped = {}
+            for user_id, rules in self._rules.items():
+                for rule in rules:
+                    key = (rule['kind'], rule['value'])
+                    grouped.setdefault(rule['symbol'], {}).setdefault(key, []).append(user_id)
+            return grouped
+
+    def stats(self):
+        """回傳自選股統計數據"""
+        with self._lock:
+            self._reload()
+            symbols = {rule['symbol'] for rules in self._rules.values() for rule in rules}
+            return {
+                'users': len(self._rules),
+                'rules': sum(len(rules) for rules in self._rules.values()),
+                'symbols': len(symbols),
+            }
+
+
+# 實例化自選股
+watchlist_store = WatchlistStore(
+    path=os.getenv('WATCHLIST_FILE', os.path.join('data', 'watchlist.json')),
+    max_rules_per_user=int(os.getenv('WATCHLIST_MAX_RULES_PER_USER', '20')),
+)
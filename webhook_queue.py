@@ -0,0 +1,167 @@
+import os
+import queue
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from linebot.v3.messaging import (
+    MessagingApi,         # 傳送訊息的 API
+    PushMessageRequest,   # 推播訊息請求
+    ApiException,         # LINE API 錯誤
+)
+
+# 載入 .env 檔案中的環境變數（worker 數量、佇列長度與 reply token 有效秒數設定）
+load_dotenv()
+
+
+# reply token 的有效時間（LINE 未保證確切秒數，超過這個時間直接改用 push）
+REPLY_TOKEN_TTL = float(os.getenv('REPLY_TOKEN_TTL', '50'))
+
+
+class WebhookQueue:
+    """webhook 事件處理佇列，負責以下功能：
+    - /callback 只驗證簽名並排入佇列就回傳 200，不等資料庫查詢、AI 回覆等耗時處理
+    - 背景 worker 取出 webhook 內容並交給 handler 處理
+    - 佇列已滿時由呼叫端直接處理（退回同步模式，不丟棄事件）
+    - 記錄排隊等待時間、處理時間與 reply token 過期改用 push 的次數
+    """
+
+    def __init__(self, max_workers=4, max_queue_size=200):
+        """
+        Args:
+            max_workers (int): 背景 worker 數量
+            max_queue_size (int): 佇列中等待處理的最大 webhook 數
+        """
+        self.max_workers = max_workers
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._counters = {
+            'accepted': 0, 'overflow': 0, 'processed': 0, 'failed': 0,
+            'reply_fallback_push': 0, 'queue_wait_seconds': 0.0, 'processing_seconds': 0.0, 'max_queue_wait_seconds': 0.0,
+        }
+        self._lock = threading.Lock()
+        self._workers = []
+        self._workers_pid = None
+
+    def _ensure_workers(self):
+        """確保背景 worker 已啟動（延遲到第一次排入事件才啟動，並處理 fork 後執行緒遺失的情況）"""
+        if self._workers_pid == os.getpid() and all(worker.is_alive() for worker in self._workers):
+            return
+        self._workers = []
+        for index in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'webhook-worker-{index}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self._workers_pid = os.getpid()
+
+    def submit(self, func):
+        """排入一個 webhook 處理函式（不帶參數）
+
+        Returns:
+            bool: 是否已排入佇列，佇列已滿時回傳 False，由呼叫端自行同步處理
+        """
+        with self._lock:
+            self._ensure_workers()
+            try:
+                self._queue.put_nowait((time.monotonic(), func))
+            except queue.Full:
+                self._counters['overflow'] += 1
+                return False
+            self._counters['accepted'] += 1
+            return True
+
+    def _worker_loop(self):
+        """背景 worker：從佇列取出 webhook 並處理"""
+        while True:
+            queued_at, func = self._queue.get()
+            started = time.monotonic()
+            try:
+                func()
+            except Exception as e:
+                print("[WebhookQueue] 處理 webhook 事件失敗：", e)
+                status = 'failed'
+            else:
+                status = 'processed'
+            finally:
+                self._queue.task_done()
+
+            with self._lock:
+                wait = started - queued_at
+                self._counters[status] += 1
+                self._counters['queue_wait_seconds'] += wait
+                self._counters['max_queue_wait_seconds'] = max(self._counters['max_queue_wait_seconds'], wait)
+                self._counters['processing_seconds'] += time.monotonic() - started
+
+    def count_reply_fallback(self):
+        with self._lock:
+            self._counters['reply_fallback_push'] += 1
+
+    def stats(self):
+        """回傳佇列統計數據"""
+        with self._lock:
+            done = self._counters['processed'] + self._counters['failed']
+            return {
+                'queued': self._queue.qsize(),
+                'max_queue_size': self._queue.maxsize,
+                'max_workers': self.max_workers,
+                'avg_queue_wait_seconds': self._counters['queue_wait_seconds'] / done if done else 0.0,
+                'avg_processing_seconds': self._counters['processing_seconds'] / done if done else 0.0,
+                **self._counters,
+            }
+
+
+# 實例化 webhook 事件處理佇列
+webhook_queue = WebhookQueue(
+    max_workers=int(os.getenv('WEBHOOK_MAX_WORKERS', '4')),
+    max_queue_size=int(os.getenv('WEBHOOK_MAX_QUEUE_SIZE', '200')),
+)
+
+
+def push_target(event):
+    """事件來源的推播對象（群組、聊天室或用戶）"""
+    source = getattr(event, 'source', None)
+    for attribute in ('group_id', 'room_id', 'user_id'):
+        target = getattr(source, attribute, None)
+        if target:
+            return target
+    return None
+
+
+class ReplyFallbackMessagingApi(MessagingApi):
+    """reply token 已過期時自動改用 push 的 MessagingApi
+
+    事件在佇列中等待過久時 reply token 可能失效，這時改推播給事件來源，
+    handler 仍然照常呼叫 reply_message，不需要知道事件是同步還是背景處理。
+    """
+
+    def __init__(self, api_client, event):
+        """
+        Args:
+            api_client (ApiClient): LINE API 客戶端
+            event (Event): 目前處理的 webhook 事件（取得事件時間與推播對象）
+        """
+        super().__init__(api_client)
+        self._event = event
+
+    def _push_instead(self, reply_message_request, **kwargs):
+        webhook_queue.count_reply_fallback()
+        return self.push_message(
+            PushMessageRequest(to=push_target(self._event), messages=reply_message_request.messages),
+            **kwargs
+        )
+
+    def reply_message(self, reply_message_request, **kwargs):
+        if push_target(self._event) is None:
+            return super().reply_message(reply_message_request, **kwargs)
+
+        # 事件已經超過 reply token 的有效時間，直接推播
+        if time.time() - self._event.timestamp / 1000 > REPLY_TOKEN_TTL:
+            return self._push_instead(reply_message_request, **kwargs)
+
+        try:
+            return super().reply_message(reply_message_request, **kwargs)
+        except ApiException as e:
+            # reply token 無效或已使用（400 Invalid reply token）時改用 push
+            if e.status == 400 and 'reply token' in str(e.body).lower():
+                return self._push_instead(reply_message_request, **kwargs)
+            raise